@@ -14,6 +14,11 @@ setup(name="tap-pipedrive",
           "requests==2.29.0",
           "singer-python==5.12.1",
       ],
+      extras_require={
+          "orjson": ["orjson"],
+          "async": ["aiohttp"],
+          "brotli": ["brotli"],
+      },
       entry_points="""
           [console_scripts]
           tap-pipedrive=tap_pipedrive.cli:main
@@ -0,0 +1,283 @@
+import asyncio
+import math
+import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import simplejson
+import singer
+from requests.structures import CaseInsensitiveDict
+
+from tap_pipedrive.exceptions import (PipedriveInternalServiceError, PipedriveServiceUnavailableError,
+                                      PipedriveTooManyRequestsInSecondError)
+from tap_pipedrive.page import PipedrivePage, decode_body
+from tap_pipedrive.tap import raise_for_error, is_not_status_code_fn
+from tap_pipedrive.transport import DEFAULT_POOL_SIZE, accept_encoding, get_timeout, make_decoder
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+logger = singer.get_logger()
+
+# retried like requests' ConnectionError and Timeout by the sync engine
+RETRIED_ERRORS = (PipedriveInternalServiceError, simplejson.scanner.JSONDecodeError, asyncio.TimeoutError) + \
+    ((aiohttp.ClientConnectionError,) if aiohttp else ())
+
+
+class AsyncEngine(object):
+    """
+    Syncs streams with aiohttp on one event loop, selected with engine 'async'.
+
+    Pagination, the listing and sub-resources of deal streams and the *Fields lookups of dynamic
+    streams are coroutines sharing a connection pool of http_pool_size and the tap's
+    RateGovernor. Pages are processed by one worker thread in the order the sync engine
+    processes them, with the tap's own process_page, so both engines write the same messages
+    while the loop keeps the next requests going.
+    """
+
+    def __init__(self, tap):
+        if aiohttp is None:
+            raise ValueError("engine 'async' requires the aiohttp package, install tap-pipedrive[async]")
+        self.tap = tap
+        self.config = tap.config
+        self.session = None
+        self.processor = None
+        self.token_lock = None
+
+    def sync_streams(self, streams, catalog, workers=1):
+        asyncio.run(self.run(streams, catalog, workers))
+
+    async def run(self, streams, catalog, workers):
+        connect_timeout, read_timeout = get_timeout(self.config)
+        connector = aiohttp.TCPConnector(limit=int(self.config.get('http_pool_size', DEFAULT_POOL_SIZE)))
+        timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.token_lock = asyncio.Lock()
+        with ThreadPoolExecutor(max_workers=1) as self.processor:
+            # bodies are inflated in send, which counts their bytes on the wire
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout, auto_decompress=False,
+                                             headers={'Accept-Encoding': accept_encoding(self.config)}) as self.session:
+                if workers > 1:
+                    # the semaphore lets streams start in their usual order, see sync_streams_concurrently
+                    slots = asyncio.Semaphore(workers)
+
+                    async def sync_stream(stream):
+                        async with slots:
+                            await self.sync_stream(stream, catalog)
+
+                    await asyncio.gather(*(sync_stream(stream) for stream in streams))
+                else:
+                    for stream in streams:
+                        await self.sync_stream(stream, catalog)
+
+    async def process(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.processor, function, *args)
+
+    async def sync_stream(self, stream, catalog):
+        stream.tap = self.tap
+        await self.load_schema(stream)
+        row_plan = await self.process(self.tap.start_stream, stream, catalog)
+
+        if stream.id_list:
+            await self.sync_deal_stream(stream, row_plan)
+        else:
+            await self.paginate(stream, row_plan)
+
+        await self.process(self.tap.finish_stream, stream)
+
+    async def paginate(self, stream, row_plan):
+        # pages up to prefetch_depth (at least one) are fetched ahead of the page being processed
+        pages = asyncio.Queue(maxsize=max(1, int(self.config.get('prefetch_depth', 1))))
+
+        async def produce():
+            try:
+                start = stream.start
+                more_items_in_collection = stream.more_items_in_collection
+                while more_items_in_collection:
+                    page = await self.fetch_stream_page(stream, start=start)
+                    await pages.put(page)
+
+                    more, next_start = stream.read_pagination(page)
+                    if more is not None:
+                        more_items_in_collection = more
+                    if next_start is not None:
+                        start = next_start
+                await pages.put(None)
+            except Exception as e:
+                await pages.put(e)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                page = await pages.get()
+                if page is None:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                await self.process(self.process_stream_page, stream, row_plan, page)
+        finally:
+            producer.cancel()
+
+    def process_stream_page(self, stream, row_plan, page):
+        stream.paginate(page)
+        self.tap.process_page(stream, row_plan, page)
+        self.tap.checkpoint(stream)
+
+    async def sync_deal_stream(self, stream, row_plan):
+        workers = int(self.config.get('deal_concurrency', self.config.get('http_pool_size', DEFAULT_POOL_SIZE)))
+        in_flight = deque()
+        try:
+            async for deal_id in self.get_deal_ids(stream):
+                in_flight.append((deal_id, asyncio.ensure_future(self.fetch_deal_pages(stream, deal_id))))
+                if len(in_flight) >= workers:
+                    deal_id, pages = in_flight.popleft()
+                    await self.process(self.tap.process_deal_pages, stream, row_plan, deal_id, await pages)
+
+            while in_flight:
+                deal_id, pages = in_flight.popleft()
+                await self.process(self.tap.process_deal_pages, stream, row_plan, deal_id, await pages)
+        finally:
+            for _, task in in_flight:
+                task.cancel()
+
+    async def get_deal_ids(self, stream):
+        stream.start_deal_walk()
+        endpoint, params = stream.deal_listing()
+        while stream.more_items_in_collection:
+            page = await self.fetch_stream_page(stream, endpoint=endpoint, params=params)
+            for deal_id in stream.deal_ids_on_page(page):
+                yield deal_id
+
+    async def fetch_deal_pages(self, stream, deal_id):
+        pages = []
+        start = 0
+        while True:
+            page = await self.fetch_stream_page(stream, endpoint=stream.deal_endpoint(deal_id), start=start)
+            pages.append(page)
+
+            more_items_in_collection, next_start = stream.read_pagination(page)
+            if not more_items_in_collection or next_start is None:
+                return pages
+            start = next_start
+
+    async def load_schema(self, stream):
+        """
+        Fetches the field definitions of a dynamic stream with
+        DynamicTypingRecentsStream.get_field_definitions, which reads and writes the fields cache
+        on a thread of the default executor while its requests are sent from the loop
+        """
+        if not getattr(stream, 'fields_endpoint', None) or stream.schema_cache:
+            return
+
+        loop = asyncio.get_running_loop()
+
+        def get_fields(limit, start):
+            request = self.execute_request(stream.fields_endpoint, {'limit': limit, 'start': start})
+            return asyncio.run_coroutine_threadsafe(request, loop).result()
+
+        fields = await loop.run_in_executor(None, stream.get_field_definitions, get_fields)
+        stream.field_definitions = fields
+        stream.schema_cache = stream.build_schema(fields)
+
+    async def fetch_stream_page(self, stream, endpoint=None, start=None, params=None):
+        with singer.metrics.http_request_timer(stream.schema) as timer:
+            page = await self.execute_stream_request(stream, endpoint=endpoint, start=start, extra_params=params)
+            timer.tags[singer.metrics.Tag.http_status_code] = page.status_code
+
+        self.tap.validate_response(page)
+        return page
+
+    async def execute_stream_request(self, stream, endpoint=None, start=None, extra_params=None):
+        loop = asyncio.get_running_loop()
+        while True:
+            params = self.tap.stream_request_params(stream, start, extra_params)
+            started = loop.time()
+            try:
+                page = await self.execute_request(endpoint or stream.endpoint, params=params, meter=stream.transfer,
+                                                  shrinkable=stream.page_sizer.can_shrink())
+            except (asyncio.TimeoutError, PipedriveInternalServiceError, PipedriveServiceUnavailableError):
+                # an adaptive page size retries with a smaller page, as PipedriveTap.execute_stream_request
+                if not stream.page_sizer.shrink():
+                    raise
+                logger.info('Retrying {} with {} items per page'.format(stream.schema, stream.page_sizer.size))
+                continue
+            stream.page_sizer.observe(loop.time() - started, page.body_size)
+            return page
+
+    async def execute_request(self, endpoint, params=None, meter=None, shrinkable=False):
+        """
+        The retries of PipedriveTap.execute_request's backoff decorators, which the pinned backoff
+        can't apply to coroutines: 5 tries with exponential backoff for 500s, undecodable bodies,
+        connection errors and timeouts, 3 for a 429 of the per second limit, waiting out its
+        reset. The timeouts and 500s of a shrinkable page are left to execute_stream_request.
+        """
+        failures = 0
+        throttled = 0
+        while True:
+            try:
+                return await self.send_request(endpoint, params, meter)
+            except PipedriveTooManyRequestsInSecondError as e:
+                throttled += 1
+                if throttled >= 3 or is_not_status_code_fn([429])(e):
+                    raise
+                seconds = math.floor(float(e.response.headers.get('X-RateLimit-Reset')))
+                logger.info("API rate limit exceeded -- sleeping for %s seconds", seconds)
+            except RETRIED_ERRORS as e:
+                # aiohttp's read timeouts are connection errors too
+                if shrinkable and isinstance(e, (PipedriveInternalServiceError, asyncio.TimeoutError)):
+                    raise
+                failures += 1
+                if failures >= 5:
+                    raise
+                # backoff.expo with full jitter
+                seconds = random.uniform(0, 2 ** (failures - 1))
+            await asyncio.sleep(seconds)
+
+    async def get_token(self):
+        """
+        The tap's access token. PipedriveTap.get_token POSTs to the OAuth server when the token
+        is about to expire, so it runs off the loop, one call at a time.
+        """
+        async with self.token_lock:
+            return await asyncio.get_running_loop().run_in_executor(None, self.tap.get_token)
+
+    async def send_request(self, endpoint, params=None, meter=None):
+        headers = {"Authorization": f"Bearer {await self.get_token()}"}
+        url = "{}/{}".format(self.tap.get_base_url(), endpoint)
+        params = {key: value for key, value in (params or {}).items() if value is not None}
+        logger.debug('Firing request at {} with params: {}'.format(url, params))
+
+        governor = self.tap.rate_governor
+        try:
+            # a task cancelled while it waits for its slot gives the slot back too
+            await asyncio.sleep(governor.reserve())
+            response = await self.send(url, headers, params, meter)
+            governor.update(response.headers, response.status_code)
+        finally:
+            governor.release()
+
+        if response.status_code == 200:
+            return PipedrivePage(response, decode_body(response, self.tap.json_backend))
+        raise_for_error(response)
+
+    async def send(self, url, headers, params, meter=None):
+        """
+        GETs url and returns the answer as a requests.Response, which the error handling and
+        PipedrivePage of the sync engine understand
+        """
+        async with self.session.get(url, headers=headers, params=params) as answer:
+            wire = await answer.read()
+            decoder = make_decoder(answer.headers.get('Content-Encoding'))
+            content = decoder.decompress(wire) + decoder.flush()
+            if meter is not None:
+                meter.add(len(wire), len(content))
+            response = requests.Response()
+            response.status_code = answer.status
+            response.reason = answer.reason
+            response.url = str(answer.url)
+            response.headers = CaseInsensitiveDict(answer.headers)
+            response._content = content
+            return response
@@ -0,0 +1,101 @@
+import json
+import os
+import sqlite3
+import threading
+
+import singer
+
+
+logger = singer.get_logger()
+
+# sqlite's default limit of host parameters in a statement is 999 before 3.32
+LOOKUP_CHUNK = 500
+
+
+def fingerprint(deal):
+    """
+    What changes on a deal when its flow or products do, None for a deal without an update_time
+    which can't tell
+    """
+    if deal.get('update_time') is None:
+        return None
+    return json.dumps([deal.get('products_count'), deal.get('stage_change_time'), deal.get('update_time')])
+
+
+class DealIndex(object):
+    """
+    Fingerprints of the deals whose sub-resources (flow, products) a stream synced, kept in a
+    SQLite file between runs. A deal whose fingerprint hasn't moved since is skipped.
+
+    Entries are staged while a stream syncs and written by commit(stream) once the STATE covering
+    the records is out, so the index never claims more than the bookmark does. The file can be
+    deleted at any time, the next run syncs every selected deal again and rebuilds it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.staged = {}
+        try:
+            self.connection = self.connect()
+        except sqlite3.DatabaseError as e:
+            logger.warning('Rebuilding deal index {}: {}'.format(path, e))
+            os.remove(path)
+            self.connection = self.connect()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        None unless deal_index_path is configured
+        """
+        path = config.get('deal_index_path')
+        if not path:
+            return None
+        return cls(path)
+
+    def connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # the walk, the processing of pages and finish_stream may run on different threads
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute('CREATE TABLE IF NOT EXISTS deal_fingerprints ('
+                           'stream TEXT NOT NULL, deal_id INTEGER NOT NULL, fingerprint TEXT NOT NULL, '
+                           'cursor INTEGER NOT NULL, PRIMARY KEY (stream, deal_id))')
+        connection.commit()
+        return connection
+
+    def fingerprints(self, stream, deal_ids):
+        """
+        deal id -> fingerprint committed for the stream, for those of deal_ids it synced
+        """
+        found = {}
+        deal_ids = list(deal_ids)
+        with self.lock:
+            for i in range(0, len(deal_ids), LOOKUP_CHUNK):
+                chunk = deal_ids[i:i + LOOKUP_CHUNK]
+                rows = self.connection.execute(
+                    'SELECT deal_id, fingerprint FROM deal_fingerprints WHERE stream = ? AND deal_id IN ({})'.format(
+                        ', '.join('?' * len(chunk))),
+                    [stream] + chunk)
+                found.update(rows)
+        return found
+
+    def stage(self, stream, deal_id, deal_fingerprint, cursor):
+        with self.lock:
+            self.staged.setdefault(stream, {})[deal_id] = (deal_fingerprint, cursor)
+
+    def commit(self, stream):
+        with self.lock:
+            staged = self.staged.pop(stream, {})
+            if not staged:
+                return
+            with self.connection:
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO deal_fingerprints (stream, deal_id, fingerprint, cursor) VALUES (?, ?, ?, ?)',
+                    [(stream, deal_id, deal_fingerprint, cursor)
+                     for deal_id, (deal_fingerprint, cursor) in staged.items()])
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
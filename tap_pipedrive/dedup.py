@@ -0,0 +1,58 @@
+from collections import deque
+
+
+# integer ids above this go to the hash set, capping the bitmap at 32MB
+BITMAP_MAX_ID = 2 ** 28
+
+
+class DedupIndex(object):
+    """
+    Ids a stream already processed during the sync, to skip rows repeated across pages.
+
+    bitmap=True keeps non negative integer ids as one bit each, which for Pipedrive's sequential ids
+    is far smaller than a set. max_size bounds the set to the most recently seen ids.
+    """
+
+    def __init__(self, bitmap=False, max_size=None):
+        self.max_size = max_size
+        self.skipped = 0
+        self.seen = set()
+        self.order = deque() if max_size else None
+        self.bitmap = bytearray() if bitmap else None
+
+    def add(self, value):
+        """
+        Returns True when the id is new, False (and counts it as skipped) for a duplicate
+        """
+        if self.bitmap is not None and type(value) is int and 0 <= value < BITMAP_MAX_ID:
+            byte, bit = value >> 3, 1 << (value & 7)
+            if byte >= len(self.bitmap):
+                self.bitmap.extend(bytes(max(byte + 1, 2 * len(self.bitmap)) - len(self.bitmap)))
+            elif self.bitmap[byte] & bit:
+                self.skipped += 1
+                return False
+            self.bitmap[byte] |= bit
+            return True
+
+        if value in self.seen:
+            self.skipped += 1
+            return False
+
+        self.seen.add(value)
+        if self.order is not None:
+            self.order.append(value)
+            if len(self.order) > self.max_size:
+                self.seen.discard(self.order.popleft())
+        return True
+
+    def __contains__(self, value):
+        if self.bitmap is not None and type(value) is int and 0 <= value < BITMAP_MAX_ID:
+            byte = value >> 3
+            return byte < len(self.bitmap) and bool(self.bitmap[byte] & (1 << (value & 7)))
+        return value in self.seen
+
+    @classmethod
+    def from_config(cls, config):
+        max_size = config.get('dedup_max_ids')
+        return cls(bitmap=config.get('dedup_index', 'set') == 'bitmap',
+                   max_size=int(max_size) if max_size else None)
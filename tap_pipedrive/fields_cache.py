@@ -0,0 +1,99 @@
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import singer
+
+
+logger = singer.get_logger()
+
+DEFAULT_TTL = 3600
+DEFAULT_MAX_AGE = 86400
+
+
+class FieldsCache(object):
+    """
+    Field definitions of the dynamic streams (dealFields, personFields, ...) kept on disk between
+    runs, one JSON file per account and fields endpoint.
+
+    An entry checked less than ttl seconds ago is used without asking the API. An older one is
+    revalidated by the stream, see DynamicTypingRecentsStream.fields_unchanged, and refetched
+    entirely once it is max_age seconds old. The revalidation only sees fields added or
+    deleted and changes of the last field: a field renamed or retyped in the middle of the list
+    is picked up within max_age, which is the staleness the cache accepts for one request.
+    """
+
+    def __init__(self, directory, ttl=DEFAULT_TTL, max_age=DEFAULT_MAX_AGE):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_age = max_age
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        None unless fields_cache_dir is configured
+        """
+        directory = config.get('fields_cache_dir')
+        if not directory:
+            return None
+        return cls(directory,
+                   ttl=float(config.get('fields_cache_ttl', DEFAULT_TTL)),
+                   max_age=float(config.get('fields_cache_max_age', DEFAULT_MAX_AGE)))
+
+    def path(self, account, endpoint):
+        digest = hashlib.sha1('{}\n{}'.format(account, endpoint).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, '{}-{}.json'.format(endpoint, digest[:16]))
+
+    def load(self, account, endpoint):
+        """
+        The cached entry, None when there is none, it can't be read or it is older than max_age
+        """
+        try:
+            with open(self.path(account, endpoint)) as cache_file:
+                entry = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+        if entry.get('account') != account or entry.get('endpoint') != endpoint or not isinstance(entry.get('fields'), list):
+            return None
+        if time.time() - entry.get('fetched_at', 0) >= self.max_age:
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry.get('checked_at', 0) < self.ttl
+
+    def store(self, account, endpoint, fields, fetched_at=None):
+        now = time.time()
+        entry = {
+            'account': account,
+            'endpoint': endpoint,
+            'fetched_at': now if fetched_at is None else fetched_at,
+            'checked_at': now,
+            'fields': fields,
+        }
+        temp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # written aside and renamed so a concurrent run never reads half a file
+            handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(handle, 'w') as cache_file:
+                json.dump(entry, cache_file)
+            os.replace(temp_path, self.path(account, endpoint))
+            temp_path = None
+        except OSError as e:
+            logger.warning('Could not write field cache for {}: {}'.format(endpoint, e))
+        finally:
+            if temp_path is not None:
+                with contextlib.suppress(OSError):
+                    os.unlink(temp_path)
+        return entry
+
+    def touch(self, entry):
+        """
+        Marks a revalidated entry as checked now
+        """
+        return self.store(entry['account'], entry['endpoint'], entry['fields'], fetched_at=entry['fetched_at'])
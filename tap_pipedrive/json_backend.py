@@ -0,0 +1,82 @@
+import json
+
+import simplejson
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+BACKENDS = ('auto', 'orjson', 'simplejson')
+
+# stdlib's C encoder writes the same bytes as singer's simplejson.dumps for JSON native types,
+# anything else (e.g. Decimal) falls back to simplejson
+_json_encoder = json.JSONEncoder()
+_simplejson_encoder = simplejson.JSONEncoder(use_decimal=True)
+
+# orjson reads integers beyond 64 bits as floats
+INT64_BOUND = 2.0 ** 63
+
+
+def has_int64_overflow(payload):
+    """
+    True when the decoded payload has a float too large for a 64 bit integer, which orjson may
+    have read from an integer literal
+    """
+    stack = [payload]
+    while stack:
+        node = stack.pop()
+        for value in (node.values() if type(node) is dict else node):
+            value_type = type(value)
+            if value_type is dict or value_type is list:
+                stack.append(value)
+            elif value_type is float and not -INT64_BOUND < value < INT64_BOUND:
+                return True
+    return False
+
+
+class JsonBackend(object):
+    """
+    Decodes API pages and encodes Singer RECORD messages.
+
+    'auto' decodes with orjson when it is installed and encodes records byte for byte like
+    singer.write_record. 'orjson' also encodes with orjson, which drops the whitespace after
+    separators and writes non ASCII characters unescaped. 'simplejson' keeps singer's own path.
+    """
+
+    def __init__(self, name='auto'):
+        if name not in BACKENDS:
+            raise ValueError("Unknown json_backend '{}', expected one of {}".format(name, ', '.join(BACKENDS)))
+        if name == 'orjson' and orjson is None:
+            raise ValueError("json_backend 'orjson' requires the orjson package, install tap-pipedrive[orjson]")
+
+        self.name = name
+        self.fast_loads = orjson is not None and name != 'simplejson'
+        self.fast_dumps = name == 'orjson'
+
+    def loads(self, content):
+        if self.fast_loads:
+            try:
+                payload = orjson.loads(content)
+                if type(payload) not in (dict, list) or not has_int64_overflow(payload):
+                    return payload
+            except orjson.JSONDecodeError:
+                # NaN, lone surrogates, ... are left to simplejson, which raises its own
+                # JSONDecodeError for bodies that really are invalid
+                pass
+        return simplejson.loads(content)
+
+    def format_record(self, stream_name, record):
+        message = {'type': 'RECORD', 'stream': stream_name, 'record': record}
+        if self.fast_dumps:
+            try:
+                return orjson.dumps(message).decode('utf-8')
+            except TypeError:
+                pass
+        elif self.name == 'auto':
+            try:
+                return _json_encoder.encode(message)
+            except TypeError:
+                pass
+        return _simplejson_encoder.encode(message)
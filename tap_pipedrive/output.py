@@ -0,0 +1,54 @@
+import sys
+import threading
+
+import singer
+
+
+DEFAULT_BUFFER_SIZE = 65536
+
+
+class MessageWriter(object):
+    """
+    Writes Singer messages to stdout, RECORDs are serialized as they come and written in chunks of
+    about buffer_size characters. SCHEMA and STATE messages flush the pending records first so a
+    target never sees a state before the records it covers.
+    """
+
+    def __init__(self, json_backend, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.json_backend = json_backend
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffered = 0
+        self.lock = threading.Lock()
+
+    def write_record(self, stream_name, record):
+        line = self.json_backend.format_record(stream_name, record)
+        with self.lock:
+            self.buffer.append(line)
+            self.buffered += len(line)
+            if self.buffered >= self.buffer_size:
+                self._flush()
+
+    def write_schema(self, stream_name, schema, key_properties):
+        self.write_message(singer.SchemaMessage(stream=stream_name, schema=schema, key_properties=key_properties))
+
+    def write_state(self, state):
+        self.write_message(singer.StateMessage(value=state))
+
+    def write_message(self, message):
+        line = singer.format_message(message)
+        with self.lock:
+            self.buffer.append(line)
+            self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.buffer:
+            self.buffer.append('')
+            sys.stdout.write('\n'.join(self.buffer))
+            sys.stdout.flush()
+            self.buffer = []
+            self.buffered = 0
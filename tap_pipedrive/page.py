@@ -0,0 +1,244 @@
+import codecs
+import re
+import threading
+from collections import deque
+
+import simplejson
+
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_decoder = simplejson.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_END = object()
+
+
+def decode_body(response, json_backend):
+    return json_backend.loads(response.content)
+
+
+class PipedrivePage(object):
+    """
+    A successful API response with its body decoded once, handed to every step that needs the
+    payload, the pagination or the headers of the page.
+    """
+
+    def __init__(self, response, payload):
+        self.response = response
+        self.payload = payload
+        self.status_code = response.status_code
+        self.headers = response.headers
+
+    @property
+    def data(self):
+        return self.payload.get('data')
+
+    @property
+    def pagination(self):
+        """
+        additional_data.pagination of the page, None when the endpoint isn't paginated
+        """
+        additional_data = self.payload.get('additional_data')
+        if isinstance(additional_data, dict):
+            return additional_data.get('pagination')
+        return None
+
+    @property
+    def succeeded(self):
+        return bool(self.payload.get('success')) and 'data' in self.payload
+
+    @property
+    def body_size(self):
+        return len(self.response.content)
+
+    @property
+    def row_count(self):
+        return len(self.data or [])
+
+    def rows(self):
+        return iter(self.data or [])
+
+    def json(self):
+        # same interface as requests.Response for callers written against raw responses
+        return self.payload
+
+
+class StreamingPage(object):
+    """
+    A successful API response whose body is decoded while it is read. The rows of `data` are
+    yielded one at a time by rows(), so a page never is in memory as a whole, the other members
+    of the payload (success, additional_data, ...) are kept once read.
+
+    Pipedrive writes additional_data after data: asking for the pagination, data or payload
+    before the rows were read decodes the rest of the body and keeps the rows until rows() is
+    called. The rows can be read once.
+    """
+
+    def __init__(self, response, chunks=None, chunk_size=STREAM_CHUNK_SIZE):
+        self.response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.members = {}
+        self.row_count = 0
+        self.bytes_read = 0
+        self.lock = threading.Lock()
+
+        # the decoded body in chunks, BodyReader.chunks() for the tap's requests
+        self._chunks = iter(chunks if chunks is not None else response.iter_content(chunk_size))
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._exhausted = False
+        self._in_data = False
+        self._has_data = False
+        self._done = False
+        self._kept = deque()
+        self._streamed = False
+        # decodes up to the first row, a body that isn't JSON fails here like decode_body does
+        if self._skip_whitespace() != '{':
+            self._fail('Expecting object')
+        self._pos += 1
+        self._read_members()
+
+    @property
+    def succeeded(self):
+        return bool(self.members.get('success')) and self._has_data
+
+    @property
+    def body_size(self):
+        # decoded so far, the page size hardly matters for memory while streaming
+        return self.bytes_read
+
+    @property
+    def pagination(self):
+        self._read_all()
+        additional_data = self.members.get('additional_data')
+        if isinstance(additional_data, dict):
+            return additional_data.get('pagination')
+        return None
+
+    @property
+    def data(self):
+        self._read_all()
+        if self._streamed:
+            raise RuntimeError('The rows of a streaming page were already read')
+        return list(self._kept) if self._has_data and 'data' not in self.members else self.members.get('data')
+
+    @property
+    def payload(self):
+        return dict(self.members, data=self.data)
+
+    def json(self):
+        return self.payload
+
+    def rows(self):
+        if 'data' in self.members:
+            # null or an object rather than a list of rows
+            for row in self.members['data'] or []:
+                yield row
+            return
+        while True:
+            with self.lock:
+                if self._kept:
+                    row = self._kept.popleft()
+                elif self._in_data:
+                    row = self._next_row()
+                else:
+                    self._streamed = True
+                    self._read_members()
+                    return
+                self._streamed = True
+            if row is not _END:
+                yield row
+
+    def _read_all(self):
+        with self.lock:
+            while self._in_data:
+                row = self._next_row()
+                if row is not _END:
+                    self._kept.append(row)
+            self._read_members()
+
+    def _next_row(self):
+        # the next row of the data array, _END once it is closed
+        char = self._skip_whitespace()
+        if char == ']':
+            self._pos += 1
+            self._in_data = False
+            return _END
+        if char == ',':
+            self._pos += 1
+        row = self._decode_value()
+        self.row_count += 1
+        return row
+
+    def _read_members(self):
+        # top level members up to the data array or the end of the payload
+        if self._done:
+            return
+        while not self._in_data:
+            char = self._skip_whitespace()
+            if char == ',':
+                self._pos += 1
+                char = self._skip_whitespace()
+            if char == '}':
+                self._pos += 1
+                self._done = True
+                self._drop_consumed()
+                return
+            key = self._decode_value()
+            if self._skip_whitespace() != ':':
+                self._fail("Expecting ':' delimiter")
+            self._pos += 1
+            if key == 'data' and self._skip_whitespace() == '[':
+                self._pos += 1
+                self._in_data = self._has_data = True
+            else:
+                self.members[key] = self._decode_value()
+                self._has_data = self._has_data or key == 'data'
+
+    def _decode_value(self):
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._pos)
+                # a number at the end of the buffer may go on in the next chunk
+                if end < len(self._buffer) or self._exhausted:
+                    self._pos = end
+                    self._drop_consumed()
+                    return value
+            except simplejson.JSONDecodeError:
+                if self._exhausted:
+                    raise
+            # reads at least as much again as is buffered, a large row is decoded a bounded
+            # number of times
+            self._read(len(self._buffer) - self._pos)
+
+    def _skip_whitespace(self):
+        while True:
+            match = _WHITESPACE.match(self._buffer, self._pos)
+            self._pos = match.end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if self._exhausted:
+                self._fail('Unexpected end of body')
+            self._read(1)
+
+    def _read(self, at_least):
+        wanted = len(self._buffer) - self._pos + max(1, at_least)
+        while not self._exhausted and len(self._buffer) - self._pos < wanted:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._exhausted = True
+                self._buffer += self._text.decode(b'', final=True)
+                self.response.close()
+            else:
+                self.bytes_read += len(chunk)
+                self._buffer += self._text.decode(chunk)
+
+    def _drop_consumed(self):
+        if self._pos > len(self._buffer) // 2:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+
+    def _fail(self, message):
+        raise simplejson.JSONDecodeError(message, self._buffer, self._pos)
@@ -0,0 +1,71 @@
+import threading
+
+import singer
+
+
+logger = singer.get_logger()
+
+# the largest limit Pipedrive's list endpoints accept
+MAX_PAGE_SIZE = 500
+MIN_PAGE_SIZE = 25
+DEFAULT_TARGET_SECONDS = 5.0
+# decoded pages of this size stay cheap to hold while records are written
+MAX_PAGE_BYTES = 16 * 1024 * 1024
+
+
+class PageSizer(object):
+    """
+    The `limit` a stream asks for. Fixed unless the configured page size is 'adaptive': then the
+    limit doubles while a page comes back in under half of target_seconds and half of
+    MAX_PAGE_BYTES, halves when a page takes longer or is bigger than that, and halves before a
+    request that timed out or failed with a 5xx is tried again.
+    """
+
+    def __init__(self, size, adaptive=False, target_seconds=DEFAULT_TARGET_SECONDS):
+        self.size = max(1, min(int(size), MAX_PAGE_SIZE))
+        self.adaptive = adaptive
+        self.target_seconds = target_seconds
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, stream):
+        """
+        page_sizes[stream.schema], else page_size, else the stream's own limit. Either is a number
+        or 'adaptive', which starts from the stream's limit.
+        """
+        setting = (config.get('page_sizes') or {}).get(stream.schema, config.get('page_size', stream.limit))
+        if setting == 'adaptive':
+            return cls(stream.limit, adaptive=True,
+                       target_seconds=float(config.get('page_size_target_seconds', DEFAULT_TARGET_SECONDS)))
+        return cls(setting)
+
+    def observe(self, seconds, size_bytes):
+        """
+        Adapts the limit to the latency and body size of a page fetched with it
+        """
+        if not self.adaptive:
+            return
+        with self.lock:
+            if seconds > self.target_seconds or size_bytes > MAX_PAGE_BYTES:
+                self._resize(self.size // 2)
+            elif seconds * 2 <= self.target_seconds and size_bytes * 2 <= MAX_PAGE_BYTES:
+                self._resize(self.size * 2)
+
+    def can_shrink(self):
+        return self.adaptive and self.size > MIN_PAGE_SIZE
+
+    def shrink(self):
+        """
+        Halves the limit after a failed request, False when there is nothing to shrink
+        """
+        with self.lock:
+            if not self.can_shrink():
+                return False
+            self._resize(self.size // 2)
+            return True
+
+    def _resize(self, size):
+        size = max(MIN_PAGE_SIZE, min(size, MAX_PAGE_SIZE))
+        if size != self.size:
+            logger.debug('Page size {} -> {}'.format(self.size, size))
+            self.size = size
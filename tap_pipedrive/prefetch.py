@@ -0,0 +1,51 @@
+import queue
+import threading
+
+
+_DONE = object()
+
+
+class _Failure(object):
+    def __init__(self, error):
+        self.error = error
+
+
+def prefetch(iterable, depth):
+    """
+    Yields the items of iterable in order while a background thread produces up to `depth` items
+    ahead of the one being consumed. An exception of the producer is raised where the item it
+    failed to produce would have been yielded. Closing the generator stops the producer.
+    """
+    items = queue.Queue()
+    slots = threading.Semaphore(depth)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            iterator = iter(iterable)
+            while True:
+                slots.acquire()
+                if stop.is_set():
+                    return
+                item = next(iterator, _DONE)
+                items.put(item)
+                if item is _DONE:
+                    return
+        except BaseException as e:
+            items.put(_Failure(e))
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            slots.release()
+            yield item
+    finally:
+        stop.set()
+        slots.release()
+        producer.join()
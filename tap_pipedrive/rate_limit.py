@@ -0,0 +1,166 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import singer
+
+
+logger = singer.get_logger()
+
+# requests kept in reserve below the budget the API reports, covers other clients of the account
+DEFAULT_HEADROOM = 2
+
+
+def _header(headers, name):
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateGovernor(object):
+    """
+    Paces the requests of every thread of the tap to the account's rate limit.
+
+    Pipedrive reports the budget of the current window in X-RateLimit-Limit, -Remaining and
+    -Reset (seconds until the window starts over). The governor learns the window from the
+    largest Reset of the current window and hands out requests as a token bucket refilled at
+    (limit - headroom) / window per second, holding at most `headroom` tokens, so no window
+    ever sees more than `limit` requests. Every response also corrects the bucket down to what
+    the API says is left, minus the requests still in flight, which keeps other clients of the
+    account in check. When nothing is left every thread waits for the window to reset.
+
+    Until the first response with rate limit headers requests aren't paced.
+    """
+
+    def __init__(self, headroom=DEFAULT_HEADROOM, clock=time.monotonic, sleep=time.sleep):
+        self.headroom = headroom
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+
+        self.limit = None
+        self.remaining = None
+        self.window = None
+        self.window_ends = 0.0
+        self.rate = None
+        self.capacity = max(1.0, float(headroom))
+        self.tokens = 0.0
+        self.updated = clock()
+        self.blocked_until = 0.0
+        self.in_flight = 0
+
+        self.requests = 0
+        self.throttled = 0
+        self.waited = 0.0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(headroom=int(config.get('rate_limit_headroom', DEFAULT_HEADROOM)))
+
+    def _refill(self, now):
+        if self.rate and now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def acquire(self):
+        """
+        Waits for the next request slot. Slots are reserved under the lock and waited for outside
+        of it, so threads queue up one interval apart instead of all waking at once.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            self.sleep(wait)
+
+    def reserve(self):
+        """
+        Takes the next request slot and returns the seconds to wait for it, for callers that wait
+        on their own, e.g. with asyncio.sleep
+        """
+        with self.lock:
+            now = self.clock()
+            wait = max(0.0, self.blocked_until - now)
+            if self.rate:
+                self._refill(now)
+                self.tokens -= 1
+                # the bucket refills from `updated`, which is the end of the wait for a reset
+                ready = max(now, self.updated) + max(0.0, -self.tokens) / self.rate
+                wait = max(wait, ready - now)
+            self.requests += 1
+            self.in_flight += 1
+            self.waited += wait
+        return wait
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    @contextmanager
+    def request(self):
+        self.acquire()
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def update(self, headers, status_code=None):
+        """
+        Learns from the rate limit headers of a response, called while its request is in flight
+        """
+        headers = headers or {}
+        limit = _header(headers, 'X-RateLimit-Limit')
+        remaining = _header(headers, 'X-RateLimit-Remaining')
+        reset = _header(headers, 'X-RateLimit-Reset')
+
+        with self.lock:
+            if status_code == 429:
+                self.throttled += 1
+            if remaining is None or reset is None:
+                return
+
+            now = self.clock()
+            self._refill(now)
+            if limit:
+                self.limit = limit
+            self.remaining = remaining
+            # Reset counts down through a window, the largest one seen since the current window
+            # started is its length. A window ending later than the tracked one is the next
+            # window, less than that is the latency of responses, so a window that got shorter
+            # is picked up with the next one.
+            window_ends = now + reset
+            if self.window is None or window_ends - self.window_ends > max(reset / 2, self.window / 10):
+                self.window = max(reset, 0.001)
+                self.window_ends = window_ends
+            else:
+                self.window = max(self.window, reset, 0.001)
+            if self.limit:
+                self.rate = max(self.limit - self.headroom, 1.0) / self.window
+
+            # the other requests in flight aren't counted in remaining yet
+            available = remaining - (self.in_flight - 1)
+            if available <= self.headroom:
+                self.blocked_until = max(self.blocked_until, now + reset)
+                self.tokens = min(self.tokens, 0.0)
+                self.updated = max(self.updated, self.blocked_until)
+            elif self.tokens > available - self.headroom:
+                self.tokens = available - self.headroom
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'limit': self.limit,
+                'remaining': self.remaining,
+                'window': self.window,
+                'requests_per_second': self.rate,
+                'requests': self.requests,
+                'throttled': self.throttled,
+                'seconds_waited': round(self.waited, 3),
+            }
+
+    def log_metrics(self, tags=None):
+        for name, value in self.metrics().items():
+            if value is not None:
+                singer.metrics.log(logger, singer.metrics.Point('gauge', 'rate_limit_' + name, value, tags or {}))
@@ -0,0 +1,52 @@
+from tap_pipedrive.transform import SchemaTransformer, is_selected
+
+
+class RowPlan(object):
+    """
+    Everything the row loop needs from a stream, resolved once per sync: the schema, the catalog
+    metadata, the table renaming custom field hash keys to their cleaned names and the transformer
+    compiled from the first two.
+
+    When the catalog deselects properties, the keys they are read from are picked out of a row
+    before anything else happens to it, and selected_schema is the schema of what is left: the
+    selected and automatic properties. Projected records have their keys in schema order.
+    """
+
+    def __init__(self, schema, stream_metadata, key_map=None):
+        self.schema = schema
+        self.metadata = stream_metadata
+        self.key_map = key_map or {}
+        # cleaned name -> hash key, a custom field named like a standard one replaces its value
+        self.renamed_from = {name: key for key, name in self.key_map.items()}
+        self.transformer = SchemaTransformer(schema, stream_metadata)
+
+        self.selected_schema = schema
+        self.source_keys = None
+        properties = schema.get('properties') or {}
+        selected = [name for name in properties if not stream_metadata or is_selected(stream_metadata, name)]
+        if len(selected) < len(properties):
+            self.selected_schema = dict(schema, properties={name: properties[name] for name in selected})
+            # the hash keys of a selected custom field come first, remap prefers them
+            sources = {}
+            for key, name in self.key_map.items():
+                sources.setdefault(name, []).append(key)
+            self.source_keys = [key for name in selected for key in sources.get(name, []) + [name]]
+
+    def project(self, row):
+        source_keys = self.source_keys
+        if source_keys is None or type(row) is not dict:
+            return row
+        return {key: row[key] for key in source_keys if key in row}
+
+    def remap(self, row):
+        key_map = self.key_map
+        if key_map.keys().isdisjoint(row):
+            return row
+
+        renamed_from = self.renamed_from
+        get = key_map.get
+        return {get(key, key): value for key, value in row.items()
+                if key not in renamed_from or renamed_from[key] not in row}
+
+    def transform(self, row):
+        return self.transformer.transform(self.remap(self.project(row)))
@@ -1,21 +1,33 @@
 import os
 import singer
 import pendulum
-from requests.exceptions import RequestException
+from tap_pipedrive.dedup import DedupIndex
+from tap_pipedrive.row_plan import RowPlan
+from tap_pipedrive.page_size import PageSizer
+from tap_pipedrive.transport import TransferMeter
+from tap_pipedrive.deal_index import fingerprint
+from tap_pipedrive.timestamps import parse_epoch, parse_datetime, to_epoch
 
 logger = singer.get_logger()
 
+DEAL_DISCOVERY = ('deals', 'recents')
+
 
 class PipedriveStream(object):
     def __init__(self):
-        self.ids = []
+        self.ids = DedupIndex()
+        self.page_sizer = PageSizer(self.limit)
+        self.transfer = TransferMeter()
 
     tap = None
     endpoint = ''
     key_properties = []
     state_field = None
-    initial_state = None
-    earliest_state = None
+    _initial_state = None
+    _earliest_state = None
+    # epochs (microseconds) of the two states above, rows are compared against them without building datetimes
+    initial_cutoff = None
+    earliest_epoch = None
     schema = ''
     schema_path = 'schemas/{}.json'
     schema_cache = None
@@ -23,11 +35,32 @@ class PipedriveStream(object):
 
     start = 0
     limit = 100
-    next_start = 100
     more_items_in_collection = True
+    # pages processed and time.monotonic() since the last checkpoint, see PipedriveTap.checkpoint
+    pages_since_checkpoint = 0
+    checkpointed_at = None
 
     id_list = False
 
+    @property
+    def initial_state(self):
+        return self._initial_state
+
+    @initial_state.setter
+    def initial_state(self, value):
+        self._initial_state = value
+        # a record is written when its state minus one second is >= initial_state
+        self.initial_cutoff = None if value is None else to_epoch(value) + 1000000
+
+    @property
+    def earliest_state(self):
+        return self._earliest_state
+
+    @earliest_state.setter
+    def earliest_state(self, value):
+        self._earliest_state = value
+        self.earliest_epoch = None if value is None else to_epoch(value)
+
     def get_schema(self):
         if not self.schema_cache:
             self.schema_cache = self.load_schema()
@@ -39,8 +72,11 @@ class PipedriveStream(object):
         schema = singer.utils.load_json(schema_path)
         return schema
 
-    def write_schema(self):
-        singer.write_schema(self.schema, self.get_schema(), key_properties=self.key_properties)
+    def get_row_plan(self, stream_metadata):
+        return RowPlan(self.get_schema(), stream_metadata)
+
+    def write_schema(self, schema=None):
+        self.tap.writer.write_schema(self.schema, schema or self.get_schema(), key_properties=self.key_properties)
 
     def get_name(self):
         return self.endpoint
@@ -48,11 +84,10 @@ class PipedriveStream(object):
     def update_state(self, row):
         if self.state_field:
             # nullable update_time breaks bookmarking
-            if self.get_row_state(row) is not None:
-                current_state = pendulum.parse(self.get_row_state(row))
-
-                if self.state_is_newer_or_equal(current_state):
-                    self.earliest_state = current_state
+            row_state = self.get_row_state(row)
+            if row_state is not None:
+                if self.earliest_epoch is None or parse_epoch(row_state) >= self.earliest_epoch:
+                    self.earliest_state = parse_datetime(row_state)
 
     def set_initial_state(self, state, start_date):
         try:
@@ -68,49 +103,59 @@ class PipedriveStream(object):
         self.initial_state = start_date
         self.earliest_state = self.initial_state
 
-    def has_data(self):
-        return self.more_items_in_collection
-
-    def paginate(self, response):
-        payload = response.json()
+    def checkpoint_position(self):
+        """
+        Where a run interrupted now resumes, see resume_from. None when there's no next page, and
+        for a listing that isn't ordered by the bookmark: any offset into it can move past items
+        not read yet when earlier ones change, so an interrupted run starts over.
+        """
+        return None
 
-        if 'additional_data' in payload and 'pagination' in payload['additional_data']:
-            logger.debug('Paginate: valid response')
-            pagination = payload['additional_data']['pagination']
-            if 'more_items_in_collection' in pagination:
-                self.more_items_in_collection = pagination['more_items_in_collection']
+    def resume_from(self, checkpoint):
+        """
+        Continues an interrupted run from its last checkpoint, when that run started from the
+        same bookmark. False when the stream starts over.
+        """
+        return False
 
-                if 'next_start' in pagination:
-                    self.start = pagination['next_start']
+    def has_data(self):
+        return self.more_items_in_collection
 
-        else:
-            self.more_items_in_collection = False
+    def paginate(self, page):
+        more_items_in_collection, next_start = self.read_pagination(page)
+        if more_items_in_collection is not None:
+            self.more_items_in_collection = more_items_in_collection
+        if next_start is not None:
+            self.start = next_start
 
         if self.more_items_in_collection:
             logger.debug('Stream {} has more data starting at {}'.format(self.schema, self.start))
         else:
             logger.debug('Stream {} has no more data'.format(self.schema))
 
+    def read_pagination(self, page):
+        """
+        Returns (more_items_in_collection, next_start) of a page without touching stream state,
+        None for values the page doesn't carry
+        """
+        pagination = page.pagination
+        if pagination is None:
+            return False, None
+
+        logger.debug('Paginate: valid response')
+        if 'more_items_in_collection' in pagination:
+            return pagination['more_items_in_collection'], pagination.get('next_start')
+        return None, None
+
     def update_request_params(self, params):
         """
         Non recent stream doesn't modify request params
         """
         return params
 
-    def state_is_newer_or_equal(self, current_state):
-        if self.earliest_state is None:
-            # self.state = current_state
-            return True
-
-        if current_state >= self.earliest_state:
-            self.earliest_state = current_state
-            return True
-
-        return False
-
     def write_record(self, row):
         if self.record_is_newer_equal_null(row):
-            singer.write_record(self.schema, row)
+            self.tap.writer.write_record(self.schema, row)
             return True
         return False
 
@@ -120,16 +165,12 @@ class PipedriveStream(object):
             return True
 
         # state field is null
-        if self.get_row_state(row) is None:
+        row_state = self.get_row_state(row)
+        if row_state is None:
             return True
 
         # newer or equal
-        current_state = pendulum.parse(self.get_row_state(row))
-        current_state = current_state.subtract(seconds=1)
-        if current_state >= self.initial_state:
-            return True
-
-        return False
+        return parse_epoch(row_state) >= self.initial_cutoff
 
     def get_row_state(self, row):
         return row.get(self.state_field)
@@ -140,54 +181,183 @@ class PipedriveStream(object):
 
 class PipedriveIterStream(PipedriveStream):
     id_list = True
-    
-    def get_deal_ids(self, tap):
+    deal_index = None
+    # the deal after which an interrupted walk resumes and when that walk started, see resume_from
+    resume_deal_id = None
+    resumed_stream_start = None
+    # whether the resumed walk went a page back to find that deal
+    resume_rewound = False
+    # where the deals to sync are picked from, set by the deal_discovery config: 'deals' lists
+    # every deal, 'recents' only the deals updated since the bookmark
+    deal_discovery = 'deals'
 
-        # note when the stream starts syncing
-        self.stream_start = pendulum.now('UTC') # explicitly set timezone to UTC
-
-        # create checkpoint at inital_state to only find stage changes more recent than initial_state (bookmark)
-        checkpoint = self.initial_state
+    def get_deal_ids(self, tap):
+        self.start_deal_walk()
+        endpoint, params = self.deal_listing()
 
         while self.more_items_in_collection:
-            self.endpoint = self.base_endpoint
-
-            with singer.metrics.http_request_timer(self.schema) as timer:
-                try:
-                    response = tap.execute_stream_request(self)
-                except (ConnectionError, RequestException) as e:
-                    raise e
-                timer.tags[singer.metrics.Tag.http_status_code] = response.status_code
-
-            tap.validate_response(response)
-            tap.rate_throttling(response)
-            self.paginate(response)
-
-            self.more_ids_to_get = self.more_items_in_collection  # note if there are more pages of ids to get
-            self.next_start = self.start  # note pagination for next loop
+            page = tap.fetch_stream_page(self, endpoint=endpoint, params=params)
+            for deal_id in self.deal_ids_on_page(page):
+                yield deal_id
 
-            # find all deals ids for deals added or with stage changes after start and before stop
-            this_page_ids = self.find_deal_ids(response.json()['data'], start=checkpoint, stop=self.stream_start)
+    def start_deal_walk(self):
+        # note when the stream starts syncing, a resumed walk keeps the bounds it started with
+        self.stream_start = self.resumed_stream_start or pendulum.now('UTC') # explicitly set timezone to UTC
+
+        self.deal_discovery = self.tap.config.get('deal_discovery', 'deals') if self.tap else 'deals'
+        if self.deal_discovery not in DEAL_DISCOVERY:
+            raise ValueError("Unknown deal_discovery '{}', expected one of {}".format(self.deal_discovery,
+                                                                                   ', '.join(DEAL_DISCOVERY)))
+        self.listed_ids = set()
+        self.deal_index = self.tap.deal_index if self.tap else None
+        # deal id -> fingerprint of the deals being synced, staged in the deal index once synced
+        self.deal_fingerprints = {}
+        self.unchanged_deals = 0
+        # deal id -> offset of the listing page it is on, until the deal is synced
+        self.deal_pages = {}
+        # (page offset, deal id) of the last deal synced
+        self.completed_deal = None
+
+    def deal_listing(self):
+        """
+        The endpoint and extra request params of the listing the deals to sync are picked from
+        """
+        if self.deal_discovery == 'recents':
+            # a deal added or moved to another stage since the bookmark was updated since then too
+            return 'recents', {'items': 'deal',
+                               'since_timestamp': self.initial_state.subtract(seconds=1).to_datetime_string()}
+        return self.base_endpoint, None
+
+    def deal_ids_on_page(self, page):
+        page_start = self.start
+        self.paginate(page)
+
+        deals = page.data or []
+        if self.deal_discovery == 'recents':
+            deals = [row['data'] for row in deals
+                     if row.get('item') == 'deal' and isinstance(row.get('data'), dict)]
+        if self.resume_deal_id is not None:
+            deals = self.after_resumed_deal(deals, page_start)
+
+        # find all deals ids for deals added or with stage changes after start and before stop,
+        # starting at inital_state to only find stage changes more recent than the bookmark
+        deal_ids = self.find_deal_ids(deals, start=self.initial_state, stop=self.stream_start)
+        if self.deal_discovery == 'recents':
+            deal_ids = self.first_listed(deal_ids)
+        if self.deal_index is not None:
+            deal_ids = self.changed_deals(deals, deal_ids)
+
+        for deal_id in deal_ids:
+            self.deal_pages[deal_id] = page_start
+        return deal_ids
+
+    def after_resumed_deal(self, deals, page_start):
+        """
+        The deals listed after the last synced one on the first page of a resumed walk, the page
+        that deal was on. Deals deleted since shift the listing, so a deal that isn't there is
+        looked for on the page before, then the walk starts over from the first page.
+        """
+        deal_ids = [deal['id'] for deal in deals]
+        if self.resume_deal_id in deal_ids:
+            position = deal_ids.index(self.resume_deal_id)
+            self.resume_deal_id = None
+            return deals[position + 1:]
+
+        if page_start == 0:
+            # every deal from the first page on
+            self.resume_deal_id = None
+            return deals
+        if not self.resume_rewound:
+            self.resume_rewound = True
+            self.start = max(0, page_start - self.page_sizer.size)
+        else:
+            logger.info('Deal {} is no longer listed, {} starts over'.format(self.resume_deal_id, self.schema))
+            self.resume_deal_id = None
+            self.start = 0
+        self.more_items_in_collection = True
+        return []
+
+    def first_listed(self, deal_ids):
+        # recents can list a deal on more than one page
+        first_ids = []
+        for deal_id in deal_ids:
+            if deal_id not in self.listed_ids:
+                self.listed_ids.add(deal_id)
+                first_ids.append(deal_id)
+        return first_ids
+
+    def changed_deals(self, deals, deal_ids):
+        """
+        The deal_ids whose fingerprint moved since the stream last synced them
+        """
+        fingerprints = {deal['id']: fingerprint(deal) for deal in deals}
+        synced = self.deal_index.fingerprints(self.schema, deal_ids)
+        changed_ids = []
+        for deal_id in deal_ids:
+            if fingerprints[deal_id] is not None and synced.get(deal_id) == fingerprints[deal_id]:
+                self.unchanged_deals += 1
+                continue
+            self.deal_fingerprints[deal_id] = fingerprints[deal_id]
+            changed_ids.append(deal_id)
+        return changed_ids
+
+    def deal_synced(self, deal_id, cursor):
+        """
+        Notes that every sub-resource item of the deal, `cursor` of them, was processed
+        """
+        deal_fingerprint = self.deal_fingerprints.pop(deal_id, None)
+        if self.deal_index is not None and deal_fingerprint is not None:
+            self.deal_index.stage(self.schema, deal_id, deal_fingerprint, cursor)
+        self.completed_deal = (self.deal_pages.pop(deal_id, self.start), deal_id)
 
-            self.these_deals = this_page_ids  # need the list of deals to check for last id in the tap
-            for deal_id in this_page_ids:
-                yield deal_id
+    def checkpoint_position(self):
+        """
+        The listing page of the last synced deal and that deal, None before the first one
+        """
+        if self.completed_deal is None:
+            return None
+        page_start, deal_id = self.completed_deal
+        return {'since': str(self.initial_state), 'stream_start': str(self.stream_start),
+                'start': page_start, 'deal_id': deal_id}
 
+    def resume_from(self, checkpoint):
+        """
+        Continues the deal walk of an interrupted run after its last synced deal, when that run
+        started from the same bookmark
+        """
+        if not isinstance(checkpoint, dict) or checkpoint.get('since') != str(self.initial_state) \
+                or 'deal_id' not in checkpoint:
+            return False
+        self.start = int(checkpoint['start'])
+        self.resume_deal_id = checkpoint['deal_id']
+        self.resume_rewound = False
+        self.resumed_stream_start = pendulum.parse(checkpoint['stream_start'])
+        return True
+
+    def deal_endpoint(self, deal_id):
+        return self.id_endpoint.format(deal_id)
 
     def find_deal_ids(self, data, start, stop):
-
-        # find all deals that were *added* after the start time and before the stop time
-        added_ids = [data[i]['id']
-                     for i in range(len(data))
-                     if (data[i]['add_time'] is not None
-                         and start <= pendulum.parse(data[i]['add_time']) < stop)]
-
-        # find all deals that a) had a stage change at any time (i.e., the stage_change_time is not None),
-        #                     b) had a stage change after the start time and before the stop time, and
-        #                     c) are not in added_ids
-        changed_ids = [data[i]['id']
-                       for i in range(len(data))
-                       if (data[i]['id'] not in added_ids)
-                       and (data[i]['stage_change_time'] is not None
-                            and start <= pendulum.parse(data[i]['stage_change_time']) < stop)]
-        return added_ids + changed_ids
+        """
+        The ids of the deals *added* after the start time and before the stop time, followed by
+        the ids of the other deals that had a stage change in that time, both in page order
+        """
+        start_epoch = to_epoch(start)
+        stop_epoch = to_epoch(stop)
+
+        added_ids = []
+        changed_ids = []
+        for deal in data:
+            add_time = deal['add_time']
+            if add_time is not None and start_epoch <= parse_epoch(add_time) < stop_epoch:
+                added_ids.append(deal['id'])
+                continue
+            stage_change_time = deal['stage_change_time']
+            if stage_change_time is not None and start_epoch <= parse_epoch(stage_change_time) < stop_epoch:
+                changed_ids.append(deal['id'])
+
+        if not changed_ids:
+            return added_ids
+        # a deal listed twice may have been added by its other entry
+        added = set(added_ids)
+        return added_ids + [deal_id for deal_id in changed_ids if deal_id not in added]
@@ -11,7 +11,3 @@ class DealStageChangeStream(PipedriveIterStream):
 
     def get_name(self):
         return self.schema
-
-
-    def update_endpoint(self, deal_id):
-        self.endpoint = self.id_endpoint.format(deal_id)
\ No newline at end of file
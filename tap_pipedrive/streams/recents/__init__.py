@@ -1,3 +1,4 @@
+import pendulum
 import singer
 from tap_pipedrive.stream import PipedriveStream
 
@@ -12,20 +13,45 @@ class RecentsStream(PipedriveStream):
     schema_path = 'schemas/recents/{}.json'
     replication_method = 'INCREMENTAL'
     state_field = 'update_time'
+    # the update_time a resumed run lists the items from, see resume_from
+    resume_since = None
 
     def update_request_params(self, params):
         """
         Filter recents enpoint data with items and since_timestamp
         """
+        since = self.resume_since or self.initial_state
         params.update({
-            'since_timestamp': self.initial_state.subtract(seconds=1).to_datetime_string(),
+            'since_timestamp': since.subtract(seconds=1).to_datetime_string(),
             'items': self.items
         })
         return params
 
-    def write_schema(self):
+    def checkpoint_position(self):
+        """
+        The latest update_time processed, which every item not processed yet was updated at or
+        after, as recents lists the items in update_time order. None when there's no next page.
+        """
+        if not self.more_items_in_collection:
+            return None
+        return {'since': str(self.initial_state), 'bookmark': str(self.earliest_state)}
+
+    def resume_from(self, checkpoint):
+        """
+        Lists the items updated since the checkpoint's bookmark from the start, rather than going
+        on from an offset which the items updated meanwhile move. The items updated at that time
+        are read again.
+        """
+        self.resume_since = None
+        if not isinstance(checkpoint, dict) or checkpoint.get('since') != str(self.initial_state) \
+                or not checkpoint.get('bookmark'):
+            return False
+        self.resume_since = self.earliest_state = pendulum.parse(checkpoint['bookmark'])
+        return True
+
+    def write_schema(self, schema=None):
         # for /recents/ streams override default (schema name equals to endpoint) with items
-        singer.write_schema(self.schema, self.get_schema(), key_properties=self.key_properties)
+        self.tap.writer.write_schema(self.schema, schema or self.get_schema(), key_properties=self.key_properties)
 
     def get_name(self):
         return self.schema
@@ -1,6 +1,8 @@
 import singer
 from requests import RequestException
 from tap_pipedrive.streams.recents import RecentsStream
+from tap_pipedrive.row_plan import RowPlan
+from tap_pipedrive.fields_cache import FieldsCache
 
 
 logger = singer.get_logger()
@@ -10,10 +12,14 @@ class DynamicTypingRecentsStream(RecentsStream):
     schema_path = 'schemas/recents/dynamic_typing/{}.json'
     static_fields = []
     fields_endpoint = ''
-    fields_more_items_in_collection = True
-    fields_start = 0
     fields_limit = 100
-    schema_mapping = {}
+
+    def __init__(self):
+        super().__init__()
+        # hash key of a custom field -> its cleaned name
+        self.schema_mapping = {}
+        # the definitions the schema was built from, reused as the field metadata of discovery
+        self.field_definitions = None
 
     def clean_string(self,string):
         return string.replace(" ", "_").replace("-", "_").replace("/", "_").replace("(", "").replace(")", "").replace(".", "").replace(",", "").replace(":", "").replace(";", "").replace("&", "and").replace("'", "").replace('"', "").lower()
@@ -31,71 +37,111 @@ class DynamicTypingRecentsStream(RecentsStream):
             self.get_schema()
             return self.schema_mapping
 
-    def get_schema(self):
-        if not self.schema_cache:
-            schema = self.load_schema()
-
-            while self.fields_more_items_in_collection:
-
-                fields_response = self.get_fields_response(self.fields_limit,self.fields_start)
-                try:
-                    payload = fields_response.json() # Verifying response in execute_request
-
-                    for property in payload['data']:
-                        key = f"{property['key']}"
-                        if property.get("edit_flag",False):
-                            key = self.clean_string(property['name'])
-                            if property.get("is_subfield"):
-                                key = self.clean_string(property['name'])
-                            self.schema_mapping[property['key']] = key
-                        if key not in self.static_fields:
-                            logger.debug(key, property['field_type'], property['mandatory_flag'])
-
-                            if key in schema['properties']:
-                                logger.warn('Dynamic property "{}" overrides with type {} existing entry in ' \
-                                            'static JSON schema of {} stream.'.format(
-                                                key,
-                                                property['field_type'],
-                                                self.schema
-                                            )
+    def get_row_plan(self, stream_metadata):
+        return RowPlan(self.get_schema(), stream_metadata, self.get_schema_mapping())
+
+    def fetch_field_definitions(self, get_fields=None):
+        get_fields = get_fields or self.get_fields_response
+        fields = []
+        start = 0
+        more_items_in_collection = True
+        while more_items_in_collection:
+            page = get_fields(self.fields_limit, start)
+            fields += page.data or []
+            more_items_in_collection, next_start = self.read_pagination(page)
+            start = next_start if next_start is not None else start + self.fields_limit
+        return fields
+
+    def fields_unchanged(self, fields, get_fields=None):
+        """
+        Asks for the last cached field only: a field added or deleted since moves it, so does a
+        rename of that field. Renames of the other fields wait for the cache's max_age, see
+        FieldsCache.
+        """
+        if not fields:
+            return False
+        return self.is_last_field(fields, (get_fields or self.get_fields_response)(1, len(fields) - 1))
+
+    def is_last_field(self, fields, page):
+        """
+        Whether page, the one field at offset len(fields) - 1, still is the last cached field
+        """
+        data = page.data or []
+        more_items_in_collection, _ = self.read_pagination(page)
+        if more_items_in_collection or len(data) != 1:
+            return False
+        return all(data[0].get(attribute) == fields[-1].get(attribute) for attribute in ('id', 'key', 'name', 'field_type'))
+
+    def get_field_definitions(self, get_fields=None):
+        """
+        The field definitions, through the fields cache when fields_cache_dir is configured.
+        get_fields(limit, start) requests a page of them, get_fields_response unless the
+        caller, e.g. the async engine, sends the requests itself.
+        """
+        cache = FieldsCache.from_config(self.tap.config)
+        if cache is None:
+            return self.fetch_field_definitions(get_fields)
+
+        account = self.tap.get_base_url()
+        entry = cache.load(account, self.fields_endpoint)
+        if entry is not None:
+            if cache.is_fresh(entry):
+                return entry['fields']
+            if self.fields_unchanged(entry['fields'], get_fields):
+                cache.touch(entry)
+                return entry['fields']
+            logger.info('Fields of {} changed since they were cached, fetching them again'.format(self.schema))
+
+        fields = self.fetch_field_definitions(get_fields)
+        cache.store(account, self.fields_endpoint, fields)
+        return fields
+
+    def build_schema(self, fields):
+        schema = self.load_schema()
+        for property in fields:
+            key = f"{property['key']}"
+            if property.get("edit_flag",False):
+                key = self.clean_string(property['name'])
+                if property.get("is_subfield"):
+                    key = self.clean_string(property['name'])
+                self.schema_mapping[property['key']] = key
+            if key not in self.static_fields:
+                logger.debug(key, property['field_type'], property['mandatory_flag'])
+
+                if key in schema['properties']:
+                    logger.warn('Dynamic property "{}" overrides with type {} existing entry in ' \
+                                'static JSON schema of {} stream.'.format(
+                                    key,
+                                    property['field_type'],
+                                    self.schema
                                 )
+                    )
 
-                            property_content = {
-                                'type': []
-                            }
-
-                            if property['field_type'] in ['int']:
-                                property_content['type'].append('integer')
-
-                            elif property['field_type'] in ['timestamp']:
-                                property_content['type'].append('string')
-                                property_content['format'] = 'date-time'
+                property_content = {
+                    'type': []
+                }
 
-                            else:
-                                property_content['type'].append('string')
+                if property['field_type'] in ['int']:
+                    property_content['type'].append('integer')
 
-                            # allow all dynamic properties to be null since this 
-                            # happens in practice probably because a property could
-                            # be marked mandatory for some amount of time and not
-                            # mandatory for another amount of time
-                            property_content['type'].append('null')
+                elif property['field_type'] in ['timestamp']:
+                    property_content['type'].append('string')
+                    property_content['format'] = 'date-time'
 
-                            schema['properties'][key] = property_content
+                else:
+                    property_content['type'].append('string')
 
-                    # Check for more data is available in next page
-                    if 'additional_data' in payload and 'pagination' in payload['additional_data']:
-                        pagination = payload['additional_data']['pagination']
-                        if 'more_items_in_collection' in pagination:
-                            self.fields_more_items_in_collection = pagination['more_items_in_collection']
+                # allow all dynamic properties to be null since this 
+                # happens in practice probably because a property could
+                # be marked mandatory for some amount of time and not
+                # mandatory for another amount of time
+                property_content['type'].append('null')
 
-                            if 'next_start' in pagination:
-                                self.fields_start = pagination['next_start']
+                schema['properties'][key] = property_content
+        return schema
 
-                    else:
-                        self.fields_more_items_in_collection = False
-
-                except Exception as e:
-                    raise e
-
-            self.schema_cache = schema
+    def get_schema(self):
+        if not self.schema_cache:
+            self.field_definitions = self.get_field_definitions()
+            self.schema_cache = self.build_schema(self.field_definitions)
         return self.schema_cache
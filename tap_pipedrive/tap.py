@@ -1,5 +1,6 @@
 import time
 import sys
+import threading
 import base64
 from datetime import datetime
 import math
@@ -8,7 +9,9 @@ import requests
 import singer
 import simplejson
 import backoff
-from requests.exceptions import ConnectionError, RequestException
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.exceptions import ConnectionError
 from json import JSONDecodeError
 from singer import set_currently_syncing, metadata
 from singer.catalog import Catalog, CatalogEntry, Schema
@@ -19,11 +22,23 @@ from tap_pipedrive.streams import (CurrenciesStream, ActivityTypesStream, Filter
                       RecentNotesStream, RecentUsersStream, RecentActivitiesStream, RecentDealsStream,
                       RecentFilesStream, RecentOrganizationsStream, RecentPersonsStream, RecentProductsStream,
                       DealStageChangeStream, DealsProductsStream)
-from tap_pipedrive.streams.recents.dynamic_typing import DynamicTypingRecentsStream
+from tap_pipedrive.transport import build_session, get_timeout, BodyReader, TransferMeter, DEFAULT_POOL_SIZE
+from tap_pipedrive.dedup import DedupIndex
+from tap_pipedrive.page import PipedrivePage, StreamingPage, STREAM_CHUNK_SIZE, decode_body
+from tap_pipedrive.json_backend import JsonBackend
+from tap_pipedrive.output import MessageWriter, DEFAULT_BUFFER_SIZE
+from tap_pipedrive.rate_limit import RateGovernor
+from tap_pipedrive.page_size import PageSizer, MAX_PAGE_SIZE
+from tap_pipedrive.prefetch import prefetch
+from tap_pipedrive.deal_index import DealIndex
 
 logger = singer.get_logger()
 
 
+# raised while the body of a streaming page is read, see do_paginate
+PAGE_READ_ERRORS = (simplejson.scanner.JSONDecodeError, ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.ContentDecodingError)
+
 ERROR_CODE_EXCEPTION_MAPPING = {
     400: {
         "raise_exception": PipedriveBadRequestError,
@@ -83,6 +98,10 @@ def is_not_status_code_fn(status_code):
         return False
     return gen_fn
 
+def page_can_shrink(exc):
+    # a timeout or 5xx of a page that can shrink is retried by execute_stream_request with a smaller page
+    return getattr(exc, 'page_can_shrink', False)
+
 def retry_after_wait_gen():
     while True:
         # This is called in an except block so we can retrieve the exception
@@ -117,6 +136,20 @@ class PipedriveTap(object):
         self.config = config
         self.config['start_date'] = pendulum.parse(self.config['start_date'])
         self.state = state
+        self.session = build_session(self.config)
+        self.timeout = get_timeout(self.config)
+        self.json_backend = JsonBackend(self.config.get('json_backend', 'auto'))
+        self.writer = MessageWriter(self.json_backend, int(self.config.get('output_buffer_size', DEFAULT_BUFFER_SIZE)))
+        self.rate_governor = RateGovernor.from_config(self.config)
+        self.deal_index = DealIndex.from_config(self.config)
+        # paginated streams write a STATE to resume from every so many pages and/or seconds
+        self.checkpoint_every_pages = int(self.config.get('checkpoint_every_pages', 0))
+        self.checkpoint_every_seconds = float(self.config.get('checkpoint_every_seconds', 0))
+        # pages of the streams are decoded row by row while they are read
+        self.streaming_pages = str(self.config.get('streaming_pages', False)).lower() == 'true'
+        # guards self.state and the streams being synced when streams run concurrently
+        self.state_lock = threading.Lock()
+        self.in_flight = []
 
     def do_discover(self, return_dict=False):
         logger.info('Starting discover')
@@ -126,38 +159,29 @@ class PipedriveTap(object):
 
         for stream in self.streams:
             stream.tap = self
-
+        # the dynamic streams fetch their field definitions for their schema anyway, other streams
+        # with the same metadata_endpoint reuse them
+        field_providers = {stream.fields_endpoint: stream for stream in self.streams
+                           if getattr(stream, 'fields_endpoint', None)}
+
+        # the schemas, with the *Fields of the dynamic streams, and the field metadata are fetched
+        # at once, paced by the rate governor like any other request
+        workers = int(self.config.get('discover_concurrency', self.config.get('http_pool_size', DEFAULT_POOL_SIZE)))
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            schemas = [executor.submit(stream.get_schema) for stream in self.streams]
+            metadata_futures = {}
+            if return_dict:
+                metadata_futures = {stream.schema: executor.submit(self.fetch_field_metadata, stream)
+                                  for stream in self.streams if getattr(stream, 'metadata_endpoint', None)
+                                  and stream.metadata_endpoint not in field_providers}
             try:
-                schema = Schema.from_dict(stream.get_schema())
-            except PipedriveForbiddenError:
-                logger.warning(f"Stream '{stream.get_name()}' ignored because it is not in the scopes.")
-                continue
-            key_properties = stream.key_properties
+                for stream, schema in zip(self.streams, schemas):
+                    self.add_to_catalog(catalog, catalog_stream_meta_dict, stream, schema)
+            except BaseException:
+                for future in schemas + list(metadata_futures.values()):
+                    future.cancel()
+                raise
 
-            meta = metadata.get_standard_metadata(
-                schema=schema.to_dict(),
-                key_properties=key_properties,
-                valid_replication_keys=[stream.state_field] if stream.state_field else None,
-                replication_method=stream.replication_method
-            )
-
-            # If the stream has a state_field, it needs to mark that property with automatic metadata
-            if stream.state_field:
-                meta = metadata.to_map(meta)
-                if meta.get(('properties', stream.state_field)) :
-                    meta[('properties', stream.state_field)]['inclusion'] = 'automatic'
-                else:
-                    logger.warn(f"State can't be set for {stream.schema}")
-                meta = metadata.to_list(meta)
-
-            catalog.streams.append(CatalogEntry(
-                stream=stream.schema,
-                tap_stream_id=stream.schema,
-                key_properties=key_properties,
-                schema=schema,
-                metadata=meta
-            ))
-            catalog_stream_meta_dict[stream.schema] = meta
         if return_dict:
             cd = catalog.to_dict()
             for catalog_stream in cd.get('streams', []):
@@ -165,36 +189,74 @@ class PipedriveTap(object):
                 catalog_stream['stream_meta'] = catalog_stream_meta_dict[catalog_stream['stream']]
                 try:
                     stream = next(filter(lambda stream: stream.schema == catalog_stream['stream'], self.streams))
-                    if getattr(stream, 'metadata_endpoint', None):
-                        response = self.execute_request(stream.metadata_endpoint)
-                        res_json = response.json()
-                        if 'data' in res_json:
-                            data = res_json['data']
-                            is_more_pages = res_json.get('additional_data', {}).get('pagination', {}).get('more_items_in_collection', False)
-                            start = 0
-                            while is_more_pages:
-                                start += 500
-                                response = self.execute_request(stream.metadata_endpoint, {'start': start})
-                                res_json = response.json()
-                                data += res_json['data']
-                                is_more_pages = res_json.get('additional_data', {}).get('pagination', {}).get('more_items_in_collection', False)
+                    if stream.schema in metadata_futures:
+                        data = metadata_futures[stream.schema].result()
+                    elif field_providers.get(field_metadata_endpoint(stream)):
+                        data = field_providers[field_metadata_endpoint(stream)].field_definitions or []
                 except Exception as exc:
                     logger.warning(f'Failed to find matched catalog. catalog_stream={catalog_stream} and stream={stream}. Error: {exc}')
-                schema = Schema.from_dict(stream.get_schema())
-                for field_key in schema.properties.keys():
-                    catalog_stream['schema']['properties'][field_key]['field_meta'] = {}
-                    if data:
+                field_metadata_index = index_field_metadata(data, getattr(stream, 'schema_mapping', None))
+                for field_key, field_schema in catalog_stream['schema']['properties'].items():
+                    field_schema['field_meta'] = {}
+                    field_metadata = field_metadata_index.get(field_key)
+                    if field_metadata:
                         try:
-                            field_metadata = list(filter(lambda item: item['key'] == field_key, data))
-                            if field_metadata:
-                                field_metadata = field_metadata[0]
-                                field_metadata['label'] = field_metadata['name']
-                                catalog_stream['schema']['properties'][field_key]['field_meta'] = field_metadata
+                            field_schema['field_meta'] = dict(field_metadata, label=field_metadata['name'])
                         except Exception as exc:
                             logger.warning(f'Failed to find the field={field_key} in data. Error: {exc}')
             return cd
         return catalog
 
+    def add_to_catalog(self, catalog, catalog_stream_meta_dict, stream, schema_future):
+        try:
+            schema = Schema.from_dict(schema_future.result())
+        except PipedriveForbiddenError:
+            logger.warning(f"Stream '{stream.get_name()}' ignored because it is not in the scopes.")
+            return
+        key_properties = stream.key_properties
+
+        meta = metadata.get_standard_metadata(
+            schema=schema.to_dict(),
+            key_properties=key_properties,
+            valid_replication_keys=[stream.state_field] if stream.state_field else None,
+            replication_method=stream.replication_method
+        )
+
+        # If the stream has a state_field, it needs to mark that property with automatic metadata
+        if stream.state_field:
+            meta = metadata.to_map(meta)
+            if meta.get(('properties', stream.state_field)) :
+                meta[('properties', stream.state_field)]['inclusion'] = 'automatic'
+            else:
+                logger.warn(f"State can't be set for {stream.schema}")
+            meta = metadata.to_list(meta)
+
+        catalog.streams.append(CatalogEntry(
+            stream=stream.schema,
+            tap_stream_id=stream.schema,
+            key_properties=key_properties,
+            schema=schema,
+            metadata=meta
+        ))
+        catalog_stream_meta_dict[stream.schema] = meta
+
+    def fetch_field_metadata(self, stream):
+        """
+        Every page of the stream's metadata_endpoint
+        """
+        res_json = self.execute_request(stream.metadata_endpoint, {'limit': MAX_PAGE_SIZE}).payload
+        data = []
+        if 'data' in res_json:
+            data = res_json['data']
+            pagination = res_json.get('additional_data', {}).get('pagination', {})
+            while pagination.get('more_items_in_collection', False):
+                # the next page starts where the API says, whatever limit it applied
+                start = pagination.get('next_start', pagination.get('start', 0) + len(res_json['data']))
+                res_json = self.execute_request(stream.metadata_endpoint, {'start': start, 'limit': MAX_PAGE_SIZE}).payload
+                data += res_json['data']
+                pagination = res_json.get('additional_data', {}).get('pagination', {})
+        return data
+
     def do_sync(self, catalog):
         logger.debug('Starting sync')
 
@@ -209,12 +271,11 @@ class PipedriveTap(object):
             resume_from_stream = False
             del self.state['currently_syncing']
 
+        streams = []
         for stream in self.streams:
             if stream.schema not in selected_streams:
                 continue
 
-            stream.tap = self
-
             if resume_from_stream:
                 if stream.schema == resume_from_stream:
                     logger.info('Resuming from {}'.format(resume_from_stream))
@@ -223,64 +284,140 @@ class PipedriveTap(object):
                     logger.info('Skipping stream {} as resuming from {}'.format(stream.schema, resume_from_stream))
                     continue
 
-            # stream state, from state/bookmark or start_date
-            stream.set_initial_state(self.state, self.config['start_date'])
-
-            # currently syncing
-            if stream.state_field:
-                set_currently_syncing(self.state, stream.schema)
-                self.state = singer.write_bookmark(self.state, stream.schema, stream.state_field, str(stream.initial_state))
-                singer.write_state(self.state)
-
-            # schema
-            stream.write_schema()
+            streams.append(stream)
 
-            catalog_stream = catalog.get_stream(stream.schema)
-            stream_metadata = metadata.to_map(catalog_stream.metadata)
-
-            if stream.id_list: # see if we want to iterate over a list of deal_ids
-
-                for deal_id in stream.get_deal_ids(self):
-                    is_last_id = False
+        workers = int(self.config.get('stream_concurrency', 1))
+        if self.config.get('engine', 'sync') == 'async':
+            # imported here, the engine builds on this module and needs aiohttp
+            from tap_pipedrive.async_engine import AsyncEngine
+            AsyncEngine(self).sync_streams(streams, catalog, workers)
+        elif workers > 1:
+            self.sync_streams_concurrently(streams, catalog, workers)
+        else:
+            for stream in streams:
+                self.sync_stream(stream, catalog)
 
-                    if deal_id == stream.these_deals[-1]: #find out if this is last deal_id in the current set
-                        is_last_id = True
+        # clear currently_syncing
+        try:
+            del self.state['currently_syncing']
+        except KeyError as e:
+            pass
+        self.writer.write_state(self.state)
+
+    def sync_streams_concurrently(self, streams, catalog, workers):
+        """
+        Syncs up to `workers` streams at once. Streams start in their usual order, so every stream
+        before the earliest one in flight is complete and currently_syncing can point at it.
+        """
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self.sync_stream, stream, catalog) for stream in streams]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def sync_stream(self, stream, catalog):
+        row_plan = self.start_stream(stream, catalog)
+
+        if stream.id_list: # see if we want to iterate over a list of deal_ids
+            self.sync_deal_stream(stream, row_plan)
+        else:
+            # paginate
+            self.do_paginate(stream, row_plan)
 
-                    # if last page of deals, more_items in collection will be False
-                    # Need to set it to True to get deal_id pagination for the first deal on the last page
-                    if deal_id == stream.these_deals[0]:
-                        stream.more_items_in_collection = True
+        self.finish_stream(stream)
 
-                    stream.update_endpoint(deal_id)
-                    stream.start = 0   # set back to zero for each new deal_id
-                    self.do_paginate(stream, stream_metadata)
+    def start_stream(self, stream, catalog):
+        """
+        Sets the stream up, writes its STATE and SCHEMA and returns the RowPlan of its records
+        """
+        stream.tap = self
+        stream.ids = DedupIndex.from_config(self.config)
+        stream.page_sizer = PageSizer.from_config(self.config, stream)
+        stream.transfer = TransferMeter()
 
-                    if not is_last_id:
-                        stream.more_items_in_collection = True   #set back to True for pagination of next deal_id request
-                    elif is_last_id and stream.more_ids_to_get:  # need to get the next batch of deal_ids
-                        stream.more_items_in_collection = True
-                        stream.start = stream.next_start
-                    else:
-                        stream.more_items_in_collection = False
+        with self.state_lock:
+            # stream state, from state/bookmark or start_date
+            stream.set_initial_state(self.state, self.config['start_date'])
+            if stream.resume_from(singer.get_bookmark(self.state, stream.schema, 'resume')):
+                logger.info('Resuming {} from its checkpoint {}'.format(
+                    stream.schema, singer.get_bookmark(self.state, stream.schema, 'resume')))
+            stream.pages_since_checkpoint = 0
+            stream.checkpointed_at = time.monotonic()
+            self.in_flight.append(stream.schema)
 
-                # set the attribution window so that the bookmark will reflect the new initial_state for the next sync
-                stream.earliest_state = stream.stream_start.subtract(hours=3)
-            else:
-                # paginate
-                self.do_paginate(stream, stream_metadata)
+            # currently syncing
+            if stream.state_field:
+                set_currently_syncing(self.state, self.earliest_in_flight())
+                self.state = singer.write_bookmark(self.state, stream.schema, stream.state_field, str(stream.initial_state))
+                self.writer.write_state(self.state)
+
+        # schema, of the selected properties only
+        catalog_stream = catalog.get_stream(stream.schema)
+        row_plan = stream.get_row_plan(metadata.to_map(catalog_stream.metadata))
+        stream.write_schema(row_plan.selected_schema)
+        return row_plan
+
+    def finish_stream(self, stream):
+        if stream.id_list:
+            # set the attribution window so that the bookmark will reflect the new initial_state for the next sync
+            stream.earliest_state = stream.stream_start.subtract(hours=3)
+
+        if stream.ids.skipped:
+            logger.info('Skipped {} duplicate rows for {}'.format(stream.ids.skipped, stream.schema))
+        if stream.id_list and stream.unchanged_deals:
+            logger.info('Skipped {} unchanged deals for {}'.format(stream.unchanged_deals, stream.schema))
+        self.rate_governor.log_metrics({'endpoint': stream.schema})
+        stream.transfer.log_metrics({'endpoint': stream.schema})
+
+        with self.state_lock:
+            self.in_flight.remove(stream.schema)
+            if self.in_flight:
+                set_currently_syncing(self.state, self.earliest_in_flight())
 
             # update state / bookmarking only when supported by stream
+            self.state.get('bookmarks', {}).get(stream.schema, {}).pop('resume', None)
             if stream.state_field:
                 self.state = singer.write_bookmark(self.state, stream.schema, stream.state_field,
                                                    str(stream.earliest_state))
-            singer.write_state(self.state)
-
-        # clear currently_syncing
-        try:
-            del self.state['currently_syncing']
-        except KeyError as e:
-            pass
-        singer.write_state(self.state)
+            self.writer.write_state(self.state)
+
+            # the deals synced are remembered once the state covering their records is out
+            if stream.id_list and self.deal_index is not None:
+                self.deal_index.commit(stream.schema)
+
+    def checkpoint(self, stream, pages=1):
+        """
+        Called after each page of a paginated stream and after each deal of a deal stream is
+        processed. Every checkpoint_every_pages pages or checkpoint_every_seconds, writes a STATE
+        holding the stream's checkpoint_position, so an interrupted run resumes there, see
+        resume_from. The stream's bookmark stays where the run started until the stream is done.
+        """
+        if not stream.state_field or not (self.checkpoint_every_pages or self.checkpoint_every_seconds):
+            return
+        stream.pages_since_checkpoint += pages
+        now = time.monotonic()
+        due = (self.checkpoint_every_pages and stream.pages_since_checkpoint >= self.checkpoint_every_pages) or \
+              (self.checkpoint_every_seconds and now - stream.checkpointed_at >= self.checkpoint_every_seconds)
+        position = stream.checkpoint_position() if due else None
+        if position is None:
+            return
+
+        stream.pages_since_checkpoint = 0
+        stream.checkpointed_at = now
+        with self.state_lock:
+            self.state = singer.write_bookmark(self.state, stream.schema, 'resume', position)
+            self.writer.write_state(self.state)
+            # the deals synced so far are covered by this state
+            if stream.id_list and self.deal_index is not None:
+                self.deal_index.commit(stream.schema)
+
+    def earliest_in_flight(self):
+        order = [stream.schema for stream in self.streams]
+        return min(self.in_flight, key=order.index)
 
     def get_selected_streams(self, catalog):
         selected_streams = set()
@@ -291,61 +428,176 @@ class PipedriveTap(object):
                 selected_streams.add(stream.tap_stream_id)
         return list(selected_streams)
 
-    def do_paginate(self, stream, stream_metadata):
+    def do_paginate(self, stream, row_plan):
+        """
+        Pages through the stream. The rows of a streaming page are read while the page is
+        processed, so a connection dropped or a body cut short mid page fails there instead of
+        in the retried request: the walk then requests the page at the stream's start again, up
+        to 5 times in a row, and the ids of the stream skip the rows already written.
+        """
+        failures = 0
+        while True:
+            start = stream.start
+            try:
+                return self.walk_pages(stream, row_plan)
+            except PAGE_READ_ERRORS as e:
+                if not self.streaming_pages:
+                    raise
+                failures = failures + 1 if stream.start == start else 1
+                if failures >= 5:
+                    raise
+                logger.info('Reading the page of {} at {} failed, requesting it again: {}'.format(
+                    stream.schema, stream.start, e))
+
+    def walk_pages(self, stream, row_plan):
+        depth = int(self.config.get('prefetch_depth', 0))
+        if depth > 0:
+            # the next pages are requested while this one is processed, the stream still
+            # paginates page by page so its state only covers processed pages
+            for page in prefetch(self.iter_stream_pages(stream), depth):
+                self.process_page(stream, row_plan, page)
+                stream.paginate(page)
+                self.checkpoint(stream)
+            return
+
         while stream.has_data():
+            page = self.fetch_stream_page(stream, streaming=self.streaming_pages)
+            # a streaming page has its pagination once its rows are read
+            self.process_page(stream, row_plan, page)
+            stream.paginate(page)
+            self.checkpoint(stream)
+
+    def iter_stream_pages(self, stream):
+        # same walk as paginate, on local copies of start and more_items_in_collection
+        start = stream.start
+        more_items_in_collection = stream.more_items_in_collection
+        while more_items_in_collection:
+            page = self.fetch_stream_page(stream, start=start, streaming=self.streaming_pages)
+            yield page
+
+            more, next_start = stream.read_pagination(page)
+            if more is not None:
+                more_items_in_collection = more
+            if next_start is not None:
+                start = next_start
+
+    def sync_deal_stream(self, stream, row_plan):
+        """
+        Syncs the sub-resource of every deal returned by get_deal_ids. With deal_concurrency > 1 the
+        pages of the next deals are fetched by a pool of workers, records are still written deal by deal
+        in the order of get_deal_ids.
+        """
+        workers = int(self.config.get('deal_concurrency', 1))
+
+        if workers < 2:
+            for deal_id in stream.get_deal_ids(self):
+                cursor = 0
+                pages = 0
+                for page in self.iter_deal_pages(stream, deal_id):
+                    self.process_page(stream, row_plan, page)
+                    cursor += page.row_count
+                    pages += 1
+                stream.deal_synced(deal_id, cursor)
+                self.checkpoint(stream, pages)
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            in_flight = deque()
+            for deal_id in stream.get_deal_ids(self):
+                in_flight.append((deal_id, executor.submit(self.fetch_deal_pages, stream, deal_id)))
+                if len(in_flight) >= workers:
+                    deal_id, pages = in_flight.popleft()
+                    self.process_deal_pages(stream, row_plan, deal_id, pages.result())
+
+            while in_flight:
+                deal_id, pages = in_flight.popleft()
+                self.process_deal_pages(stream, row_plan, deal_id, pages.result())
+
+    def process_deal_pages(self, stream, row_plan, deal_id, pages):
+        for page in pages:
+            self.process_page(stream, row_plan, page)
+        stream.deal_synced(deal_id, sum(page.row_count for page in pages))
+        self.checkpoint(stream, len(pages))
+
+    def iter_deal_pages(self, stream, deal_id):
+        # pagination of a single deal is kept local so several deals can be fetched at once
+        start = 0
+        while True:
+            page = self.fetch_stream_page(stream, endpoint=stream.deal_endpoint(deal_id), start=start)
+            yield page
+
+            more_items_in_collection, next_start = stream.read_pagination(page)
+            if not more_items_in_collection or next_start is None:
+                break
+            start = next_start
+
+    def fetch_deal_pages(self, stream, deal_id):
+        return list(self.iter_deal_pages(stream, deal_id))
+
+    def process_page(self, stream, row_plan, page):
+        # records with metrics
+        with singer.metrics.record_counter(stream.schema) as counter:
+            stream_name = stream.get_name()
+            for row in self.iterate_response(page):
+                # logic to avoid duplicates HGI-6285
+                if not stream.ids.add(row["id"]):
+                    logger.debug(f"id '{row['id']}' was previously fetched and processed for {stream_name}, skipping duplicate value...")
+                    continue
 
-            with singer.metrics.http_request_timer(stream.schema) as timer:
-                try:
-                    response = self.execute_stream_request(stream)
-                except (ConnectionError, RequestException) as e:
-                    raise e
-                timer.tags[singer.metrics.Tag.http_status_code] = response.status_code
-
-            self.validate_response(response)
-            self.rate_throttling(response)
-            stream.paginate(response)
-
-            # only dynamic type streams have get_schema_mapping()
-            if isinstance(stream, DynamicTypingRecentsStream):
-                schema_mapping = stream.get_schema_mapping()
-            else:
-                schema_mapping = stream.get_schema()
-
-            # records with metrics
-            with singer.metrics.record_counter(stream.schema) as counter:
-                with singer.Transformer(singer.NO_INTEGER_DATETIME_PARSING) as optimus_prime:
-                    stream_name = stream.get_name()
-                    for row in self.iterate_response(response):
-                        # logic to avoid duplicates HGI-6285
-                        if row["id"] not in stream.ids:
-                            stream.ids.append(row["id"])
-                        else:
-                            logger.info(f"id '{row['id']}' was previously fetched and processed for {stream_name}, skipping duplicate value...")
-                            continue
-
-                        row = stream.process_row(row)
-                        if not row: # in case of a non-empty response with an empty element
-                            continue
-                        row_keys = list(row.keys())
-                        for row_key in row_keys:
-                            if row_key in schema_mapping:
-                                row[schema_mapping[row_key]] = row.pop(row_key)
-                        row = optimus_prime.transform(row, stream.get_schema(), stream_metadata)
-                        if stream.write_record(row):
-                            counter.increment()
-                        stream.update_state(row)
-
-    def iterate_response(self, response):
-        payload = response.json()
-        return [] if payload['data'] is None else payload['data']
-
-    def execute_stream_request(self, stream):
+                row = stream.process_row(row)
+                if not row: # in case of a non-empty response with an empty element
+                    continue
+                row = row_plan.transform(row)
+                if stream.write_record(row):
+                    counter.increment()
+                stream.update_state(row)
+
+        self.writer.flush()
+
+    def iterate_response(self, page):
+        return page.rows()
+
+    def stream_request_params(self, stream, start=None, extra_params=None):
         params = {
-            'start': stream.start,
-            'limit': stream.limit
+            'start': stream.start if start is None else start,
+            'limit': stream.page_sizer.size
         }
         params = stream.update_request_params(params)
-        return self.execute_request(stream.endpoint, params=params)
+        if extra_params:
+            params.update(extra_params)
+        return params
+
+    def execute_stream_request(self, stream, endpoint=None, start=None, extra_params=None, streaming=False):
+        while True:
+            params = self.stream_request_params(stream, start, extra_params)
+            started = time.monotonic()
+            try:
+                page = self.execute_request(endpoint or stream.endpoint, params=params, streaming=streaming,
+                                            meter=stream.transfer, shrinkable=stream.page_sizer.can_shrink())
+            except (requests.Timeout, PipedriveInternalServiceError, PipedriveServiceUnavailableError):
+                # an adaptive page size retries with a smaller page at once, execute_request
+                # leaves the timeouts and 5xx of a page that can shrink to this; others get
+                # here after its retries
+                if not stream.page_sizer.shrink():
+                    raise
+                logger.info('Retrying {} with {} items per page'.format(stream.schema, stream.page_sizer.size))
+                continue
+            stream.page_sizer.observe(time.monotonic() - started, page.body_size)
+            return page
+
+    def fetch_stream_page(self, stream, endpoint=None, start=None, params=None, streaming=False):
+        """
+        A page of the stream. Only do_paginate asks for streaming pages, it requests a page again
+        when reading its rows fails; the deal listing and the pages of a deal are decoded whole,
+        so such failures are retried by execute_request.
+        """
+        with singer.metrics.http_request_timer(stream.schema) as timer:
+            page = self.execute_stream_request(stream, endpoint=endpoint, start=start, extra_params=params,
+                                               streaming=streaming)
+            timer.tags[singer.metrics.Tag.http_status_code] = page.status_code
+
+        self.validate_response(page)
+        return page
 
     def get_token(self):
         url = "https://oauth.pipedrive.com/oauth/token"
@@ -371,7 +623,7 @@ class PipedriveTap(object):
                 "Accept": "application/json",
                 "Content-Type": "application/x-www-form-urlencoded"
             }
-            response = requests.post(url, headers=headers, data=payload)
+            response = self.session.post(url, headers=headers, data=payload, timeout=self.timeout)
             if response.status_code > 399 and response.status_code < 500:
                 raise Exception(f"Status code: {response.status_code} - {response.json()['message']}")
             
@@ -386,9 +638,9 @@ class PipedriveTap(object):
         return access_token
 
 
-    @backoff.on_exception(backoff.expo, (PipedriveInternalServiceError, simplejson.scanner.JSONDecodeError, ConnectionError), max_tries = 5)
+    @backoff.on_exception(backoff.expo, (PipedriveInternalServiceError, simplejson.scanner.JSONDecodeError, ConnectionError, requests.Timeout), giveup=page_can_shrink, max_tries = 5)
     @backoff.on_exception(retry_after_wait_gen, PipedriveTooManyRequestsInSecondError, giveup=is_not_status_code_fn([429]), jitter=None, max_tries=3)
-    def execute_request(self, endpoint, params=None):
+    def execute_request(self, endpoint, params=None, streaming=False, meter=None, shrinkable=False):
         access_token = self.get_token()
         headers = {
             # 'User-Agent': self.config['user-agent'],
@@ -399,39 +651,65 @@ class PipedriveTap(object):
         }
         if params:
             _params.update(params)
-        BASE_URL = f"https://{self.config['account']}.pipedrive.com/api/v1"
-        url = "{}/{}".format(BASE_URL, endpoint)
+        url = "{}/{}".format(self.get_base_url(), endpoint)
         logger.debug('Firing request at {} with params: {}'.format(url, _params))
-        response = requests.get(url, headers=headers, params=_params)
+        with self.rate_governor.request():
+            # the body is read by BodyReader, which counts its bytes on the wire into meter
+            try:
+                response = self.session.get(url, headers=headers, params=_params, timeout=self.timeout, stream=True)
+            except requests.Timeout as e:
+                e.page_can_shrink = shrinkable
+                raise
+            self.rate_governor.update(response.headers, response.status_code)
+
+        body = BodyReader(response, meter)
+        if streaming and response.status_code == 200:
+            # a streaming page only decodes up to its first row here, a JSONDecodeError is retried
+            return StreamingPage(response, body.chunks(STREAM_CHUNK_SIZE))
+        body.read()
 
         if response.status_code == 200 and isinstance(response, requests.Response) :
             try:
-                # Verifying json is valid or not
-                response.json()
-                return response
+                # the body is decoded here once, a JSONDecodeError is retried
+                return PipedrivePage(response, decode_body(response, self.json_backend))
             except simplejson.scanner.JSONDecodeError as e:
                 raise e
         else:
-            raise_for_error(response)
+            try:
+                raise_for_error(response)
+            except PipedriveInternalServiceError as e:
+                e.page_can_shrink = shrinkable
+                raise
+
+    def get_base_url(self):
+        return self.config.get('base_url') or f"https://{self.config['account']}.pipedrive.com/api/v1"
 
-    def validate_response(self, response):
+    def validate_response(self, page):
         try:
-            payload = response.json()
-            if payload['success'] and 'data' in payload:
+            if page.succeeded:
                 return True
-        except (AttributeError, simplejson.scanner.JSONDecodeError): # Verifying response in execute_request
+        except AttributeError: # Verifying response in execute_request
             pass
 
-    def rate_throttling(self, response):
-        if all(x in response.headers for x in ['X-RateLimit-Remaining', 'X-RateLimit-Reset']):
-            if int(response.headers['X-RateLimit-Remaining']) < 1:
-                seconds_to_sleep = int(response.headers['X-RateLimit-Reset'])
-                logger.debug('Hit API rate limits, no remaining requests per 10 seconds, will sleep '
-                             'for {} seconds now.'.format(seconds_to_sleep))
-                time.sleep(seconds_to_sleep)
-        else:
-            logger.debug('Required headers for rate throttling are not present in response header, '
-                         'unable to throttle ..')
+
+def field_metadata_endpoint(stream):
+    return getattr(stream, 'metadata_endpoint', None) or getattr(stream, 'fields_endpoint', None)
+
+
+def index_field_metadata(fields, schema_mapping=None):
+    """
+    Field definitions by key and, for the custom fields of a dynamic stream, by the cleaned name
+    they have in its schema. The first definition of a key wins.
+    """
+    index = {}
+    for field in fields:
+        if isinstance(field, dict) and 'key' in field:
+            index.setdefault(field['key'], field)
+    for key, name in (schema_mapping or {}).items():
+        if key in index:
+            index.setdefault(name, index[key])
+    return index
+
 
 def raise_for_error(response):   
     try:
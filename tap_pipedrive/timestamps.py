@@ -0,0 +1,84 @@
+import calendar
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import pendulum
+
+
+CACHE_SIZE = 65536
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+_PIPEDRIVE_LAYOUT = re.compile(r'(\d{4})-(\d{2})-(\d{2}) (\d{2}):(\d{2}):(\d{2})', re.ASCII)
+_SINGER_LAYOUT = re.compile(r'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})\.(\d{6})Z', re.ASCII)
+
+
+def _fields(value):
+    """
+    Date and time fields of the two layouts rows carry: Pipedrive's 'YYYY-MM-DD HH:MM:SS' and the
+    'YYYY-MM-DDTHH:MM:SS.ffffffZ' singer's Transformer writes for date-time properties.
+    None for anything else.
+    """
+    match = _PIPEDRIVE_LAYOUT.fullmatch(value)
+    if match is not None:
+        year, month, day, hour, minute, second = match.groups()
+        return int(year), int(month), int(day), int(hour), int(minute), int(second), 0
+    match = _SINGER_LAYOUT.fullmatch(value)
+    if match is not None:
+        return tuple(int(field) for field in match.groups())
+    return None
+
+
+def to_epoch(dt):
+    """
+    Microseconds since the epoch of an aware datetime, as an int so comparisons are exact
+    """
+    return calendar.timegm(dt.utctimetuple()) * 1000000 + dt.microsecond
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_epoch(value):
+    """
+    to_epoch(pendulum.parse(value))
+    """
+    fields = _fields(value)
+    if fields is not None:
+        try:
+            # datetime validates the date, e.g. no February 30th
+            return (datetime(*fields) - _EPOCH) // _MICROSECOND
+        except ValueError:
+            pass
+    return to_epoch(pendulum.parse(value))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_datetime(value):
+    """
+    pendulum.parse(value), skipping the generic parser for the layouts of _fields
+    """
+    fields = _fields(value)
+    if fields is not None:
+        try:
+            return pendulum.datetime(*fields, tz='UTC')
+        except ValueError:
+            pass
+    return pendulum.parse(value)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def format_datetime(value):
+    """
+    singer.utils.strftime(singer.utils.strptime_to_utc(value)) for the layouts of _fields, None
+    for anything else
+    """
+    fields = _fields(value)
+    if fields is None:
+        return None
+    try:
+        datetime(*fields)
+    except ValueError:
+        return None
+    return '{:04d}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}.{:06d}Z'.format(*fields)
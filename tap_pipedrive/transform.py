@@ -0,0 +1,223 @@
+import singer
+from singer import metadata
+from singer.transform import string_to_datetime
+
+from tap_pipedrive.timestamps import format_datetime
+
+
+# what a converter returns for a value its schema doesn't accept, None is a valid result
+FAILED = object()
+
+
+def _convert_null(value):
+    return None if value is None or value == "" else FAILED
+
+
+def _convert_string(value):
+    if type(value) is str:
+        return value
+    if value is None:
+        return FAILED
+    try:
+        return str(value)
+    except Exception:
+        return FAILED
+
+
+def _convert_integer(value):
+    if type(value) is int:
+        return value
+    if isinstance(value, str):
+        value = value.replace(",", "")
+    try:
+        return int(value)
+    except Exception:
+        return FAILED
+
+
+def _convert_number(value):
+    if type(value) is float:
+        return value
+    if isinstance(value, str):
+        value = value.replace(",", "")
+    try:
+        return float(value)
+    except Exception:
+        return FAILED
+
+
+def _convert_boolean(value):
+    if type(value) is bool:
+        return value
+    if isinstance(value, str) and value.lower() == "false":
+        return False
+    try:
+        return bool(value)
+    except Exception:
+        return FAILED
+
+
+def _convert_datetime(value):
+    if value is None or value == "":
+        return FAILED
+    if type(value) is str:
+        formatted = format_datetime(value)
+        if formatted is not None:
+            return formatted
+    # singer's own parser, which also logs the values it can't read
+    formatted = string_to_datetime(value)
+    return FAILED if formatted is None else formatted
+
+
+def _convert_unknown(value):
+    return FAILED
+
+
+def _identity(value):
+    return value
+
+
+CONVERTERS = {
+    'string': _convert_string,
+    'integer': _convert_integer,
+    'number': _convert_number,
+    'boolean': _convert_boolean,
+}
+
+
+def _delegate(schema, path):
+    # objects, arrays and singer.decimal are rare in Pipedrive schemas, singer walks them as before
+    def convert(value):
+        success, result = singer.Transformer(singer.NO_INTEGER_DATETIME_PARSING).transform_recur(value, schema, path)
+        return result if success else FAILED
+    return convert
+
+
+def _first_of(converters):
+    """
+    The result of the first converter accepting the value, the way singer tries the types of a
+    property in order
+    """
+    if len(converters) == 1:
+        return converters[0]
+
+    if len(converters) == 2:
+        first, second = converters
+
+        def convert(value):
+            result = first(value)
+            return second(value) if result is FAILED else result
+        return convert
+
+    def convert(value):
+        for converter in converters:
+            result = converter(value)
+            if result is not FAILED:
+                return result
+        return FAILED
+    return convert
+
+
+def _ordered_types(schema):
+    types = schema["type"]
+    types = list(types) if isinstance(types, list) else [types]
+    # singer tries null last whatever its position
+    if "null" in types:
+        types.remove("null")
+        types.append("null")
+    return types
+
+
+def compile_property(schema, path):
+    """
+    A converter from a raw value to what singer.Transformer.transform_recur makes of it under
+    schema, FAILED where singer would report a schema mismatch
+    """
+    if "anyOf" in schema:
+        return _first_of([compile_property(subschema, path) for subschema in schema["anyOf"]])
+
+    if "type" not in schema:
+        return _identity
+
+    types = _ordered_types(schema)
+    if schema.get("format") == "singer.decimal":
+        return _delegate(schema, path)
+    if any(typ in ("object", "array") for typ in types) and schema.get("format") != "date-time":
+        return _delegate(schema, path)
+
+    converters = []
+    for typ in types:
+        if typ == "null":
+            converters.append(_convert_null)
+        elif schema.get("format") == "date-time":
+            converters.append(_convert_datetime)
+        else:
+            converters.append(CONVERTERS.get(typ, _convert_unknown))
+    if not converters:
+        return _convert_unknown
+    return _first_of(converters)
+
+
+def is_selected(stream_metadata, name):
+    """
+    Whether singer.Transformer.filter_data_by_metadata keeps the top level property name
+    """
+    breadcrumb = ('properties', name)
+    inclusion = metadata.get(stream_metadata, breadcrumb, 'inclusion')
+    if inclusion == 'automatic':
+        return True
+    return metadata.get(stream_metadata, breadcrumb, 'selected') is not False and inclusion != 'unsupported'
+
+
+def _compilable(schema, stream_metadata):
+    if "anyOf" in schema or "type" not in schema or schema.get("patternProperties"):
+        return False
+    if schema.get("format") in ("date-time", "singer.decimal") or not schema.get("properties"):
+        return False
+    if _ordered_types(schema)[0] != "object":
+        return False
+    # metadata on nested properties filters inside values, left to singer
+    return all(len(breadcrumb) <= 2 for breadcrumb in (stream_metadata or {}))
+
+
+class SchemaTransformer(object):
+    """
+    singer.Transformer(NO_INTEGER_DATETIME_PARSING).transform(row, schema, stream_metadata) for a
+    stream whose schema and metadata don't change during the sync.
+
+    The selected properties and a converter for each of them are worked out once, so a row costs
+    one dictionary lookup and converter call per key instead of a walk of the whole schema. Rows
+    a converter rejects go through singer's Transformer, which raises the SchemaMismatch it
+    always did, and so do schemas outside of what the converters cover.
+    """
+
+    def __init__(self, schema, stream_metadata=None):
+        self.schema = schema
+        self.metadata = stream_metadata
+        self.converters = None
+        if _compilable(schema, stream_metadata):
+            self.converters = {
+                name: compile_property(property_schema, [name])
+                for name, property_schema in schema["properties"].items()
+                if not stream_metadata or is_selected(stream_metadata, name)
+            }
+
+    def transform(self, row):
+        converters = self.converters
+        if converters is None or type(row) is not dict:
+            return self.singer_transform(row)
+
+        result = {}
+        for key, value in row.items():
+            convert = converters.get(key)
+            if convert is None:
+                continue
+            value = convert(value)
+            if value is FAILED:
+                return self.singer_transform(row)
+            result[key] = value
+        return result
+
+    def singer_transform(self, row):
+        with singer.Transformer(singer.NO_INTEGER_DATETIME_PARSING) as transformer:
+            return transformer.transform(row, self.schema, self.metadata)
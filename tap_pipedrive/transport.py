@@ -0,0 +1,241 @@
+import threading
+import zlib
+
+import requests
+import singer
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ChunkedEncodingError, ConnectionError, ContentDecodingError, SSLError
+from urllib3.exceptions import ProtocolError, ReadTimeoutError, SSLError as Urllib3SSLError
+from urllib3.util.retry import Retry
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+logger = singer.get_logger()
+
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 300
+DEFAULT_MAX_RETRIES = 3
+# bodies are read and inflated in chunks of this size
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def build_session(config):
+    """
+    Keep-alive HTTP session shared by every request the tap makes.
+
+    Status based retries stay with the backoff decorators on execute_request,
+    the adapter only retries failed connects.
+    """
+    pool_size = int(config.get('http_pool_size', DEFAULT_POOL_SIZE))
+    max_retries = Retry(total=int(config.get('http_max_retries', DEFAULT_MAX_RETRIES)),
+                        read=0,
+                        status=0,
+                        redirect=None,
+                        raise_on_status=False,
+                        backoff_factor=0.5)
+
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=max_retries)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept-Encoding'] = accept_encoding(config)
+    return session
+
+
+def accept_encoding(config):
+    """
+    gzip and deflate, and br when the brotli package is installed, unless http_compression is off
+    """
+    if str(config.get('http_compression', True)).lower() == 'false':
+        return 'identity'
+    return 'gzip, deflate, br' if brotli is not None else 'gzip, deflate'
+
+
+def get_timeout(config):
+    return (float(config.get('http_connect_timeout', DEFAULT_CONNECT_TIMEOUT)),
+            float(config.get('http_read_timeout', DEFAULT_READ_TIMEOUT)))
+
+
+class _Identity(object):
+    def decompress(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+
+class _Brotli(object):
+    def __init__(self):
+        self.decompressor = brotli.Decompressor()
+
+    def decompress(self, data):
+        return self.decompressor.process(data)
+
+    def flush(self):
+        return b''
+
+
+class _Gzip(object):
+    """
+    A gzip body of one or more members, as urllib3's GzipDecoder: the bytes after a member
+    start the next one, garbage after the first member is ignored
+    """
+
+    def __init__(self):
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.more_members = False
+        self.done = False
+
+    def decompress(self, data):
+        decoded = b''
+        while data and not self.done:
+            try:
+                decoded += self.decompressor.decompress(data)
+            except zlib.error:
+                self.done = True
+                if self.more_members:
+                    break
+                raise
+            data = self.decompressor.unused_data
+            if data:
+                self.more_members = True
+                self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        return decoded
+
+    def flush(self):
+        return b'' if self.done else self.decompressor.flush()
+
+
+class _Deflate(object):
+    """
+    A deflate body, zlib wrapped as the RFC says or raw as some servers send it, told apart on
+    its first bytes as urllib3's DeflateDecoder does
+    """
+
+    def __init__(self):
+        self.decompressor = zlib.decompressobj()
+        self.first_bytes = b''
+        self.detected = False
+
+    def decompress(self, data):
+        if self.detected or not data:
+            return self.decompressor.decompress(data)
+        self.first_bytes += data
+        try:
+            decoded = self.decompressor.decompress(data)
+        except zlib.error:
+            self.detected = True
+            self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self.decompressor.decompress(self.first_bytes)
+        if decoded:
+            self.detected = True
+            self.first_bytes = b''
+        return decoded
+
+    def flush(self):
+        return self.decompressor.flush()
+
+
+def make_decoder(content_encoding):
+    """
+    Inflates a body of the given Content-Encoding chunk by chunk. An encoding that wasn't asked
+    for is passed through, as urllib3 does.
+    """
+    encoding = (content_encoding or '').strip().lower()
+    if encoding in ('gzip', 'x-gzip'):
+        return _Gzip()
+    if encoding == 'deflate':
+        return _Deflate()
+    if encoding == 'br' and brotli is not None:
+        return _Brotli()
+    return _Identity()
+
+
+class TransferMeter(object):
+    """
+    Bytes of the responses of a stream as they came over the wire and once decoded
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+
+    def add(self, wire_bytes, decoded_bytes):
+        with self.lock:
+            self.wire_bytes += wire_bytes
+            self.decoded_bytes += decoded_bytes
+
+    def log_metrics(self, tags=None):
+        with self.lock:
+            wire_bytes, decoded_bytes = self.wire_bytes, self.decoded_bytes
+        singer.metrics.log(logger, singer.metrics.Point('counter', 'http_wire_bytes', wire_bytes, tags or {}))
+        singer.metrics.log(logger, singer.metrics.Point('counter', 'http_decoded_bytes', decoded_bytes, tags or {}))
+
+
+class BodyReader(object):
+    """
+    Reads the body of a response requested with stream=True as it came over the wire and inflates
+    it, counting both sizes into a TransferMeter. A response whose content was read already (or
+    which isn't a requests.Response) counts its content for both.
+    """
+
+    def __init__(self, response, meter=None):
+        self.response = response
+        self.meter = meter
+
+    @property
+    def unread(self):
+        response = self.response
+        return isinstance(response, requests.Response) and response._content is False and response.raw is not None
+
+    def chunks(self, chunk_size=READ_CHUNK_SIZE):
+        if not self.unread:
+            content = self.read()
+            if content:
+                yield content
+            return
+
+        decoder = make_decoder(self.response.headers.get('Content-Encoding'))
+        # the errors requests raises while it reads a body
+        try:
+            for chunk in self.response.raw.stream(chunk_size, decode_content=False):
+                data = decoder.decompress(chunk)
+                self.count(len(chunk), len(data))
+                if data:
+                    yield data
+            data = decoder.flush()
+        except ProtocolError as e:
+            raise ChunkedEncodingError(e)
+        except zlib.error as e:
+            raise ContentDecodingError(e)
+        except ReadTimeoutError as e:
+            raise ConnectionError(e)
+        except Urllib3SSLError as e:
+            raise SSLError(e)
+        self.count(0, len(data))
+        if data:
+            yield data
+
+    def read(self):
+        """
+        Reads the whole body into response.content
+        """
+        if not self.unread:
+            content = self.response.content
+            self.count(len(content), len(content))
+            return content
+        content = b''.join(self.chunks())
+        self.response._content = content
+        self.response._content_consumed = True
+        return content
+
+    def count(self, wire_bytes, decoded_bytes):
+        if self.meter is not None:
+            self.meter.add(wire_bytes, decoded_bytes)
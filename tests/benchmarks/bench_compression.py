@@ -0,0 +1,51 @@
+"""
+Bytes received by a recents deals sync against a local stub which gzips its answers, with
+http_compression on and off and with both engines, as counted by the stream's TransferMeter.
+
+    python tests/benchmarks/bench_compression.py [pages]
+"""
+import contextlib
+import io
+import sys
+import time
+
+from bench_pagination import make_catalog, make_route
+from stub_server import StubServer, tap_config
+from tap_pipedrive.tap import PipedriveTap
+from tap_pipedrive.streams import RecentDealsStream
+
+MB = 1024 * 1024
+
+
+def run(label, server, **config):
+    tap = PipedriveTap(tap_config(server.base_url, **config), {})
+    stream = RecentDealsStream()
+    stream.tap = tap
+    tap.streams = [stream]
+    catalog = make_catalog(stream)
+    stream.schema_cache = None
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tap.do_sync(catalog)
+    elapsed = time.perf_counter() - started
+    transfer = stream.transfer
+    print('{:<32} {:>7.2f} s {:>8.2f} MB wire {:>8.2f} MB decoded {:>6.1f}x'.format(
+        label, elapsed, transfer.wire_bytes / MB, transfer.decoded_bytes / MB,
+        transfer.decoded_bytes / max(transfer.wire_bytes, 1)))
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    with StubServer(make_route(pages), compress=True) as server:
+        # the stub builds and gzips its pages on first use
+        run('warm-up', server)
+        run('sync, http_compression=false', server, http_compression=False)
+        run('sync', server)
+        run('sync, streaming_pages', server, streaming_pages=True)
+        run('async, http_compression=false', server, engine='async', http_compression=False)
+        run('async', server, engine='async')
+
+
+if __name__ == '__main__':
+    main()
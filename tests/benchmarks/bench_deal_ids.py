@@ -0,0 +1,68 @@
+"""
+Selection of the deals to fetch the flow/products of from pages of 500 deals with distinct
+timestamps, the former two passes parsing every timestamp with pendulum against the single pass
+over epochs.
+
+    python tests/benchmarks/bench_deal_ids.py [pages]
+"""
+import random
+import sys
+import time
+
+import pendulum
+
+from tap_pipedrive.streams import DealStageChangeStream
+from tap_pipedrive.timestamps import parse_epoch
+
+DEALS = 500
+
+
+def make_pages(pages):
+    rng = random.Random(0)
+    base = pendulum.datetime(2020, 1, 1, tz='UTC').int_timestamp
+
+    def timestamp():
+        if rng.random() < 0.2:
+            return None
+        return pendulum.from_timestamp(base + rng.randrange(365 * 86400)).format('YYYY-MM-DD HH:mm:ss')
+
+    return [[{'id': page * DEALS + i, 'add_time': timestamp(), 'stage_change_time': timestamp()} for i in range(DEALS)]
+            for page in range(pages)]
+
+
+def by_parsing(data, start, stop):
+    added_ids = [data[i]['id']
+                 for i in range(len(data))
+                 if (data[i]['add_time'] is not None
+                     and start <= pendulum.parse(data[i]['add_time']) < stop)]
+    changed_ids = [data[i]['id']
+                   for i in range(len(data))
+                   if (data[i]['id'] not in added_ids)
+                   and (data[i]['stage_change_time'] is not None
+                        and start <= pendulum.parse(data[i]['stage_change_time']) < stop)]
+    return added_ids + changed_ids
+
+
+def measure(label, fn, pages, start, stop):
+    parse_epoch.cache_clear()
+    started = time.perf_counter()
+    for page in pages:
+        fn(page, start, stop)
+    elapsed = time.perf_counter() - started
+    print('{:<20} {:>8.2f} ms/page {:>10.0f} deals/s'.format(label, elapsed * 1000 / len(pages),
+                                                            len(pages) * DEALS / elapsed))
+
+
+def main():
+    pages = make_pages(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
+    start = pendulum.datetime(2020, 4, 1, tz='UTC')
+    stop = pendulum.datetime(2020, 10, 1, tz='UTC')
+    stream = DealStageChangeStream()
+    assert all(stream.find_deal_ids(page, start, stop) == by_parsing(page, start, stop) for page in pages[:2])
+
+    measure('pendulum.parse', by_parsing, pages, start, stop)
+    measure('find_deal_ids', stream.find_deal_ids, pages, start, stop)
+
+
+if __name__ == '__main__':
+    main()
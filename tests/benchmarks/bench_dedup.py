@@ -0,0 +1,63 @@
+"""
+Duplicate suppression over 10^6 row ids (5% duplicates), the old list membership
+check is timed on a smaller sample since it is quadratic.
+
+    python tests/benchmarks/bench_dedup.py
+"""
+import random
+import sys
+import time
+import tracemalloc
+
+from tap_pipedrive.dedup import DedupIndex
+
+
+def make_ids(n):
+    ids = list(range(1, n + 1))
+    ids += random.sample(ids, n // 20)
+    random.shuffle(ids)
+    return ids
+
+
+def with_list(ids):
+    seen = []
+    for i in ids:
+        if i not in seen:
+            seen.append(i)
+    return seen
+
+
+def with_index(**kwargs):
+    def run(ids):
+        index = DedupIndex(**kwargs)
+        for i in ids:
+            index.add(i)
+        return index
+    return run
+
+
+def measure(label, fn, ids):
+    started = time.perf_counter()
+    fn(ids)
+    elapsed = time.perf_counter() - started
+
+    # second pass for memory, tracing allocations would skew the timing
+    tracemalloc.start()
+    kept = fn(ids)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del kept
+    print('{:<28} {:>9} rows {:>12.0f} rows/s {:>8.1f} MB'.format(label, len(ids), len(ids) / elapsed, peak / 2 ** 20))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    ids = make_ids(n)
+    measure('list (before)', with_list, ids[:20000])
+    measure('set', with_index(), ids)
+    measure('bitmap', with_index(bitmap=True), ids)
+    measure('set, max 100k ids', with_index(max_size=100000), ids)
+
+
+if __name__ == '__main__':
+    main()
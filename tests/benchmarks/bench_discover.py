@@ -0,0 +1,44 @@
+"""
+Wall time of discover with field metadata (return_dict) against a local stub, every *Fields
+endpoint answering with the same number of custom fields.
+
+    python tests/benchmarks/bench_discover.py [custom_fields] [latency_seconds]
+"""
+import sys
+import time
+
+from fixtures import custom_field_key
+from stub_server import StubServer, make_page, tap_config
+from tap_pipedrive.tap import PipedriveTap
+
+
+def make_route(custom_fields):
+    fields = [{'id': i, 'key': custom_field_key(i), 'name': 'Custom field {}'.format(i), 'field_type': 'varchar',
+               'mandatory_flag': False, 'edit_flag': True} for i in range(custom_fields)]
+
+    def route(path, params):
+        start = int(params.get('start', 0))
+        limit = int(params.get('limit', 100))
+        return 200, make_page(fields[start:start + limit], start, start + limit < len(fields)), {}
+    return route
+
+
+def run(label, server, **config):
+    tap = PipedriveTap(tap_config(server.base_url, **config), {})
+    tap.streams = [type(stream)() for stream in PipedriveTap.streams]
+
+    started = time.perf_counter()
+    tap.do_discover(return_dict=True)
+    print('{:<28} {:>8.2f} s'.format(label, time.perf_counter() - started))
+
+
+def main():
+    custom_fields = int(sys.argv[1]) if len(sys.argv) > 1 else 1500
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    with StubServer(make_route(custom_fields), latency=latency) as server:
+        run('discover_concurrency=1', server, discover_concurrency=1)
+        run('discover_concurrency=10', server)
+
+
+if __name__ == '__main__':
+    main()
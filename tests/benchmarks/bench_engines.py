@@ -0,0 +1,64 @@
+"""
+Wall time of the sync and async engines against a local stub with injected latency: a recents
+deals sync, and a dealflow sync which requests the flow of every deal.
+
+    python tests/benchmarks/bench_engines.py [pages] [deals] [latency_seconds]
+"""
+import contextlib
+import io
+import re
+import sys
+import time
+
+from bench_pagination import make_catalog, make_route
+from stub_server import StubServer, make_page, tap_config
+from tap_pipedrive.tap import PipedriveTap
+from tap_pipedrive.streams import DealStageChangeStream, RecentDealsStream
+
+
+def make_deals_route(deals):
+    rows = [{'id': i, 'add_time': '2020-01-01 10:00:00', 'stage_change_time': None} for i in range(1, deals + 1)]
+
+    def route(path, params):
+        match = re.search(r'/deals/(\d+)/flow$', path)
+        if match:
+            deal_id = int(match.group(1))
+            flow = [{'id': deal_id * 10 + i, 'object': 'dealChange', 'timestamp': '2020-02-01 10:00:00',
+                     'data': {'id': deal_id * 10 + i, 'add_time': '2020-02-01 10:00:00'}} for i in range(3)]
+            return 200, make_page(flow), {}
+        start = int(params.get('start', 0))
+        limit = int(params.get('limit', 100))
+        return 200, make_page(rows[start:start + limit], start, start + limit < len(rows)), {}
+    return route
+
+
+def run(label, server, make_stream, **config):
+    tap = PipedriveTap(tap_config(server.base_url, **config), {})
+    stream = make_stream()
+    stream.tap = tap
+    tap.streams = [stream]
+    catalog = make_catalog(stream)
+    stream.schema_cache = None
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tap.do_sync(catalog)
+    print('{:<36} {:>8.2f} s'.format(label, time.perf_counter() - started))
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    deals = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+    with StubServer(make_route(pages), latency=latency) as server:
+        run('recents deals, sync', server, RecentDealsStream)
+        run('recents deals, sync prefetch_depth=2', server, RecentDealsStream, prefetch_depth=2)
+        run('recents deals, async prefetch_depth=2', server, RecentDealsStream, engine='async', prefetch_depth=2)
+    with StubServer(make_deals_route(deals), latency=latency) as server:
+        run('dealflow, sync', server, DealStageChangeStream)
+        run('dealflow, sync deal_concurrency=10', server, DealStageChangeStream, deal_concurrency=10)
+        run('dealflow, async', server, DealStageChangeStream, engine='async')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Requests per second against a local stub: bare requests.get (one connection per
+call, the previous transport) versus the tap's pooled session.
+
+    python tests/benchmarks/bench_http_session.py [n_requests]
+"""
+import sys
+import time
+
+import requests
+
+from stub_server import StubServer, make_page, tap_config
+from tap_pipedrive.tap import PipedriveTap
+
+
+def route(path, params):
+    return 200, make_page([{'id': 1, 'name': 'EUR'}]), {}
+
+
+def run(label, fn, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        fn()
+    elapsed = time.perf_counter() - started
+    print('{:<24} {:>8.0f} req/s'.format(label, n / elapsed))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with StubServer(route) as server:
+        tap = PipedriveTap(tap_config(server.base_url), {})
+        url = '{}/currencies'.format(server.base_url)
+        headers = {'Authorization': 'Bearer token'}
+
+        run('requests.get (before)', lambda: requests.get(url, headers=headers, params={'start': 0}).json(), n)
+        run('pooled session (after)', lambda: tap.execute_request('currencies', {'start': 0}), n)
+
+
+if __name__ == '__main__':
+    main()
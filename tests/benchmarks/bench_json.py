@@ -0,0 +1,60 @@
+"""
+Rows/sec decoding fixture pages and emitting their records with each JSON backend.
+
+    python tests/benchmarks/bench_json.py [pages]
+"""
+import gc
+import json
+import sys
+import time
+
+import simplejson
+import singer
+
+from fixtures import make_recents_page
+from tap_pipedrive.json_backend import JsonBackend, orjson
+
+
+def rate(label, fn, rows, repeat=3):
+    # best of a few runs, with collections of earlier results out of the way
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print('{:<36} {:>10.0f} rows/s'.format(label, rows / best))
+
+
+def main():
+    n_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    bodies = [json.dumps(make_recents_page(start=i * 100)).encode() for i in range(n_pages)]
+    records = [row['data'] for body in bodies for row in simplejson.loads(body)['data']]
+    rows = len(records)
+
+    def decode(loads):
+        def run():
+            for body in bodies:
+                loads(body)
+        return run
+
+    def emit(format_record):
+        def run():
+            for record in records:
+                format_record('deals', record)
+        return run
+
+    rate('decode requests/simplejson (before)', decode(simplejson.loads), rows)
+    rate('emit singer.write_record (before)',
+         emit(lambda stream, record: singer.messages.format_message(singer.RecordMessage(stream=stream, record=record))), rows)
+
+    backends = ['auto', 'orjson'] if orjson else ['auto']
+    for name in backends:
+        backend = JsonBackend(name)
+        rate('decode {}'.format(name), decode(backend.loads), rows)
+        rate('emit {}'.format(name), emit(backend.format_record), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Peak memory of a notes sync of one page of 500 rows with large HTML `content` (50 MB in all),
+the page decoded as a whole against streaming_pages. Each sync runs in its own process, the
+figure is the growth of its peak RSS over the sync.
+
+    python tests/benchmarks/bench_page_memory.py [rows] [megabytes]
+"""
+import contextlib
+import json
+import os
+import subprocess
+import sys
+
+from bench_pagination import make_catalog
+from stub_server import StubServer, make_page, tap_config
+from tap_pipedrive.tap import PipedriveTap
+from tap_pipedrive.streams import RecentNotesStream
+
+
+def make_route(rows, megabytes):
+    content_size = megabytes * 1024 * 1024 // rows
+    paragraph = '<p>Meeting notes, Müller &amp; Söhne: next steps agreed.</p>'
+    content = (paragraph * (content_size // len(paragraph) + 1))[:content_size]
+    data = [{'item': 'note', 'id': i, 'data': {'id': i, 'content': content, 'deal_id': i, 'active_flag': True,
+                                               'add_time': '2021-03-04 10:11:12', 'update_time': '2021-05-06 07:08:09'}}
+            for i in range(1, rows + 1)]
+    body = json.dumps(make_page(data)).encode()
+    fields = [{'key': key, 'name': key, 'field_type': 'varchar', 'mandatory_flag': False, 'edit_flag': False}
+              for key in ('content', 'add_time', 'update_time')]
+
+    def route(path, params):
+        if path.endswith('/noteFields'):
+            return 200, make_page(fields), {}
+        return 200, body, {}
+    return route, len(body)
+
+
+def read_status(field):
+    # kilobytes; ru_maxrss would count the parent's RSS from before the child's exec
+    with open('/proc/self/status') as status:
+        return next(int(line.split()[1]) for line in status if line.startswith(field + ':'))
+
+
+def sync(base_url, streaming):
+    tap = PipedriveTap(tap_config(base_url, streaming_pages=streaming), {})
+    stream = RecentNotesStream()
+    stream.tap = tap
+    tap.streams = [stream]
+    catalog = make_catalog(stream)
+
+    before = read_status('VmRSS')
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        tap.do_sync(catalog)
+    print(read_status('VmHWM') - before)
+
+
+def run(label, base_url, streaming):
+    child = subprocess.run([sys.executable, __file__, '--child', base_url, str(streaming)],
+                           capture_output=True, text=True, check=True)
+    print('{:<24} {:>8.1f} MB peak RSS growth'.format(label, int(child.stdout.split()[-1]) / 1024))
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    megabytes = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    route, body_size = make_route(rows, megabytes)
+    with StubServer(route) as server:
+        print('{} rows, {:.1f} MB page'.format(rows, body_size / 1024 / 1024))
+        run('decoded page', server.base_url, False)
+        run('streaming_pages', server.base_url, True)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        sync(sys.argv[2], sys.argv[3] == 'True')
+    else:
+        main()
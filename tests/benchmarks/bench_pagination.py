@@ -0,0 +1,71 @@
+"""
+Wall time of a recents deals sync against a local stub with injected latency, pages fetched one
+after another versus prefetched while the previous page is processed.
+
+    python tests/benchmarks/bench_pagination.py [pages] [latency_seconds]
+"""
+import contextlib
+import io
+import sys
+import time
+
+from singer import metadata
+from singer.catalog import Catalog, CatalogEntry, Schema
+
+from fixtures import custom_field_key, make_recents_page
+from stub_server import StubServer, make_page, tap_config
+from tap_pipedrive.tap import PipedriveTap
+from tap_pipedrive.streams import RecentDealsStream
+
+CUSTOM_FIELDS = 300
+ROWS = 100
+
+
+def make_route(pages):
+    fields = [{'key': custom_field_key(i), 'name': 'Custom field {}'.format(i), 'field_type': 'varchar',
+               'mandatory_flag': False, 'edit_flag': True} for i in range(CUSTOM_FIELDS)]
+    bodies = {}
+
+    def route(path, params):
+        if path.endswith('/dealFields'):
+            return 200, make_page(fields), {}
+        start = int(params.get('start', 0))
+        if start not in bodies:
+            page = make_recents_page(ROWS, CUSTOM_FIELDS, start)
+            page['additional_data']['pagination']['more_items_in_collection'] = start + ROWS < pages * ROWS
+            bodies[start] = page
+        return 200, bodies[start], {}
+    return route
+
+
+def make_catalog(stream):
+    schema = stream.get_schema()
+    mdata = metadata.to_map(metadata.get_standard_metadata(schema=schema, key_properties=stream.key_properties))
+    mdata[()]['selected'] = True
+    return Catalog([CatalogEntry(stream=stream.schema, tap_stream_id=stream.schema, key_properties=stream.key_properties,
+                                 schema=Schema.from_dict(schema), metadata=metadata.to_list(mdata))])
+
+
+def run(label, server, **config):
+    tap = PipedriveTap(tap_config(server.base_url, **config), {})
+    stream = RecentDealsStream()
+    stream.tap = tap
+    tap.streams = [stream]
+    catalog = make_catalog(stream)
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tap.do_sync(catalog)
+    print('{:<28} {:>8.2f} s'.format(label, time.perf_counter() - started))
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    with StubServer(make_route(pages), latency=latency) as server:
+        run('sequential pages', server)
+        run('prefetch_depth=2', server, prefetch_depth=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Rows/sec of the per-row key remapping and schema transform of process_page, the old inner loop
+against the per-sync RowPlan with singer's Transformer and with the compiled SchemaTransformer, on
+synthetic deals with 300 custom fields. Then deals with 800 custom fields of which 40 are
+selected, transformed whole against projected to the selected keys first.
+
+    python tests/benchmarks/bench_row_pipeline.py [rows]
+"""
+import copy
+import sys
+import time
+
+import singer
+from singer import metadata
+
+from fixtures import make_deal, custom_field_key
+from tap_pipedrive.row_plan import RowPlan
+from tap_pipedrive.streams import RecentDealsStream
+
+CUSTOM_FIELDS = 300
+WIDE_CUSTOM_FIELDS = 800
+SELECTED_CUSTOM_FIELDS = 40
+
+
+def make_plan(custom_fields=CUSTOM_FIELDS, selected=None):
+    stream = RecentDealsStream()
+    schema = copy.deepcopy(stream.load_schema())
+    key_map = {}
+    for i in range(custom_fields):
+        name = 'custom_field_{}'.format(i)
+        key_map[custom_field_key(i)] = name
+        schema['properties'][name] = {'type': ['string', 'null']}
+    mdata = metadata.to_map(metadata.get_standard_metadata(schema=schema, key_properties=['id']))
+    if selected is not None:
+        # the standard fields stay selected
+        for i in range(selected, custom_fields):
+            mdata[('properties', 'custom_field_{}'.format(i))]['selected'] = False
+    return RowPlan(schema, mdata, key_map)
+
+
+def before(plan, rows):
+    # the loop as it was: remap by popping keys, schema looked up for every row
+    with singer.Transformer(singer.NO_INTEGER_DATETIME_PARSING) as optimus_prime:
+        for row in rows:
+            for row_key in list(row.keys()):
+                if row_key in plan.key_map:
+                    row[plan.key_map[row_key]] = row.pop(row_key)
+            optimus_prime.transform(row, plan.schema, plan.metadata)
+
+
+def after(plan, rows):
+    with singer.Transformer(singer.NO_INTEGER_DATETIME_PARSING) as optimus_prime:
+        for row in rows:
+            optimus_prime.transform(plan.remap(row), plan.schema, plan.metadata)
+
+
+def compiled(plan, rows):
+    for row in rows:
+        plan.transform(row)
+
+
+def unprojected(plan, rows):
+    # remap and transform every key, the transformer dropping the unselected ones
+    for row in rows:
+        plan.transformer.transform(plan.remap(row))
+
+
+def remap_only_before(plan, rows):
+    for row in rows:
+        for row_key in list(row.keys()):
+            if row_key in plan.key_map:
+                row[plan.key_map[row_key]] = row.pop(row_key)
+
+
+def remap_only_after(plan, rows):
+    for row in rows:
+        plan.remap(row)
+
+
+def rate(label, fn, plan, n, custom_fields=CUSTOM_FIELDS):
+    rows = [make_deal(i, custom_fields) for i in range(n)]
+    started = time.perf_counter()
+    fn(plan, rows)
+    print('{:<28} {:>10.0f} rows/s'.format(label, n / (time.perf_counter() - started)))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    plan = make_plan()
+    rate('remap (before)', remap_only_before, plan, n)
+    rate('remap RowPlan (after)', remap_only_after, plan, n)
+    rate('remap+transform (before)', before, plan, n)
+    rate('remap+transform (after)', after, plan, n)
+    rate('remap+compiled transform', compiled, plan, n)
+
+    plan = make_plan(WIDE_CUSTOM_FIELDS, SELECTED_CUSTOM_FIELDS)
+    rate('40/800 selected, unprojected', unprojected, plan, n, WIDE_CUSTOM_FIELDS)
+    rate('40/800 selected, projected', compiled, plan, n, WIDE_CUSTOM_FIELDS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""
+Synthetic Pipedrive pages shaped like recents responses of the dynamic streams
+"""
+import hashlib
+import random
+
+
+def custom_field_key(i):
+    return hashlib.sha1(str(i).encode()).hexdigest()
+
+
+def make_deal(deal_id, custom_fields=300):
+    deal = {
+        'id': deal_id, 'title': 'Deal {} für Müller'.format(deal_id), 'value': round(random.random() * 10000, 2),
+        'currency': 'EUR', 'add_time': '2021-03-04 10:11:12', 'update_time': '2021-05-06 07:08:{:02d}'.format(deal_id % 60),
+        'stage_change_time': None, 'active': True, 'deleted': False, 'status': 'open', 'probability': None,
+        'stage_id': 3, 'pipeline_id': 1, 'user_id': 11,
+        'person_id': 42, 'org_id': None, 'products_count': 2,
+        'weighted_value': 12.5, 'formatted_value': '€12.50', 'visible_to': '3',
+    }
+    for i in range(custom_fields):
+        deal[custom_field_key(i)] = random.choice([None, 'text value {}'.format(i), str(i), '2021-01-01 10:00:00'])
+    return deal
+
+
+def make_recents_page(rows=100, custom_fields=300, start=0):
+    data = [{'item': 'deal', 'id': start + i, 'data': make_deal(start + i, custom_fields)} for i in range(1, rows + 1)]
+    return {'success': True, 'data': data,
+            'additional_data': {'since_timestamp': '2021-01-01 00:00:00', 'last_timestamp_on_page': '2021-05-06 07:08:09',
+                                'pagination': {'start': start, 'limit': rows, 'more_items_in_collection': True,
+                                               'next_start': start + rows}}}
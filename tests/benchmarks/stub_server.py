@@ -0,0 +1,83 @@
+"""
+Local HTTP server impersonating the Pipedrive API for benchmarks.
+"""
+import functools
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def make_page(rows, start=0, more_items=False):
+    pagination = {'start': start, 'limit': len(rows), 'more_items_in_collection': more_items}
+    if more_items:
+        pagination['next_start'] = start + len(rows)
+    return {'success': True, 'data': rows, 'additional_data': {'pagination': pagination}}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        status, payload, headers = self.server.route(url.path, params)
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        gzipped = self.server.compress and 'gzip' in self.headers.get('Accept-Encoding', '')
+        if gzipped:
+            body = self.server.gzip(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(object):
+    """
+    `route(path, params)` returns (status, payload, headers); payload is a dict or raw bytes.
+    With compress, bodies are gzipped for clients accepting gzip.
+    """
+    def __init__(self, route, latency=0, compress=False):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.route = route
+        self.httpd.latency = latency
+        self.httpd.compress = compress
+        self.httpd.gzip = functools.lru_cache(maxsize=64)(gzip.compress)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:{}/api/v1'.format(self.httpd.server_address[1])
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def tap_config(base_url, **extra):
+    config = {
+        'start_date': '2017-01-01T00:00:00Z',
+        'access_token': 'token',
+        'expires_in': int(time.time()) + 3600,
+        'base_url': base_url,
+    }
+    config.update(extra)
+    return config
@@ -0,0 +1,131 @@
+"""
+In-process stand-in for the Pipedrive API, patched over requests.Session.get
+"""
+import copy
+import io
+import json
+import re
+import threading
+import time
+from contextlib import redirect_stdout
+from unittest import mock
+
+import requests
+from singer import metadata
+from singer.catalog import Catalog, CatalogEntry, Schema
+
+import tap_pipedrive.tap as _tap
+from tap_pipedrive.streams import DealStageChangeStream
+
+
+def make_response(status_code, payload, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(payload).encode()
+    response._content_consumed = True
+    response.headers.update(headers or {})
+    return response
+
+
+def make_page(rows, start=0, limit=100):
+    more_items = start + limit < len(rows)
+    pagination = {'start': start, 'limit': limit, 'more_items_in_collection': more_items}
+    if more_items:
+        pagination['next_start'] = start + limit
+    return {'success': True, 'data': rows[start:start + limit], 'additional_data': {'pagination': pagination}}
+
+
+class FakeApi(object):
+    """
+    `collections` maps an endpoint (regex allowed) to the full list of rows, pages are cut from
+    it using the start/limit params of the request.
+    """
+    def __init__(self, collections, latency=0):
+        self.collections = collections
+        self.latency = latency
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def find_rows(self, endpoint):
+        for pattern, rows in self.collections.items():
+            if re.fullmatch(pattern, endpoint):
+                return rows(endpoint) if callable(rows) else rows
+        raise KeyError(endpoint)
+
+    def get(self, url, headers=None, params=None, timeout=None, **kwargs):
+        endpoint = url.split('/api/v1/', 1)[1]
+        params = params or {}
+        with self.lock:
+            self.calls.append((endpoint, dict(params)))
+        if self.latency:
+            time.sleep(self.latency)
+        rows = self.find_rows(endpoint)
+        return make_response(200, make_page(rows, int(params.get('start', 0)), int(params.get('limit', 100))))
+
+    def endpoints(self):
+        return [endpoint for endpoint, _ in self.calls]
+
+
+def tap_config(**extra):
+    config = {
+        'start_date': '2017-01-01T00:00:00Z',
+        'access_token': 'abc',
+        'expires_in': int(time.time()) + 3600,
+        'account': 'fake',
+    }
+    config.update(extra)
+    return config
+
+
+def make_catalog(stream, deselected=()):
+    schema = stream.get_schema()
+    mdata = metadata.to_map(metadata.get_standard_metadata(schema=schema,
+                                                           key_properties=stream.key_properties,
+                                                           replication_method=stream.replication_method))
+    mdata[()]['selected'] = True
+    for field in deselected:
+        mdata[('properties', field)]['selected'] = False
+    return Catalog([CatalogEntry(stream=stream.schema, tap_stream_id=stream.schema, key_properties=stream.key_properties,
+                                 schema=Schema.from_dict(schema), metadata=metadata.to_list(mdata))])
+
+
+def parse_messages(output):
+    return [json.loads(line) for line in output.splitlines() if line]
+
+
+def deals(count):
+    return [{'id': i, 'add_time': '2020-01-{:02d} 10:00:00'.format(i % 28 + 1), 'stage_change_time': None}
+            for i in range(1, count + 1)]
+
+
+def flow(endpoint):
+    """
+    The stage changes of deals/<id>/flow, id % 4 of them
+    """
+    deal_id = int(endpoint.split('/')[1])
+    return [{'id': deal_id * 1000 + i, 'add_time': '2020-02-01 10:00:{:02d}'.format(i), 'object': 'dealChange',
+             'timestamp': '2020-02-01 10:00:00', 'data': {'id': deal_id * 1000 + i}}
+            for i in range(deal_id % 4)]
+
+
+def run_sync(stream, get, state=None, interrupted_by=(), **config):
+    """
+    Syncs stream with requests.Session.get patched to get and returns the messages written. A sync
+    ended by one of interrupted_by returns the messages written until then, like a killed process.
+    """
+    pipedrive_tap = _tap.PipedriveTap(tap_config(**config), copy.deepcopy(state or {}))
+    pipedrive_tap.streams = [stream]
+    output = io.StringIO()
+    with mock.patch('requests.Session.get', side_effect=get), redirect_stdout(output):
+        try:
+            pipedrive_tap.do_sync(make_catalog(stream))
+        except interrupted_by:
+            pass
+        finally:
+            if pipedrive_tap.deal_index is not None:
+                pipedrive_tap.deal_index.close()
+    return parse_messages(output.getvalue())
+
+
+def run_dealflow(api, state=None, **kwargs):
+    return run_sync(DealStageChangeStream(), api.get, state, **kwargs)
@@ -0,0 +1,215 @@
+import asyncio
+import io
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from singer.catalog import Catalog
+
+from fake_api import FakeApi, deals, flow, make_response, tap_config, make_catalog, parse_messages
+import tap_pipedrive.tap as _tap
+from tap_pipedrive.exceptions import PipedriveTooManyRequestsInSecondError
+from tap_pipedrive.streams import DealStageChangeStream, RecentDealsStream, StagesStream
+
+try:
+    import aiohttp
+    from tap_pipedrive.async_engine import AsyncEngine
+except ImportError:
+    aiohttp = None
+
+
+def stages(count):
+    return [{'id': i, 'name': 'stage {}'.format(i), 'update_time': '2020-01-{:02d} 10:00:00'.format(i % 28 + 1)}
+            for i in range(1, count + 1)]
+
+
+def recent_deals(count):
+    deal = lambda i: {'id': i, 'title': 'Deal {}'.format(i), 'value': i * 10, 'c0ffee': 'custom {}'.format(i),
+                      'update_time': '2020-01-{:02d} 10:00:00'.format(i % 28 + 1)}
+    return [{'item': 'deal', 'id': i, 'data': deal(i)} for i in range(1, count + 1)]
+
+
+DEAL_FIELDS = [{'key': 'title', 'name': 'Title', 'field_type': 'varchar', 'mandatory_flag': False},
+               {'key': 'value', 'name': 'Value', 'field_type': 'monetary', 'mandatory_flag': False},
+               {'key': 'c0ffee', 'name': 'Custom', 'field_type': 'varchar', 'mandatory_flag': False}]
+
+
+COLLECTIONS = {'stages': stages(230), 'recents': recent_deals(340), 'dealFields': DEAL_FIELDS,
+               'deals': deals(150), r'deals/\d+/flow': flow}
+
+
+def async_send(api):
+    async def send(engine, url, headers, params, meter=None):
+        return api.get(url, headers=headers, params=params)
+    return send
+
+
+def run_sync(make_streams, api, **config):
+    streams = make_streams()
+    pipedrive_tap = _tap.PipedriveTap(tap_config(**config), {})
+    pipedrive_tap.streams = streams
+    for stream in streams:
+        stream.tap = pipedrive_tap
+    output = io.StringIO()
+    with mock.patch('requests.Session.get', side_effect=api.get), \
+            mock.patch.object(AsyncEngine, 'send', async_send(api)), redirect_stdout(output):
+        catalog = Catalog([entry for stream in streams for entry in make_catalog(stream).streams])
+        # the engines fetch the field definitions again
+        for stream in streams:
+            stream.schema_cache = None
+        pipedrive_tap.do_sync(catalog)
+    return parse_messages(output.getvalue())
+
+
+@unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+class TestAsyncEngine(unittest.TestCase):
+
+    def make_streams(self):
+        return [StagesStream(), RecentDealsStream()]
+
+    def test_output_matches_sync_engine(self):
+        expected = run_sync(self.make_streams, FakeApi(COLLECTIONS))
+        actual = run_sync(self.make_streams, FakeApi(COLLECTIONS), engine='async', prefetch_depth=2)
+
+        self.assertEqual(actual, expected)
+        records = [message for message in actual if message['type'] == 'RECORD']
+        self.assertEqual(len(records), 230 + 340)
+        self.assertIn('c0ffee', [record['record'] for record in records if record['stream'] == 'deals'][0])
+
+    def test_concurrent_streams_match_sync_engine(self):
+        expected = run_sync(self.make_streams, FakeApi(COLLECTIONS))
+        actual = run_sync(self.make_streams, FakeApi(COLLECTIONS, latency=0.001), engine='async',
+                          stream_concurrency=2)
+
+        by_stream = lambda messages, name: [message for message in messages if message.get('stream') == name]
+        for name in ('stages', 'deals'):
+            self.assertEqual(by_stream(actual, name), by_stream(expected, name))
+        self.assertEqual(actual[-1], expected[-1])
+
+    def test_deal_stream_matches_sync_engine(self):
+        make_streams = lambda: [DealStageChangeStream()]
+        expected = run_sync(make_streams, FakeApi(COLLECTIONS))
+        api = FakeApi(COLLECTIONS, latency=0.001)
+        actual = run_sync(make_streams, api, engine='async', deal_concurrency=8)
+
+        # the bookmark of a deal stream is taken from the clock when the walk started
+        self.assertEqual([message['type'] for message in actual], [message['type'] for message in expected])
+        self.assertEqual([message.get('record') for message in actual], [message.get('record') for message in expected])
+        self.assertEqual(len([message for message in actual if message['type'] == 'RECORD']),
+                         sum(i % 4 for i in range(1, 151)))
+        flow_calls = [endpoint for endpoint in api.endpoints() if endpoint.endswith('/flow')]
+        self.assertEqual(sorted(flow_calls), sorted(set(flow_calls)))
+        self.assertEqual(len(flow_calls), 150)
+
+    def test_fields_cache(self):
+        def load_schema(api, **config):
+            pipedrive_tap = _tap.PipedriveTap(tap_config(**config), {})
+            stream = RecentDealsStream()
+            stream.tap = pipedrive_tap
+            engine = AsyncEngine(pipedrive_tap)
+
+            async def load():
+                engine.token_lock = asyncio.Lock()
+                await engine.load_schema(stream)
+
+            with mock.patch.object(AsyncEngine, 'send', async_send(api)):
+                asyncio.run(load())
+            return stream.schema_cache
+
+        field_requests = lambda api: [params for endpoint, params in api.calls if endpoint == 'dealFields']
+        first, cached, revalidated = FakeApi(COLLECTIONS), FakeApi(COLLECTIONS), FakeApi(COLLECTIONS)
+        with tempfile.TemporaryDirectory() as directory:
+            schema = load_schema(first, fields_cache_dir=directory)
+            self.assertEqual(load_schema(cached, fields_cache_dir=directory), schema)
+            self.assertEqual(load_schema(revalidated, fields_cache_dir=directory, fields_cache_ttl=0), schema)
+
+        self.assertIn('c0ffee', schema['properties'])
+        self.assertEqual([params['start'] for params in field_requests(first)], [0])
+        self.assertEqual(field_requests(cached), [])
+        self.assertEqual(field_requests(revalidated), [{'limit': 1, 'start': 2}])
+
+    def test_too_many_requests_is_retried(self):
+        api = FakeApi(COLLECTIONS)
+        answers = [make_response(429, {'success': False, 'error': 'Rate limit'}, 
+                               {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '0'})]
+
+        async def send(engine, url, headers, params, meter=None):
+            if answers:
+                return answers.pop()
+            return api.get(url, headers=headers, params=params)
+
+        pipedrive_tap = _tap.PipedriveTap(tap_config(engine='async'), {})
+        pipedrive_tap.streams = [StagesStream()]
+        output = io.StringIO()
+        with mock.patch.object(AsyncEngine, 'send', send), redirect_stdout(output):
+            pipedrive_tap.do_sync(make_catalog(StagesStream()))
+
+        records = [message for message in parse_messages(output.getvalue()) if message['type'] == 'RECORD']
+        self.assertEqual(len(records), 230)
+
+    def test_adaptive_page_size_shrinks_on_the_first_server_error(self):
+        api = FakeApi(COLLECTIONS)
+        limits = []
+
+        async def send(engine, url, headers, params, meter=None):
+            limits.append(params['limit'])
+            if params['limit'] > 50:
+                return make_response(500, {'success': False, 'error': 'Server error'})
+            return api.get(url, headers=headers, params=params)
+
+        pipedrive_tap = _tap.PipedriveTap(tap_config(engine='async', page_size='adaptive'), {})
+        pipedrive_tap.streams = [StagesStream()]
+        output = io.StringIO()
+        with mock.patch.object(AsyncEngine, 'send', send), redirect_stdout(output):
+            pipedrive_tap.do_sync(make_catalog(StagesStream()))
+
+        self.assertEqual(limits[:3], [100, 50, 100])
+        records = [message for message in parse_messages(output.getvalue()) if message['type'] == 'RECORD']
+        self.assertEqual(len(records), 230)
+
+    def test_too_many_requests_gives_up(self):
+        async def send(engine, url, headers, params, meter=None):
+            return make_response(429, {'success': False, 'error': 'Rate limit'},
+                                 {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '0'})
+
+        pipedrive_tap = _tap.PipedriveTap(tap_config(engine='async'), {})
+        pipedrive_tap.streams = [StagesStream()]
+        with mock.patch.object(AsyncEngine, 'send', send), redirect_stdout(io.StringIO()):
+            with self.assertRaises(PipedriveTooManyRequestsInSecondError):
+                pipedrive_tap.do_sync(make_catalog(StagesStream()))
+
+    def test_token_is_fetched_off_the_loop(self):
+        on_loop = []
+
+        def get_token(tap):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(True)
+            except RuntimeError:
+                on_loop.append(False)
+            return 'abc'
+
+        with mock.patch.object(_tap.PipedriveTap, 'get_token', get_token):
+            run_sync(self.make_streams, FakeApi(COLLECTIONS), engine='async')
+
+        self.assertTrue(on_loop)
+        self.assertNotIn(True, on_loop)
+
+    def test_cancelled_request_gives_its_slot_back(self):
+        pipedrive_tap = _tap.PipedriveTap(tap_config(engine='async'), {})
+        governor = pipedrive_tap.rate_governor
+        governor.blocked_until = governor.clock() + 60
+        engine = AsyncEngine(pipedrive_tap)
+
+        async def cancel_waiting_request():
+            engine.token_lock = asyncio.Lock()
+            request = asyncio.ensure_future(engine.send_request('stages'))
+            await asyncio.sleep(0.05)
+            self.assertEqual(governor.in_flight, 1)
+            request.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await request
+
+        asyncio.run(cancel_waiting_request())
+        self.assertEqual(governor.in_flight, 0)
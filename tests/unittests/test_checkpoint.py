@@ -0,0 +1,229 @@
+import os
+import tempfile
+import time
+import unittest
+
+import pendulum
+
+from fake_api import FakeApi, deals, flow, make_page, make_response, run_dealflow, run_sync
+from tap_pipedrive.streams import RecentDealsStream, StagesStream
+
+
+def recent_deals(count):
+    # updated a minute apart, in id order
+    updated = lambda i: pendulum.datetime(2020, 1, 1).add(minutes=i).to_datetime_string()
+    return [{'item': 'deal', 'id': i, 'data': {'id': i, 'title': 'Deal {}'.format(i), 'update_time': updated(i)}}
+            for i in range(1, count + 1)]
+
+
+class RecentsApi(object):
+    """
+    /recents as Pipedrive answers it: the items updated since since_timestamp in update_time order
+    """
+
+    def __init__(self, rows, latency=0):
+        self.rows = rows
+        self.latency = latency
+        self.calls = []
+
+    def get(self, url, headers=None, params=None, timeout=None, **kwargs):
+        self.calls.append(dict(params))
+        time.sleep(self.latency)
+        since = params['since_timestamp']
+        rows = sorted((row for row in self.rows if row['data']['update_time'] >= since),
+                      key=lambda row: (row['data']['update_time'], row['id']))
+        return make_response(200, make_page(rows, int(params['start']), int(params['limit'])))
+
+    def update(self, ids, update_time):
+        for row in self.rows:
+            if row['id'] in ids:
+                row['data']['update_time'] = update_time
+
+
+class Preempted(Exception):
+    pass
+
+
+def run_deals(get, state=None, **config):
+    stream = RecentDealsStream()
+    stream.get_field_definitions = lambda: []
+    return run_sync(stream, get, state, interrupted_by=Preempted, **config)
+
+
+def preempted_at(api, start):
+    def get(url, params=None, **kwargs):
+        if int(params['start']) >= start:
+            raise Preempted()
+        return api.get(url, params=params, **kwargs)
+    return get
+
+
+def states(messages):
+    return [message['value'] for message in messages if message['type'] == 'STATE']
+
+
+def record_ids(messages):
+    return [message['record']['id'] for message in messages if message['type'] == 'RECORD']
+
+
+def bookmark(deal_id):
+    return str(pendulum.datetime(2020, 1, 1).add(minutes=deal_id))
+
+
+class TestCheckpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = recent_deals(1000)
+
+    def test_checkpoint_every_pages(self):
+        messages = run_deals(RecentsApi(self.rows).get, checkpoint_every_pages=3)
+
+        resumes = [state['bookmarks']['deals'].get('resume') for state in states(messages)]
+        self.assertEqual([resume['bookmark'] for resume in resumes if resume], [bookmark(300), bookmark(600), bookmark(900)])
+        self.assertEqual({resume['since'] for resume in resumes if resume}, {'2017-01-01T00:00:00+00:00'})
+        self.assertEqual(states(messages)[-1]['bookmarks']['deals'], {'update_time': bookmark(1000)})
+        self.assertEqual(record_ids(messages), list(range(1, 1001)))
+
+    def test_checkpoint_every_seconds(self):
+        messages = run_deals(RecentsApi(self.rows, latency=0.01).get, checkpoint_every_seconds=0.001)
+
+        resumes = [state['bookmarks']['deals'].get('resume') for state in states(messages)]
+        self.assertEqual([resume['bookmark'] for resume in resumes if resume], [bookmark(i) for i in range(100, 1000, 100)])
+
+    def test_no_checkpoints_by_default(self):
+        messages = run_deals(RecentsApi(self.rows).get)
+        self.assertEqual(len(states(messages)), 3)
+
+    def test_preempted_run_resumes_from_its_last_checkpoint(self):
+        complete = run_deals(RecentsApi(self.rows).get)
+
+        preempted = run_deals(preempted_at(RecentsApi(self.rows), 900), checkpoint_every_pages=2)
+        self.assertEqual(states(preempted)[-1]['bookmarks']['deals']['resume']['bookmark'], bookmark(800))
+        self.assertEqual(states(preempted)[-1]['currently_syncing'], 'deals')
+
+        api = RecentsApi(self.rows)
+        resumed = run_deals(api.get, states(preempted)[-1], checkpoint_every_pages=2)
+        # the items updated since the checkpoint, from the first page
+        self.assertEqual([(params['since_timestamp'], params['start']) for params in api.calls],
+                         [('2020-01-01 13:19:59', 0), ('2020-01-01 13:19:59', 100), ('2020-01-01 13:19:59', 200)])
+        self.assertEqual(record_ids(resumed), list(range(800, 1001)))
+        self.assertEqual(sorted(set(record_ids(preempted) + record_ids(resumed))), list(range(1, 1001)))
+        self.assertEqual(states(resumed)[-1], states(complete)[-1])
+
+    def test_items_processed_before_the_checkpoint_are_updated_meanwhile(self):
+        preempted = run_deals(preempted_at(RecentsApi(self.rows), 900), checkpoint_every_pages=2)
+
+        # more than a page of the processed items move to the end of the listing
+        api = RecentsApi(self.rows)
+        api.update(set(range(1, 251)), '2020-02-01 00:00:00')
+        resumed = run_deals(api.get, states(preempted)[-1], checkpoint_every_pages=2)
+
+        self.assertEqual(record_ids(resumed), list(range(800, 1001)) + list(range(1, 251)))
+        self.assertEqual(sorted(set(record_ids(preempted) + record_ids(resumed))), list(range(1, 1001)))
+        self.assertEqual(states(resumed)[-1]['bookmarks']['deals'], {'update_time': '2020-02-01T00:00:00+00:00'})
+
+    def test_checkpoint_of_another_bookmark_is_ignored(self):
+        state = {'currently_syncing': 'deals',
+                 'bookmarks': {'deals': {'update_time': '2017-01-01T00:00:00+00:00',
+                                         'resume': {'since': '2016-01-01T00:00:00+00:00', 'bookmark': bookmark(800)}}}}
+        api = RecentsApi(self.rows)
+        messages = run_deals(api.get, state)
+
+        self.assertEqual((api.calls[0]['since_timestamp'], api.calls[0]['start']), ('2016-12-31 23:59:59', 0))
+        self.assertEqual(record_ids(messages), list(range(1, 1001)))
+        self.assertNotIn('resume', states(messages)[-1]['bookmarks']['deals'])
+
+    def test_streams_not_listed_by_their_bookmark_start_over(self):
+        stages = [{'id': i, 'name': 'Stage {}'.format(i), 'add_time': '2020-01-01 10:00:00'} for i in range(1, 351)]
+        messages = run_sync(StagesStream(), FakeApi({'stages': stages}).get, checkpoint_every_pages=1)
+
+        self.assertFalse(any('resume' in state['bookmarks']['stages'] for state in states(messages)))
+
+
+def failing_flow(deal_id):
+    def get_flow(endpoint):
+        if endpoint == 'deals/{}/flow'.format(deal_id):
+            raise Preempted()
+        return flow(endpoint)
+    return get_flow
+
+
+def flow_records(messages):
+    return [record_id // 1000 for record_id in record_ids(messages)]
+
+
+class TestDealWalkCheckpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.collections = {'deals': deals(250), r'deals/\d+/flow': flow}
+
+    def test_interrupted_walk_resumes_after_the_last_synced_deal(self):
+        complete = run_dealflow(FakeApi(self.collections))
+
+        preempted = run_dealflow(FakeApi(dict(self.collections, **{r'deals/\d+/flow': failing_flow(180)})),
+                                 checkpoint_every_pages=7, interrupted_by=Preempted)
+        resume = states(preempted)[-1]['bookmarks']['dealflow']['resume']
+        self.assertEqual(resume['start'], 100)
+        self.assertEqual(resume['deal_id'], 175)
+
+        api = FakeApi(self.collections)
+        resumed = run_dealflow(api, states(preempted)[-1], checkpoint_every_pages=7)
+        listing = [params['start'] for endpoint, params in api.calls if endpoint == 'deals']
+        self.assertEqual(listing, [100, 200])
+        fetched = [int(endpoint.split('/')[1]) for endpoint in api.endpoints() if endpoint.endswith('/flow')]
+        self.assertEqual(fetched, list(range(176, 251)))
+
+        self.assertEqual(flow_records(resumed), [deal_id for deal_id in flow_records(complete) if deal_id > 175])
+        # the bookmark is taken from when the interrupted walk started
+        self.assertEqual(states(resumed)[-1]['bookmarks']['dealflow'], {
+            'add_time': str(pendulum.parse(resume['stream_start']).subtract(hours=3))})
+
+    def test_concurrent_walk_checkpoints_completed_deals(self):
+        preempted = run_dealflow(FakeApi(dict(self.collections, **{r'deals/\d+/flow': failing_flow(130)})),
+                                 checkpoint_every_pages=1, deal_concurrency=4, interrupted_by=Preempted)
+        resume = states(preempted)[-1]['bookmarks']['dealflow']['resume']
+        self.assertEqual(resume['deal_id'], 129)
+
+        api = FakeApi(self.collections)
+        run_dealflow(api, states(preempted)[-1], deal_concurrency=4)
+        fetched = [int(endpoint.split('/')[1]) for endpoint in api.endpoints() if endpoint.endswith('/flow')]
+        self.assertEqual(sorted(fetched), list(range(130, 251)))
+
+    def preempted_walk(self, **config):
+        preempted = run_dealflow(FakeApi(dict(self.collections, **{r'deals/\d+/flow': failing_flow(180)})),
+                                 checkpoint_every_pages=7, interrupted_by=Preempted, **config)
+        resume = states(preempted)[-1]['bookmarks']['dealflow']['resume']
+        self.assertEqual((resume['start'], resume['deal_id']), (100, 175))
+        return states(preempted)[-1]
+
+    def resumed_flows(self, state, **config):
+        api = FakeApi(self.collections)
+        run_dealflow(api, state, **config)
+        return api, [int(endpoint.split('/')[1]) for endpoint in api.endpoints() if endpoint.endswith('/flow')]
+
+    def test_deleted_deals_move_the_resumed_deal_to_the_page_before(self):
+        state = self.preempted_walk()
+        # deal 175 and the four after it are on the first page now
+        self.collections['deals'] = self.collections['deals'][80:]
+
+        api, fetched = self.resumed_flows(state)
+        self.assertEqual([params['start'] for endpoint, params in api.calls if endpoint == 'deals'], [100, 0, 100])
+        self.assertEqual(fetched, list(range(176, 251)))
+
+    def test_walk_starts_over_when_the_resumed_deal_is_gone(self):
+        state = self.preempted_walk()
+        self.collections['deals'] = [deal for deal in self.collections['deals'] if deal['id'] != 175]
+
+        api, fetched = self.resumed_flows(state)
+        self.assertEqual([params['start'] for endpoint, params in api.calls if endpoint == 'deals'], [100, 0, 100, 200])
+        self.assertEqual(fetched, [deal_id for deal_id in range(1, 251) if deal_id != 175])
+
+    def test_resume_with_a_deal_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = {'deal_index_path': os.path.join(directory, 'deals.sqlite')}
+            for deal in self.collections['deals']:
+                deal['update_time'] = '2020-03-01 10:00:00'
+            state = self.preempted_walk(**config)
+
+            _, fetched = self.resumed_flows(state, **config)
+            self.assertEqual(fetched, list(range(176, 251)))
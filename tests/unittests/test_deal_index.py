@@ -0,0 +1,126 @@
+import os
+import tempfile
+import unittest
+
+from fake_api import FakeApi, deals, flow, run_sync
+from tap_pipedrive.deal_index import DealIndex, fingerprint
+from tap_pipedrive.streams import DealStageChangeStream, DealsProductsStream
+
+
+STATE = {'bookmarks': {'dealflow': {'add_time': '2020-01-01T00:00:00+00:00'},
+                       'deal_products': {'add_time': '2020-01-01T00:00:00+00:00'}}}
+
+
+def indexed_deals(count):
+    return [dict(deal, update_time='2020-03-01 10:00:00', products_count=deal['id'] % 3) for deal in deals(count)]
+
+
+def run(stream_class, api, state=STATE, **config):
+    return run_sync(stream_class(), api.get, state, **config)
+
+
+def sub_resource_calls(api):
+    return [endpoint for endpoint in api.endpoints() if endpoint.startswith('deals/')]
+
+
+class TestDealIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'index', 'deals.sqlite')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_staged_fingerprints_are_kept_once_committed(self):
+        index = DealIndex(self.path)
+        index.stage('dealflow', 1, 'a', 3)
+        self.assertEqual(index.fingerprints('dealflow', [1]), {})
+        index.commit('dealflow')
+        index.close()
+
+        index = DealIndex(self.path)
+        self.assertEqual(index.fingerprints('dealflow', [1, 2]), {1: 'a'})
+        self.assertEqual(index.fingerprints('deal_products', [1]), {})
+        index.close()
+
+    def test_lookup_of_many_ids(self):
+        index = DealIndex(self.path)
+        for deal_id in range(2000):
+            index.stage('dealflow', deal_id, str(deal_id), 0)
+        index.commit('dealflow')
+        self.assertEqual(len(index.fingerprints('dealflow', range(0, 4000, 2))), 1000)
+        index.close()
+
+    def test_unreadable_file_is_rebuilt(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'wb') as index_file:
+            index_file.write(b'not a database' * 100)
+
+        index = DealIndex(self.path)
+        self.assertEqual(index.fingerprints('dealflow', [1]), {})
+        index.close()
+
+    def test_fingerprint(self):
+        deal = indexed_deals(1)[0]
+        self.assertNotEqual(fingerprint(deal), fingerprint(dict(deal, products_count=7)))
+        self.assertNotEqual(fingerprint(deal), fingerprint(dict(deal, stage_change_time='2020-02-01 00:00:00')))
+        self.assertIsNone(fingerprint(dict(deal, update_time=None)))
+
+
+class TestSkippingUnchangedDeals(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.config = {'deal_index_path': os.path.join(self.directory.name, 'deals.sqlite')}
+        self.deals = indexed_deals(120)
+        self.collections = {'deals': self.deals, r'deals/\d+/flow': flow, r'deals/\d+/products': flow}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_unchanged_deals_are_skipped(self):
+        first = FakeApi(self.collections)
+        run(DealStageChangeStream, first, **self.config)
+        self.assertEqual(len(sub_resource_calls(first)), 120)
+
+        second = FakeApi(self.collections)
+        messages = run(DealStageChangeStream, second, **self.config)
+        self.assertEqual(sub_resource_calls(second), [])
+        self.assertEqual([message for message in messages if message['type'] == 'RECORD'], [])
+
+        self.deals[4]['update_time'] = '2020-03-02 10:00:00'
+        self.deals[9]['products_count'] = 9
+        third = FakeApi(self.collections)
+        messages = run(DealStageChangeStream, third, deal_concurrency=4, **self.config)
+        self.assertCountEqual(sub_resource_calls(third), ['deals/5/flow', 'deals/10/flow'])
+        self.assertEqual([message['record']['id'] for message in messages if message['type'] == 'RECORD'],
+                         [5000, 10000, 10001])
+
+    def test_streams_are_indexed_separately(self):
+        run(DealStageChangeStream, FakeApi(self.collections), **self.config)
+
+        api = FakeApi(self.collections)
+        run(DealsProductsStream, api, **self.config)
+        self.assertEqual(len(sub_resource_calls(api)), 120)
+
+    def test_nothing_is_remembered_without_the_state(self):
+        def failing(endpoint):
+            if endpoint == 'deals/60/flow':
+                raise ConnectionResetError('deal 60')
+            return flow(endpoint)
+
+        with self.assertRaises(ConnectionResetError):
+            run(DealStageChangeStream, FakeApi(dict(self.collections, **{r'deals/\d+/flow': failing})), **self.config)
+
+        api = FakeApi(self.collections)
+        run(DealStageChangeStream, api, **self.config)
+        self.assertEqual(len(sub_resource_calls(api)), 120)
+
+    def test_deleted_index_syncs_every_deal(self):
+        run(DealStageChangeStream, FakeApi(self.collections), **self.config)
+        os.remove(self.config['deal_index_path'])
+
+        api = FakeApi(self.collections)
+        run(DealStageChangeStream, api, **self.config)
+        self.assertEqual(len(sub_resource_calls(api)), 120)
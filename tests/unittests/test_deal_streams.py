@@ -0,0 +1,107 @@
+import random
+import unittest
+from unittest import mock
+
+import pendulum
+
+from fake_api import FakeApi, deals, flow, run_dealflow
+from tap_pipedrive.streams import DealStageChangeStream
+
+
+class TestDealFanOut(unittest.TestCase):
+
+    def setUp(self):
+        self.collections = {'deals': deals(250), r'deals/\d+/flow': flow}
+
+    def test_concurrent_output_matches_serial(self):
+        serial = run_dealflow(FakeApi(self.collections))
+        concurrent = run_dealflow(FakeApi(self.collections, latency=0.001), deal_concurrency=8)
+
+        records = [message for message in serial if message['type'] == 'RECORD']
+        self.assertEqual(len(records), sum(i % 4 for i in range(1, 251)))
+        self.assertEqual([message['type'] for message in serial], [message['type'] for message in concurrent])
+        self.assertEqual([message.get('record') for message in serial],
+                         [message.get('record') for message in concurrent])
+
+    def test_every_deal_fetched_once(self):
+        api = FakeApi(self.collections)
+        run_dealflow(api, deal_concurrency=4)
+
+        flow_calls = [endpoint for endpoint in api.endpoints() if endpoint.endswith('/flow')]
+        self.assertEqual(len(flow_calls), 250)
+        self.assertEqual(len(set(flow_calls)), 250)
+        self.assertEqual(api.endpoints().count('deals'), 3)
+
+
+class TestRecentsDealDiscovery(unittest.TestCase):
+
+    def setUp(self):
+        self.deals = deals(250)
+        # deals 1-3 had a stage change after the bookmark, the others after their add_time
+        for deal in self.deals:
+            deal['stage_change_time'] = '2020-02-0{} 10:00:00'.format(deal['id']) if deal['id'] <= 3 else None
+        self.state = {'bookmarks': {'dealflow': {'add_time': '2020-01-20T00:00:00+00:00'}}}
+        updated = [deal for deal in self.deals if deal['id'] <= 3 or deal['add_time'] >= '2020-01-20']
+        # recents lists a deal once per update, the second listing may be on a later page
+        self.recents = [{'item': 'deal', 'id': deal['id'], 'data': deal} for deal in updated + updated[:20]]
+
+    def test_output_matches_listing_every_deal(self):
+        collections = {'deals': self.deals, 'recents': self.recents, r'deals/\d+/flow': flow}
+        listing = run_dealflow(FakeApi(collections), self.state)
+        api = FakeApi(collections)
+        recents = run_dealflow(api, self.state, deal_discovery='recents')
+
+        # the listings page differently, which orders the deals differently
+        by_id = lambda messages: sorted((message['record'] for message in messages if message['type'] == 'RECORD'),
+                                        key=lambda record: record['id'])
+        records = by_id(listing)
+        self.assertEqual(by_id(recents), records)
+        self.assertTrue(any(record['id'] // 1000 <= 3 for record in records))
+        self.assertNotIn('deals', api.endpoints())
+
+        recents_calls = [params for endpoint, params in api.calls if endpoint == 'recents']
+        self.assertEqual(len(recents_calls), 2)
+        self.assertEqual({(params['items'], params['since_timestamp']) for params in recents_calls},
+                         {('deal', '2020-01-19 23:59:59')})
+        flow_calls = [endpoint for endpoint in api.endpoints() if endpoint.endswith('/flow')]
+        self.assertEqual(len(flow_calls), len(set(flow_calls)))
+
+    def test_unknown_discovery_is_rejected(self):
+        with self.assertRaisesRegex(ValueError, 'deal_discovery'):
+            run_dealflow(FakeApi({'deals': self.deals}), deal_discovery='everything')
+
+
+def find_deal_ids_by_parsing(data, start, stop):
+    # the former two passes with pendulum.parse and list membership
+    added_ids = [deal['id'] for deal in data
+                 if deal['add_time'] is not None and start <= pendulum.parse(deal['add_time']) < stop]
+    changed_ids = [deal['id'] for deal in data
+                   if deal['id'] not in added_ids
+                   and deal['stage_change_time'] is not None and start <= pendulum.parse(deal['stage_change_time']) < stop]
+    return added_ids + changed_ids
+
+
+class TestFindDealIds(unittest.TestCase):
+
+    def test_matches_parsing_every_timestamp(self):
+        rng = random.Random(7)
+        times = [None, '2020-01-31 23:59:59', '2020-02-01 00:00:00', '2020-02-01 00:00:01', '2020-02-15 12:30:00',
+                 '2020-02-29 23:59:59', '2020-03-01 00:00:00', '2020-03-01 00:00:01', '2020-06-01 08:00:00']
+        # repeated ids as a page can list a deal twice
+        data = [{'id': rng.randint(1, 150), 'add_time': rng.choice(times), 'stage_change_time': rng.choice(times)}
+                for _ in range(500)]
+        start = pendulum.datetime(2020, 2, 1, tz='UTC')
+        stop = pendulum.datetime(2020, 3, 1, tz='UTC')
+
+        deal_ids = DealStageChangeStream().find_deal_ids(data, start, stop)
+        self.assertEqual(deal_ids, find_deal_ids_by_parsing(data, start, stop))
+        self.assertGreater(len(deal_ids), 100)
+
+    def test_bounds_with_microseconds(self):
+        data = [{'id': 1, 'add_time': '2020-02-01 10:00:00', 'stage_change_time': None},
+                {'id': 2, 'add_time': '2020-02-01 09:00:00', 'stage_change_time': '2020-02-01 10:00:01'}]
+        start = pendulum.datetime(2020, 2, 1, 9, 59, 59, 999999, tz='UTC')
+        stop = pendulum.datetime(2020, 2, 1, 10, 0, 0, 500000, tz='UTC')
+
+        self.assertEqual(DealStageChangeStream().find_deal_ids(data, start, stop), [1])
+        self.assertEqual(DealStageChangeStream().find_deal_ids(data, start, stop.add(seconds=1)), [1, 2])
@@ -0,0 +1,35 @@
+import unittest
+
+from tap_pipedrive.dedup import DedupIndex, BITMAP_MAX_ID
+
+
+class TestDedupIndex(unittest.TestCase):
+
+    def assert_dedups(self, index):
+        self.assertEqual([index.add(i) for i in [5, 1, 5, 900, 1, 'a', 'a', BITMAP_MAX_ID, BITMAP_MAX_ID]],
+                         [True, True, False, True, False, True, False, True, False])
+        self.assertEqual(index.skipped, 4)
+        self.assertIn(900, index)
+        self.assertNotIn(901, index)
+
+    def test_set(self):
+        self.assert_dedups(DedupIndex())
+
+    def test_bitmap(self):
+        index = DedupIndex(bitmap=True)
+        self.assert_dedups(index)
+        self.assertEqual(index.seen, {'a', BITMAP_MAX_ID})
+
+    def test_bounded_forgets_oldest_ids(self):
+        index = DedupIndex(max_size=2)
+        for i in [1, 2, 3]:
+            index.add(i)
+
+        self.assertNotIn(1, index)
+        self.assertTrue(index.add(1))
+        self.assertFalse(index.add(3))
+
+    def test_from_config(self):
+        index = DedupIndex.from_config({'dedup_index': 'bitmap', 'dedup_max_ids': '10'})
+        self.assertIsNotNone(index.bitmap)
+        self.assertEqual(index.max_size, 10)
@@ -0,0 +1,112 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from fake_api import FakeApi, make_response, tap_config
+import tap_pipedrive.tap as _tap
+
+
+def fields(endpoint):
+    return [{'key': '{}_{}'.format(endpoint, i), 'name': 'Field {}'.format(i), 'field_type': 'varchar',
+             'mandatory_flag': False} for i in range(120)]
+
+
+class ConcurrencyRecorder(object):
+    """
+    Wraps FakeApi.get and records the most requests it served at once
+    """
+    def __init__(self, api):
+        self.api = api
+        self.active = 0
+        self.most = 0
+        self.lock = threading.Lock()
+
+    def get(self, *args, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.most = max(self.most, self.active)
+        try:
+            return self.api.get(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def make_streams():
+    return [type(stream)() for stream in _tap.PipedriveTap.streams]
+
+
+def discover(api, return_dict=True, **config):
+    pipedrive_tap = _tap.PipedriveTap(tap_config(**config), {})
+    pipedrive_tap.streams = make_streams()
+    with mock.patch('requests.Session.get', side_effect=api.get):
+        catalog = pipedrive_tap.do_discover(return_dict=return_dict)
+    return catalog if return_dict else catalog.to_dict()
+
+
+class TestParallelDiscover(unittest.TestCase):
+
+    def test_catalog_matches_serial_discover(self):
+        serial = discover(FakeApi({r'\w+Fields': fields}), discover_concurrency=1)
+        parallel = discover(FakeApi({r'\w+Fields': fields}, latency=0.01), discover_concurrency=8)
+
+        self.assertEqual(parallel, serial)
+        self.assertEqual([stream['stream'] for stream in parallel['streams']],
+                         [stream.schema for stream in make_streams()])
+        self.assertEqual(discover(FakeApi({r'\w+Fields': fields}), return_dict=False, discover_concurrency=8),
+                         discover(FakeApi({r'\w+Fields': fields}), return_dict=False, discover_concurrency=1))
+
+    def test_fields_are_fetched_concurrently(self):
+        serial = FakeApi({r'\w+Fields': fields})
+        discover(serial, discover_concurrency=1)
+        recorder = ConcurrencyRecorder(FakeApi({r'\w+Fields': fields}, latency=0.05))
+        started = time.monotonic()
+        catalog = discover(recorder, discover_concurrency=16)
+        elapsed = time.monotonic() - started
+
+        # the *Fields of 6 dynamic streams, 2 pages each
+        self.assertEqual(sorted(recorder.api.endpoints()), sorted(serial.endpoints()))
+        self.assertEqual(len(serial.calls), 12)
+        self.assertGreater(recorder.most, 4)
+        self.assertLess(elapsed, len(serial.calls) * 0.05 / 2)
+        deals = next(stream for stream in catalog['streams'] if stream['stream'] == 'deals')
+        self.assertIn('dealFields_0', deals['schema']['properties'])
+
+    def test_forbidden_stream_is_left_out(self):
+        api = FakeApi({r'\w+Fields': fields})
+
+        def get(url, **kwargs):
+            if url.endswith('/personFields'):
+                return make_response(403, {'success': False, 'error': 'Scope'})
+            return api.get(url, **kwargs)
+
+        catalog = discover(mock.Mock(get=get), discover_concurrency=8)
+        self.assertNotIn('persons', [stream['stream'] for stream in catalog['streams']])
+        self.assertIn('deals', [stream['stream'] for stream in catalog['streams']])
+
+
+class TestFieldMetadata(unittest.TestCase):
+
+    def test_field_definitions_of_the_schema_are_reused(self):
+        api = FakeApi({r'\w+Fields': fields})
+        catalog = discover(api)
+
+        # activity types and deal products describe their properties with the *Fields the recent
+        # activities and products streams fetched for their schema
+        self.assertEqual(api.endpoints().count('activityFields'), 2)
+        self.assertEqual(api.endpoints().count('productFields'), 2)
+        activity_types = next(stream for stream in catalog['streams'] if stream['stream'] == 'activity_types')
+        self.assertTrue(all('field_meta' in value for value in activity_types['schema']['properties'].values()))
+
+    def test_custom_fields_are_joined_by_cleaned_name(self):
+        deal_fields = [{'key': 'title', 'name': 'Title', 'field_type': 'varchar', 'mandatory_flag': True},
+                       {'key': 'abc123', 'name': 'Deal Size (EUR)', 'field_type': 'int', 'mandatory_flag': False,
+                        'edit_flag': True}]
+        catalog = discover(FakeApi({'dealFields': deal_fields, r'\w+Fields': []}))
+
+        properties = next(stream for stream in catalog['streams'] if stream['stream'] == 'deals')['schema']['properties']
+        self.assertEqual(properties['deal_size_eur']['field_meta'], dict(deal_fields[1], label='Deal Size (EUR)'))
+        self.assertEqual(properties['title']['field_meta']['label'], 'Title')
+        self.assertEqual(properties['value']['field_meta'], {})
+        self.assertNotIn('label', deal_fields[1])
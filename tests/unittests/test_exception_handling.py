@@ -27,7 +27,7 @@ def get_mock_http_response(status_code, contents):
     response._content = contents.encode()
     return response
 
-@mock.patch('requests.get')
+@mock.patch('requests.Session.get')
 class TestExecuteRequestExceptionHandling(unittest.TestCase):
     """
     Test cases to verify if the exceptions are handled as expected while communicating with Pipedrive Environment 
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from fake_api import FakeApi, tap_config
+import tap_pipedrive.tap as _tap
+from tap_pipedrive.fields_cache import FieldsCache
+from tap_pipedrive.streams import RecentDealsStream
+
+
+def field(i, name=None):
+    return {'id': i, 'key': hashlib.sha1(str(i).encode()).hexdigest(), 'name': name or 'Custom {}'.format(i),
+            'field_type': 'varchar', 'mandatory_flag': False, 'edit_flag': True}
+
+
+def load_schema(api, **config):
+    stream = RecentDealsStream()
+    stream.tap = _tap.PipedriveTap(tap_config(**config), {})
+    with mock.patch('requests.Session.get', side_effect=api.get):
+        return stream.get_schema(), stream.schema_mapping
+
+
+class TestFieldsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fields = [field(i) for i in range(1, 251)]
+        self.api = FakeApi({'dealFields': self.fields})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def field_calls(self):
+        return [params for endpoint, params in self.api.calls if endpoint == 'dealFields']
+
+    def test_without_cache_dir_fields_are_fetched_every_time(self):
+        load_schema(self.api)
+        load_schema(self.api)
+        self.assertEqual(len(self.field_calls()), 6)
+
+    def test_fresh_cache_makes_no_calls(self):
+        schema, mapping = load_schema(self.api, fields_cache_dir=self.directory)
+        self.assertEqual(len(self.field_calls()), 3)
+
+        cached_schema, cached_mapping = load_schema(self.api, fields_cache_dir=self.directory)
+        self.assertEqual(len(self.field_calls()), 3)
+        self.assertEqual(cached_schema, schema)
+        self.assertEqual(cached_mapping, mapping)
+        self.assertIn('custom_250', schema['properties'])
+
+    def test_stale_cache_is_revalidated_with_one_call(self):
+        load_schema(self.api, fields_cache_dir=self.directory)
+        load_schema(self.api, fields_cache_dir=self.directory, fields_cache_ttl=0)
+
+        self.assertEqual(self.field_calls()[3:], [{'limit': 1, 'start': 249}])
+
+    def test_changed_fields_are_fetched_again(self):
+        load_schema(self.api, fields_cache_dir=self.directory)
+        self.fields.append(field(251))
+        schema, mapping = load_schema(self.api, fields_cache_dir=self.directory, fields_cache_ttl=0)
+
+        self.assertEqual(len(self.field_calls()), 3 + 1 + 3)
+        self.assertIn('custom_251', schema['properties'])
+
+        # the refetched definitions are cached again
+        load_schema(self.api, fields_cache_dir=self.directory)
+        self.assertEqual(len(self.field_calls()), 7)
+
+    def test_renamed_last_field_is_a_change(self):
+        load_schema(self.api, fields_cache_dir=self.directory)
+        self.fields[-1] = field(250, name='Region')
+        schema, mapping = load_schema(self.api, fields_cache_dir=self.directory, fields_cache_ttl=0)
+
+        self.assertIn('region', schema['properties'])
+        self.assertNotIn('custom_250', schema['properties'])
+
+    def test_renamed_field_in_the_middle_waits_for_max_age(self):
+        load_schema(self.api, fields_cache_dir=self.directory)
+        self.fields[100] = field(101, name='Region')
+        schema, _ = load_schema(self.api, fields_cache_dir=self.directory, fields_cache_ttl=0)
+        self.assertIn('custom_101', schema['properties'])
+
+        schema, _ = load_schema(self.api, fields_cache_dir=self.directory, fields_cache_max_age=0)
+        self.assertIn('region', schema['properties'])
+        self.assertNotIn('custom_101', schema['properties'])
+
+    def test_entries_older_than_max_age_are_ignored(self):
+        cache = FieldsCache(self.directory, ttl=60, max_age=3600)
+        cache.store('account', 'dealFields', self.fields, fetched_at=time.time() - 7200)
+        self.assertIsNone(cache.load('account', 'dealFields'))
+
+        cache.store('account', 'dealFields', self.fields)
+        self.assertEqual(cache.load('account', 'dealFields')['fields'], self.fields)
+        self.assertIsNone(cache.load('other account', 'dealFields'))
+
+    def test_unreadable_cache_file_is_a_miss(self):
+        cache = FieldsCache(self.directory)
+        with open(cache.path('account', 'dealFields'), 'w') as cache_file:
+            cache_file.write('{"account": ')
+        self.assertIsNone(cache.load('account', 'dealFields'))
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(cache.path('account', 'dealFields'))])
+
+    def test_failed_write_leaves_no_temporary_file(self):
+        cache = FieldsCache(self.directory)
+        with mock.patch('os.replace', side_effect=OSError('No space left on device')):
+            entry = cache.store('account', 'dealFields', self.fields)
+        self.assertEqual(entry['fields'], self.fields)
+
+        with self.assertRaises(TypeError):
+            cache.store('account', 'dealFields', [{'id': object()}])
+        self.assertEqual(os.listdir(self.directory), [])
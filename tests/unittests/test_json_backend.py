@@ -0,0 +1,49 @@
+import decimal
+import unittest
+
+import simplejson
+import singer
+
+from tap_pipedrive.json_backend import JsonBackend, orjson
+
+PAGE = ('{"success": true, "data": [{"id": 1, "title": "D\\u00fcsseldorf \\"deal\\"", "value": 0.30000000000000004, '
+        '"big": 123456789012345678901234567890, "won_time": null, "active": true, "labels": [1, 2], '
+        '"org_id": {"name": "Org", "value": 7}}], "additional_data": {"pagination": {"more_items_in_collection": false}}}')
+
+
+class TestJsonBackend(unittest.TestCase):
+
+    def test_records_match_singer_output(self):
+        record = simplejson.loads(PAGE)['data'][0]
+        record['amount'] = decimal.Decimal('10.10')
+        expected = singer.messages.format_message(singer.RecordMessage(stream='deals', record=record))
+
+        for name in ['auto', 'simplejson']:
+            self.assertEqual(JsonBackend(name).format_record('deals', record), expected)
+
+    def test_loads_matches_simplejson(self):
+        for name in ['auto', 'simplejson']:
+            self.assertEqual(JsonBackend(name).loads(PAGE.encode()), simplejson.loads(PAGE))
+
+    def test_integers_beyond_64_bits_stay_exact(self):
+        for body in (b'{"a": 18446744073709551616}', b'[[{"a": -9223372036854775809}]]'):
+            for name in ['auto', 'simplejson']:
+                self.assertEqual(JsonBackend(name).loads(body), simplejson.loads(body))
+
+    def test_bodies_orjson_rejects_are_decoded_by_simplejson(self):
+        self.assertEqual(JsonBackend().loads(b'{"value": NaN}')['value'].hex(), 'nan')
+
+    def test_invalid_body_raises_simplejson_error(self):
+        with self.assertRaises(simplejson.scanner.JSONDecodeError):
+            JsonBackend().loads(b"{'Currency': 'value'}")
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            JsonBackend('ujson')
+
+    @unittest.skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson_records_decode_to_the_same_message(self):
+        record = simplejson.loads(PAGE)['data'][0]
+        expected = singer.messages.format_message(singer.RecordMessage(stream='deals', record=record))
+
+        self.assertEqual(simplejson.loads(JsonBackend('orjson').format_record('deals', record)), simplejson.loads(expected))
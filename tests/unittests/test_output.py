@@ -0,0 +1,47 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+
+import singer
+
+from tap_pipedrive.json_backend import JsonBackend
+from tap_pipedrive.output import MessageWriter
+
+
+class TestMessageWriter(unittest.TestCase):
+
+    def test_records_wait_for_flush(self):
+        output = io.StringIO()
+        writer = MessageWriter(JsonBackend(), buffer_size=10 ** 6)
+        with redirect_stdout(output):
+            writer.write_record('deals', {'id': 1})
+            self.assertEqual(output.getvalue(), '')
+
+            writer.flush()
+        self.assertEqual(output.getvalue(), singer.format_message(singer.RecordMessage('deals', {'id': 1})) + '\n')
+
+    def test_full_buffer_is_written(self):
+        output = io.StringIO()
+        writer = MessageWriter(JsonBackend(), buffer_size=100)
+        with redirect_stdout(output):
+            for i in range(11):
+                writer.write_record('deals', {'id': i})
+            self.assertEqual(len(output.getvalue().splitlines()), 10)
+            self.assertTrue(output.getvalue().endswith('\n'))
+
+            writer.flush()
+        self.assertEqual(len(output.getvalue().splitlines()), 11)
+
+    def test_state_and_schema_follow_pending_records(self):
+        output = io.StringIO()
+        writer = MessageWriter(JsonBackend(), buffer_size=10 ** 6)
+        with redirect_stdout(output):
+            writer.write_schema('deals', {'type': 'object'}, ['id'])
+            writer.write_record('deals', {'id': 1})
+            writer.write_state({'bookmarks': {}})
+            writer.write_record('deals', {'id': 2})
+            writer.write_state({'bookmarks': {'deals': {}}})
+
+        messages = [singer.parse_message(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([type(message).__name__ for message in messages],
+                         ['SchemaMessage', 'RecordMessage', 'StateMessage', 'RecordMessage', 'StateMessage'])
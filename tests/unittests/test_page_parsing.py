@@ -0,0 +1,211 @@
+import cProfile
+import io
+import json
+import pstats
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import requests
+import simplejson
+
+from fake_api import FakeApi, tap_config, make_catalog, make_page, parse_messages
+import tap_pipedrive.tap as _tap
+from tap_pipedrive.page import StreamingPage
+from tap_pipedrive.streams import CurrenciesStream, DealStageChangeStream
+from tap_pipedrive.transport import BodyReader
+
+
+def call_counts(profile):
+    stats = pstats.Stats(profile)
+    return {(func[0].rsplit('/', 1)[-1], func[2]): stat[1] for func, stat in stats.stats.items()}
+
+
+class TestDecodeCountPerPage(unittest.TestCase):
+    """
+    Profiles a sync and checks the response body is decoded once per page fetched
+    """
+
+    def profile_sync(self, stream, collections):
+        api = FakeApi(collections)
+        pipedrive_tap = _tap.PipedriveTap(tap_config(), {})
+        pipedrive_tap.streams = [stream]
+        catalog = make_catalog(stream)
+
+        profile = cProfile.Profile()
+        with mock.patch('requests.Session.get', side_effect=api.get), redirect_stdout(io.StringIO()):
+            profile.runcall(pipedrive_tap.do_sync, catalog)
+        return len(api.calls), call_counts(profile)
+
+    def test_paginated_stream(self):
+        rows = [{'id': i, 'code': 'C{}'.format(i)} for i in range(450)]
+        pages, counts = self.profile_sync(CurrenciesStream(), {'currencies': rows})
+
+        self.assertEqual(pages, 5)
+        self.assertEqual(counts[('page.py', 'decode_body')], pages)
+        self.assertEqual(counts[('json_backend.py', 'loads')], pages)
+
+    def test_deal_stream(self):
+        deals = [{'id': i, 'add_time': '2020-01-01 10:00:00', 'stage_change_time': None} for i in range(1, 151)]
+        flow = [{'id': 1, 'add_time': '2020-02-01 10:00:00'}]
+        pages, counts = self.profile_sync(DealStageChangeStream(), {'deals': deals, r'deals/\d+/flow': flow})
+
+        self.assertEqual(pages, 2 + 150)
+        self.assertEqual(counts[('page.py', 'decode_body')], pages)
+        self.assertEqual(counts[('json_backend.py', 'loads')], pages)
+
+
+def streamed(body, chunk_size=7):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+    response._content_consumed = True
+    return StreamingPage(response, chunk_size=chunk_size)
+
+
+class TestStreamingPage(unittest.TestCase):
+
+    def setUp(self):
+        # multi-byte characters split across chunks, numbers at chunk ends
+        self.rows = [{'id': i, 'content': '<p>Notiz über {}</p>'.format('€' * i), 'value': i * 1.5}
+                     for i in range(1, 120)]
+        self.payload = make_page(self.rows, 0, 100)
+        self.payload['related_objects'] = {'user': {'1': {'id': 1}}}
+
+    def test_rows_then_pagination(self):
+        page = streamed(self.payload)
+        self.assertTrue(page.succeeded)
+        self.assertEqual(list(page.rows()), self.rows[:100])
+        self.assertEqual(page.pagination, self.payload['additional_data']['pagination'])
+        self.assertEqual(page.row_count, 100)
+        self.assertEqual(page.members['related_objects'], {'user': {'1': {'id': 1}}})
+
+    def test_pagination_before_rows_keeps_them(self):
+        page = streamed(self.payload)
+        self.assertEqual(page.pagination['next_start'], 100)
+        self.assertEqual(page.data, self.rows[:100])
+        self.assertEqual(list(page.rows()), self.rows[:100])
+        with self.assertRaises(RuntimeError):
+            page.data
+
+    def test_whitespace_and_member_order(self):
+        page = streamed(' {"additional_data" : {"pagination": {"more_items_in_collection": false}} ,\n'
+                        ' "success": true, "data" : [ {"id": 1} ,{"id": 2} ] , "count": 12345 }\n', chunk_size=3)
+        self.assertEqual(page.pagination, {'more_items_in_collection': False})
+        self.assertEqual(list(page.rows()), [{'id': 1}, {'id': 2}])
+        self.assertEqual(page.members['count'], 12345)
+
+    def test_data_that_is_not_a_list(self):
+        for data in (None, {'id': 1}):
+            page = streamed({'success': True, 'data': data})
+            self.assertEqual(page.data, data)
+            self.assertEqual(list(page.rows()), [] if data is None else ['id'])
+            self.assertTrue(page.succeeded)
+
+    def test_invalid_bodies(self):
+        with self.assertRaises(simplejson.JSONDecodeError):
+            streamed('<html>Bad gateway</html>')
+        page = streamed('{"success": true, "data": [{"id": 1}, {"id"')
+        with self.assertRaises(simplejson.JSONDecodeError):
+            list(page.rows())
+
+
+class TestStreamingSync(unittest.TestCase):
+
+    def sync(self, stream, collections, **config):
+        api = FakeApi(collections)
+        pipedrive_tap = _tap.PipedriveTap(tap_config(**config), {})
+        pipedrive_tap.streams = [stream]
+        output = io.StringIO()
+        with mock.patch('requests.Session.get', side_effect=api.get) as get, redirect_stdout(output):
+            pipedrive_tap.do_sync(make_catalog(stream))
+        return [message for message in parse_messages(output.getvalue()) if message['type'] == 'RECORD'], get
+
+    def test_same_records_as_decoded_pages(self):
+        rows = [{'id': i, 'code': 'C{}'.format(i)} for i in range(450)]
+        decoded, _ = self.sync(CurrenciesStream(), {'currencies': rows})
+        records, get = self.sync(CurrenciesStream(), {'currencies': rows}, streaming_pages=True)
+
+        self.assertEqual(records, decoded)
+        self.assertTrue(all(call.kwargs['stream'] for call in get.call_args_list))
+
+    def test_deal_stream(self):
+        deals = [{'id': i, 'add_time': '2020-01-01 10:00:00', 'stage_change_time': None} for i in range(1, 151)]
+        flow = lambda endpoint: [{'id': int(endpoint.split('/')[1]) * 10 + i, 'add_time': '2020-02-01 10:00:00'}
+                                 for i in range(3)]
+        collections = {'deals': deals, r'deals/\d+/flow': flow}
+        decoded, _ = self.sync(DealStageChangeStream(), collections)
+
+        self.assertEqual(self.sync(DealStageChangeStream(), collections, streaming_pages=True)[0], decoded)
+        self.assertEqual(self.sync(DealStageChangeStream(), collections, streaming_pages=True, deal_concurrency=4)[0],
+                         decoded)
+
+    def test_pages_failing_mid_body_are_requested_again(self):
+        rows = [{'id': i, 'code': 'C{}'.format(i)} for i in range(450)]
+        decoded, _ = self.sync(CurrenciesStream(), {'currencies': rows})
+
+        def chunks(reader, chunk_size):
+            content = reader.read()
+            failing = failures.get(json.loads(content)['additional_data']['pagination']['start'])
+            # a few rows make it before the body breaks off
+            yield content[:80]
+            if failing:
+                failure = failing.pop(0)
+                if failure is None:
+                    return
+                raise failure
+            yield content[80:]
+
+        for depth in (0, 2):
+            with self.subTest(prefetch_depth=depth):
+                # None cuts the body short, which fails its decoding
+                failures = {100: [requests.exceptions.ChunkedEncodingError('Connection broken'),
+                                  requests.exceptions.ConnectionError('Read timed out')],
+                            300: [None]}
+                with mock.patch.object(BodyReader, 'chunks', chunks):
+                    records, get = self.sync(CurrenciesStream(), {'currencies': rows}, streaming_pages=True,
+                                             prefetch_depth=depth)
+
+                self.assertEqual(records, decoded)
+                starts = [call.kwargs['params']['start'] for call in get.call_args_list]
+                self.assertEqual([starts.count(start) for start in (0, 100, 200, 300, 400)], [1, 3, 1, 2, 1])
+
+    def test_page_failing_every_time(self):
+        rows = [{'id': i, 'code': 'C{}'.format(i)} for i in range(450)]
+
+        def chunks(reader, chunk_size):
+            yield reader.read()[:80]
+            raise requests.exceptions.ChunkedEncodingError('Connection broken')
+
+        with mock.patch.object(BodyReader, 'chunks', chunks):
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                self.sync(CurrenciesStream(), {'currencies': rows}, streaming_pages=True)
+
+    def test_deal_pages_cut_short_are_retried(self):
+        deals = [{'id': i, 'add_time': '2020-01-01 10:00:00', 'stage_change_time': None} for i in range(1, 151)]
+        flow = lambda endpoint: [{'id': int(endpoint.split('/')[1]) * 10 + i, 'add_time': '2020-02-01 10:00:00'}
+                                 for i in range(3)]
+        collections = {'deals': deals, r'deals/\d+/flow': flow}
+        decoded, _ = self.sync(DealStageChangeStream(), collections)
+
+        api = FakeApi(collections)
+        cut = {'deals', 'deals/5/flow'}
+
+        def get(url, **kwargs):
+            response = api.get(url, **kwargs)
+            endpoint = url.split('/v1/')[-1]
+            if endpoint in cut:
+                cut.remove(endpoint)
+                response._content = response._content[:100]
+            return response
+
+        stream = DealStageChangeStream()
+        pipedrive_tap = _tap.PipedriveTap(tap_config(streaming_pages=True), {})
+        pipedrive_tap.streams = [stream]
+        output = io.StringIO()
+        with mock.patch('requests.Session.get', side_effect=get), mock.patch('time.sleep'), redirect_stdout(output):
+            pipedrive_tap.do_sync(make_catalog(stream))
+
+        records = [message for message in parse_messages(output.getvalue()) if message['type'] == 'RECORD']
+        self.assertEqual(records, decoded)
+        self.assertEqual(api.endpoints().count('deals/5/flow'), 2)
@@ -0,0 +1,150 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import requests
+
+from fake_api import FakeApi, make_response, tap_config, make_catalog, parse_messages
+import tap_pipedrive.tap as _tap
+from tap_pipedrive.page_size import PageSizer, MAX_PAGE_SIZE, MIN_PAGE_SIZE
+from tap_pipedrive.streams import ActivityTypesStream, StagesStream
+
+
+def stages(count):
+    return [{'id': i, 'name': 'stage {}'.format(i), 'add_time': '2020-01-01 10:00:00'} for i in range(1, count + 1)]
+
+
+def run_stages(api, **config):
+    stream = StagesStream()
+    pipedrive_tap = _tap.PipedriveTap(tap_config(**config), {})
+    pipedrive_tap.streams = [stream]
+    output = io.StringIO()
+    with mock.patch('requests.Session.get', side_effect=api.get), redirect_stdout(output):
+        pipedrive_tap.do_sync(make_catalog(stream))
+    return parse_messages(output.getvalue())
+
+
+class TestPageSizer(unittest.TestCase):
+
+    def test_configured_sizes(self):
+        stream = StagesStream()
+        self.assertEqual(PageSizer.from_config({}, stream).size, 100)
+        self.assertEqual(PageSizer.from_config({'page_size': 500}, stream).size, 500)
+        self.assertEqual(PageSizer.from_config({'page_size': 2000}, stream).size, MAX_PAGE_SIZE)
+        self.assertEqual(PageSizer.from_config({'page_size': 500, 'page_sizes': {'stages': 250}}, stream).size, 250)
+        self.assertEqual(PageSizer.from_config({'page_sizes': {'deals': 250}}, stream).size, 100)
+        self.assertTrue(PageSizer.from_config({'page_sizes': {'stages': 'adaptive'}}, stream).adaptive)
+
+    def test_adaptive_size_follows_latency_and_payload(self):
+        sizer = PageSizer(100, adaptive=True, target_seconds=2)
+        sizer.observe(0.5, 100000)
+        sizer.observe(0.5, 100000)
+        self.assertEqual(sizer.size, 400)
+        sizer.observe(0.5, 100000)
+        self.assertEqual(sizer.size, MAX_PAGE_SIZE)
+        sizer.observe(1.5, 100000)
+        self.assertEqual(sizer.size, MAX_PAGE_SIZE)
+        sizer.observe(3, 100000)
+        self.assertEqual(sizer.size, 250)
+        sizer.observe(0.1, 20 * 1024 * 1024)
+        self.assertEqual(sizer.size, 125)
+
+    def test_only_adaptive_sizes_shrink(self):
+        self.assertFalse(PageSizer(100).shrink())
+        sizer = PageSizer(100, adaptive=True)
+        self.assertTrue(sizer.shrink())
+        self.assertEqual(sizer.size, 50)
+        self.assertTrue(sizer.shrink())
+        self.assertEqual(sizer.size, MIN_PAGE_SIZE)
+        self.assertFalse(sizer.shrink())
+
+
+class TestPagination(unittest.TestCase):
+
+    def test_configured_page_size_is_requested(self):
+        api = FakeApi({'stages': stages(1200)})
+        messages = run_stages(api, page_size=500)
+
+        self.assertEqual([params for _, params in api.calls],
+                         [{'start': 0, 'limit': 500}, {'start': 500, 'limit': 500}, {'start': 1000, 'limit': 500}])
+        self.assertEqual(len([message for message in messages if message['type'] == 'RECORD']), 1200)
+
+    def test_adaptive_page_size_grows_and_shrinks_on_timeouts(self):
+        rows = stages(2000)
+        fake_api = FakeApi({'stages': rows})
+
+        def get(url, headers=None, params=None, timeout=None, **kwargs):
+            if params['limit'] > 200:
+                raise requests.ReadTimeout('read timed out')
+            return fake_api.get(url, headers=headers, params=params, timeout=timeout, **kwargs)
+
+        api = mock.Mock(get=get)
+        messages = run_stages(api, page_size='adaptive')
+
+        limits = [params['limit'] for _, params in fake_api.calls]
+        self.assertEqual(limits[:3], [100, 200, 200])
+        records = [message['record']['id'] for message in messages if message['type'] == 'RECORD']
+        self.assertEqual(records, [row['id'] for row in rows])
+
+    def test_adaptive_page_size_shrinks_on_the_first_server_error(self):
+        rows = stages(300)
+        for status_code in (500, 503):
+            with self.subTest(status_code=status_code):
+                fake_api = FakeApi({'stages': rows})
+                limits = []
+
+                def get(url, headers=None, params=None, timeout=None, **kwargs):
+                    limits.append(params['limit'])
+                    if params['limit'] > 50:
+                        return make_response(status_code, {'success': False, 'error': 'Server error'})
+                    return fake_api.get(url, headers=headers, params=params, timeout=timeout, **kwargs)
+
+                messages = run_stages(mock.Mock(get=get), page_size='adaptive')
+
+                # not retried at full size first
+                self.assertEqual(limits[:3], [100, 50, 100])
+                records = [message['record']['id'] for message in messages if message['type'] == 'RECORD']
+                self.assertEqual(records, [row['id'] for row in rows])
+
+
+class TestDiscoverFieldMetadata(unittest.TestCase):
+
+    def test_every_page_of_field_metadata_is_read(self):
+        stream = ActivityTypesStream()
+        properties = list(stream.load_schema()['properties'])
+        # the fields matching the schema come last, past the pages the old start += 500 skipped
+        fields = [{'key': 'other_{}'.format(i), 'name': 'Other {}'.format(i)} for i in range(1100)]
+        fields += [{'key': key, 'name': key.title()} for key in properties]
+        api = FakeApi({'activityFields': fields, 'activityTypes': []})
+
+        pipedrive_tap = _tap.PipedriveTap(tap_config(), {})
+        pipedrive_tap.streams = [stream]
+        with mock.patch('requests.Session.get', side_effect=api.get):
+            catalog = pipedrive_tap.do_discover(return_dict=True)
+
+        field_meta = {key: value['field_meta'] for key, value in catalog['streams'][0]['schema']['properties'].items()}
+        self.assertEqual({key: meta.get('label') for key, meta in field_meta.items()},
+                         {key: key.title() for key in properties})
+        self.assertEqual(api.endpoints().count('activityFields'), 3)
+
+    def test_fixed_page_size_retries_timeouts(self):
+        fake_api = FakeApi({'stages': stages(150)})
+        timeouts = [requests.ReadTimeout('read timed out')] * 2
+
+        def get(url, headers=None, params=None, timeout=None, **kwargs):
+            if timeouts:
+                raise timeouts.pop()
+            return fake_api.get(url, headers=headers, params=params, timeout=timeout, **kwargs)
+
+        with mock.patch('time.sleep'):
+            messages = run_stages(mock.Mock(get=get))
+
+        self.assertEqual([params['limit'] for _, params in fake_api.calls], [100, 100])
+        self.assertEqual(len([message for message in messages if message['type'] == 'RECORD']), 150)
+
+    def test_timeouts_raise_after_the_retries(self):
+        get = mock.Mock(side_effect=requests.ReadTimeout('read timed out'))
+        with mock.patch('time.sleep'), self.assertRaises(requests.ReadTimeout):
+            run_stages(mock.Mock(get=get))
+        self.assertEqual(get.call_count, 5)
@@ -0,0 +1,88 @@
+import io
+import threading
+import time
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from fake_api import FakeApi, tap_config, make_catalog, parse_messages
+import tap_pipedrive.tap as _tap
+from tap_pipedrive.prefetch import prefetch
+from tap_pipedrive.streams import RecentDealsStream
+
+
+def recent_deals(count):
+    deal = lambda i: {'id': i, 'title': 'Deal {}'.format(i), 'update_time': '2020-01-{:02d} 10:00:00'.format(i % 28 + 1)}
+    return [{'item': 'deal', 'id': i, 'data': deal(i)} for i in range(1, count + 1)]
+
+
+def run_deals(api, process_delay=0, **config):
+    stream = RecentDealsStream()
+    stream.get_field_definitions = lambda: []
+    pipedrive_tap = _tap.PipedriveTap(tap_config(**config), {})
+    pipedrive_tap.streams = [stream]
+    processed = []
+    process_page = pipedrive_tap.process_page
+
+    def slow_process_page(stream, row_plan, page):
+        time.sleep(process_delay)
+        processed.append(len(api.calls))
+        process_page(stream, row_plan, page)
+
+    output = io.StringIO()
+    with mock.patch('requests.Session.get', side_effect=api.get), redirect_stdout(output), \
+            mock.patch.object(pipedrive_tap, 'process_page', side_effect=slow_process_page):
+        pipedrive_tap.do_sync(make_catalog(stream))
+    return parse_messages(output.getvalue()), processed
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def test_yields_in_order(self):
+        self.assertEqual(list(prefetch(iter(range(100)), 3)), list(range(100)))
+        self.assertEqual(list(prefetch([], 3)), [])
+
+    def test_producer_failure_is_raised_in_order(self):
+        def produce():
+            yield 1
+            yield 2
+            raise ValueError('page 3')
+
+        consumed = []
+        with self.assertRaisesRegex(ValueError, 'page 3'):
+            for item in prefetch(produce(), 2):
+                consumed.append(item)
+        self.assertEqual(consumed, [1, 2])
+
+    def test_closing_stops_the_producer(self):
+        produced = []
+
+        def produce():
+            for i in range(1000):
+                produced.append(i)
+                yield i
+
+        before = threading.active_count()
+        for item in prefetch(produce(), 2):
+            if item == 5:
+                break
+        self.assertLessEqual(len(produced), 5 + 1 + 2)
+        self.assertEqual(threading.active_count(), before)
+
+    def test_output_matches_serial(self):
+        rows = recent_deals(1000)
+        serial, _ = run_deals(FakeApi({'recents': rows}))
+        prefetched, _ = run_deals(FakeApi({'recents': rows}, latency=0.002), prefetch_depth=2)
+
+        self.assertEqual(prefetched, serial)
+        self.assertEqual(len([message for message in serial if message['type'] == 'RECORD']), 1000)
+
+    def test_pages_are_fetched_ahead_up_to_the_depth(self):
+        api = FakeApi({'recents': recent_deals(1000)}, latency=0.005)
+        _, processed = run_deals(api, process_delay=0.02, prefetch_depth=2)
+
+        # calls made by the time page n (1 based) was processed
+        ahead = [calls - n for n, calls in enumerate(processed, 1)]
+        self.assertEqual(len(processed), 10)
+        self.assertTrue(all(0 <= pages <= 2 for pages in ahead), ahead)
+        self.assertIn(2, ahead)
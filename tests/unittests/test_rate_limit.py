@@ -0,0 +1,150 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from tap_pipedrive.rate_limit import RateGovernor
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class RateLimitedApi(object):
+    """
+    Fixed windows of `window` seconds allowing `limit` requests each, answered with Pipedrive's
+    rate limit headers. `other_client` requests of another client of the account land at the
+    start of every window.
+    """
+
+    def __init__(self, clock, limit, window, latency=0.0, other_client=0):
+        self.clock = clock
+        self.limit = limit
+        self.window = window
+        self.latency = latency
+        self.other_client = other_client
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.throttled = 0
+        self.served = 0
+
+    def request(self):
+        with self.lock:
+            now = self.clock()
+            window = int(now // self.window)
+            count = self.counts.get(window, self.other_client) + 1
+            self.counts[window] = count
+            headers = {
+                'X-RateLimit-Limit': str(self.limit),
+                'X-RateLimit-Remaining': str(max(self.limit - count, 0)),
+                'X-RateLimit-Reset': str((window + 1) * self.window - now),
+            }
+            if count > self.limit:
+                self.throttled += 1
+                return 429, headers
+            self.served += 1
+            return 200, headers
+
+
+def run_sequential(governor, api, clock, requests):
+    for _ in range(requests):
+        with governor.request():
+            status_code, headers = api.request()
+            clock.sleep(api.latency)
+            governor.update(headers, status_code)
+
+
+class TestRateGovernor(unittest.TestCase):
+
+    def test_holds_sustained_throughput_without_429s(self):
+        clock = FakeClock()
+        governor = RateGovernor(clock=clock, sleep=clock.sleep)
+        api = RateLimitedApi(clock, limit=80, window=2.0, latency=0.005)
+
+        started = clock()
+        run_sequential(governor, api, clock, 2000)
+
+        self.assertEqual(api.throttled, 0)
+        requests_per_second = 2000 / (clock() - started)
+        self.assertGreater(requests_per_second, 0.9 * 80 / 2.0)
+        self.assertLessEqual(requests_per_second, 80 / 2.0)
+
+    def test_leaves_room_for_other_clients_of_the_account(self):
+        clock = FakeClock()
+        governor = RateGovernor(clock=clock, sleep=clock.sleep)
+        api = RateLimitedApi(clock, limit=80, window=2.0, latency=0.005, other_client=30)
+
+        run_sequential(governor, api, clock, 1000)
+
+        self.assertLessEqual(api.throttled, 1)
+        self.assertEqual(api.served + api.throttled, 1000)
+
+    def test_not_paced_before_the_first_headers(self):
+        clock = FakeClock()
+        governor = RateGovernor(clock=clock, sleep=clock.sleep)
+        for _ in range(10):
+            with governor.request():
+                governor.update({}, 200)
+        self.assertEqual(clock(), 1000.0)
+        self.assertEqual(governor.metrics()['requests'], 10)
+
+    def test_waits_for_the_reset_when_nothing_is_left(self):
+        clock = FakeClock()
+        governor = RateGovernor(clock=clock, sleep=clock.sleep)
+        with governor.request():
+            governor.update({'X-RateLimit-Limit': '80', 'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '2'}, 429)
+        with governor.request():
+            pass
+        self.assertGreaterEqual(clock(), 1002.0)
+        self.assertEqual(governor.metrics()['throttled'], 1)
+
+    def test_window_follows_the_latest_reset(self):
+        clock = FakeClock()
+        governor = RateGovernor(clock=clock, sleep=clock.sleep)
+        headers = lambda reset: {'X-RateLimit-Limit': '80', 'X-RateLimit-Remaining': '70', 'X-RateLimit-Reset': reset}
+
+        governor.update(headers('10'), 200)
+        clock.sleep(4)
+        governor.update(headers('6'), 200)
+        self.assertEqual(governor.metrics()['window'], 10.0)
+
+        # a response of the old window arriving late
+        clock.sleep(6.05)
+        governor.update(headers('0.001'), 200)
+        self.assertEqual(governor.metrics()['window'], 10.0)
+
+        # the account moved to 2 second windows
+        clock.sleep(0.45)
+        governor.update(headers('1.5'), 200)
+        clock.sleep(1.5)
+        governor.update(headers('2'), 200)
+        clock.sleep(0.5)
+        governor.update(headers('1.5'), 200)
+        self.assertEqual(governor.metrics()['window'], 2.0)
+
+    def test_threads_share_the_budget(self):
+        governor = RateGovernor()
+        api = RateLimitedApi(time.monotonic, limit=20, window=0.2)
+
+        def call():
+            with governor.request():
+                status_code, headers = api.request()
+                time.sleep(0.005)
+                governor.update(headers, status_code)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for future in [executor.submit(call) for _ in range(150)]:
+                future.result()
+        elapsed = time.monotonic() - started
+
+        self.assertLessEqual(api.throttled, 2)
+        self.assertLessEqual(150 / elapsed, 20 / 0.2 * 1.1)
@@ -0,0 +1,96 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from singer import metadata
+
+from fake_api import FakeApi, tap_config, make_catalog, parse_messages
+import tap_pipedrive.tap as _tap
+from tap_pipedrive.row_plan import RowPlan
+from tap_pipedrive.streams import StagesStream
+from tap_pipedrive.transform import SchemaTransformer
+
+
+class TestRowPlan(unittest.TestCase):
+
+    def test_renames_hash_keys(self):
+        plan = RowPlan({}, {}, {'a1b2': 'region', 'c3d4': 'size'})
+        self.assertEqual(plan.remap({'id': 1, 'a1b2': 'EU', 'c3d4': None}), {'id': 1, 'region': 'EU', 'size': None})
+
+    def test_row_without_custom_fields_is_untouched(self):
+        row = {'id': 1}
+        self.assertIs(RowPlan({}, {}, {'a1b2': 'region'}).remap(row), row)
+        self.assertIs(RowPlan({}, {}).remap(row), row)
+
+    def test_custom_field_replaces_standard_field_of_the_same_name(self):
+        plan = RowPlan({}, {}, {'a1b2': 'value'})
+        self.assertEqual(plan.remap({'value': 10, 'a1b2': 'custom'}), {'value': 'custom'})
+        self.assertEqual(plan.remap({'a1b2': 'custom', 'value': 10}), {'value': 'custom'})
+
+
+SCHEMA = {'type': ['null', 'object'], 'properties': {
+    'id': {'type': ['integer']},
+    'title': {'type': ['null', 'string']},
+    'value': {'type': ['null', 'number']},
+    'region': {'type': ['null', 'string']},
+    'size': {'type': ['null', 'integer']},
+    'update_time': {'type': ['null', 'string'], 'format': 'date-time'},
+}}
+
+
+def stream_metadata(deselected=()):
+    mdata = metadata.to_map(metadata.get_standard_metadata(schema=SCHEMA, key_properties=['id']))
+    mdata[('properties', 'update_time')]['inclusion'] = 'automatic'
+    for name in deselected:
+        mdata[('properties', name)]['selected'] = False
+    return mdata
+
+
+class TestProjection(unittest.TestCase):
+
+    def setUp(self):
+        self.key_map = {'a1b2': 'region', 'c3d4': 'size', 'e5f6': 'value'}
+        self.row = {'id': 7, 'title': 'Deal', 'value': 10, 'e5f6': '12.5', 'a1b2': 'EU', 'c3d4': '3',
+                    'update_time': '2021-03-04 10:11:12', 'unknown': 'x'}
+        self.row.update({'{:040x}'.format(i): 'custom {}'.format(i) for i in range(800)})
+
+    def test_same_records_as_transforming_every_key(self):
+        for deselected in ((), ('title', 'size'), ('title', 'value', 'region', 'size'), ('id', 'update_time')):
+            with self.subTest(deselected=deselected):
+                mdata = stream_metadata(deselected)
+                plan = RowPlan(SCHEMA, mdata, self.key_map)
+                expected = SchemaTransformer(SCHEMA, mdata).transform(plan.remap(self.row))
+                self.assertEqual(plan.transform(self.row), expected)
+
+    def test_unselected_keys_are_dropped_first(self):
+        plan = RowPlan(SCHEMA, stream_metadata(('title', 'size')), self.key_map)
+
+        self.assertEqual(plan.project(self.row),
+                         {'id': 7, 'e5f6': '12.5', 'value': 10, 'a1b2': 'EU', 'update_time': '2021-03-04 10:11:12'})
+        self.assertEqual(list(plan.selected_schema['properties']), ['id', 'value', 'region', 'update_time'])
+        self.assertEqual(list(SCHEMA['properties']), ['id', 'title', 'value', 'region', 'size', 'update_time'])
+
+    def test_nothing_is_projected_when_everything_is_selected(self):
+        plan = RowPlan(SCHEMA, stream_metadata(), self.key_map)
+        self.assertIs(plan.project(self.row), self.row)
+        self.assertIs(plan.selected_schema, SCHEMA)
+
+    def test_schema_message_of_a_sync(self):
+        rows = [{'id': i, 'name': 'Stage {}'.format(i), 'order_nr': i, 'pipeline_id': 1, 'pipeline_name': 'Sales',
+                 'add_time': '2021-03-04 10:11:12'} for i in range(1, 151)]
+        stream = StagesStream()
+        catalog = make_catalog(stream, deselected=('name', 'pipeline_id', 'pipeline_name', 'rotten_days'))
+        pipedrive_tap = _tap.PipedriveTap(tap_config(), {})
+        pipedrive_tap.streams = [stream]
+        output = io.StringIO()
+        with mock.patch('requests.Session.get', side_effect=FakeApi({'stages': rows}).get), redirect_stdout(output):
+            pipedrive_tap.do_sync(catalog)
+
+        messages = parse_messages(output.getvalue())
+        schema = next(message['schema'] for message in messages if message['type'] == 'SCHEMA')
+        self.assertEqual(sorted(schema['properties']), ['active_flag', 'add_time', 'deal_probability', 'id', 'order_nr',
+                                                        'rotten_flag', 'update_time'])
+        records = [message['record'] for message in messages if message['type'] == 'RECORD']
+        self.assertEqual(len(records), 150)
+        self.assertEqual(records[0], {'id': 1, 'order_nr': 1, 'add_time': '2021-03-04T10:11:12.000000Z'})
@@ -0,0 +1,96 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from singer.catalog import Catalog
+
+from fake_api import FakeApi, tap_config, make_catalog, parse_messages
+import tap_pipedrive.tap as _tap
+from tap_pipedrive.streams import CurrenciesStream, StagesStream, FiltersStream, PipelinesStream
+
+
+def rows(count, offset=0):
+    return [{'id': offset + i, 'name': 'row {}'.format(i), 'add_time': '2020-01-{:02d} 10:00:00'.format(i % 28 + 1)}
+            for i in range(1, count + 1)]
+
+
+COLLECTIONS = {'currencies': rows(120), 'stages': rows(250), 'filters': rows(30), 'pipelines': rows(310)}
+
+
+def make_streams():
+    return [CurrenciesStream(), StagesStream(), FiltersStream(), PipelinesStream()]
+
+
+def run_sync(api, state=None, **config):
+    streams = make_streams()
+    pipedrive_tap = _tap.PipedriveTap(tap_config(**config), state or {})
+    pipedrive_tap.streams = streams
+    catalog = Catalog([entry for stream in streams for entry in make_catalog(stream).streams])
+    output = io.StringIO()
+    with mock.patch('requests.Session.get', side_effect=api.get), redirect_stdout(output):
+        pipedrive_tap.do_sync(catalog)
+    return parse_messages(output.getvalue())
+
+
+def records_by_stream(messages):
+    records = {}
+    for message in messages:
+        if message['type'] == 'RECORD':
+            records.setdefault(message['stream'], []).append(message['record'])
+    return records
+
+
+class TestStreamConcurrency(unittest.TestCase):
+
+    def test_concurrent_output_matches_serial(self):
+        serial = run_sync(FakeApi(COLLECTIONS))
+        concurrent = run_sync(FakeApi(COLLECTIONS, latency=0.002), stream_concurrency=4)
+
+        self.assertEqual(records_by_stream(concurrent), records_by_stream(serial))
+        self.assertEqual(concurrent[-1], serial[-1])
+        self.assertNotIn('currently_syncing', concurrent[-1]['value'])
+
+    def test_schema_comes_before_records(self):
+        messages = run_sync(FakeApi(COLLECTIONS, latency=0.002), stream_concurrency=4)
+
+        schemas = set()
+        for message in messages:
+            if message['type'] == 'SCHEMA':
+                schemas.add(message['stream'])
+            elif message['type'] == 'RECORD':
+                self.assertIn(message['stream'], schemas)
+        self.assertEqual(schemas, {stream.schema for stream in make_streams()})
+
+    def test_currently_syncing_is_a_safe_resume_point(self):
+        order = [stream.schema for stream in make_streams()]
+
+        def failing(endpoint):
+            raise ConnectionResetError('stages failed')
+
+        api = FakeApi(dict(COLLECTIONS, stages=failing), latency=0.002)
+        pipedrive_tap = _tap.PipedriveTap(tap_config(stream_concurrency=2), {})
+        pipedrive_tap.streams = make_streams()
+        catalog = Catalog([entry for stream in pipedrive_tap.streams for entry in make_catalog(stream).streams])
+        output = io.StringIO()
+        with mock.patch('requests.Session.get', side_effect=api.get), redirect_stdout(output):
+            with self.assertRaises(ConnectionResetError):
+                pipedrive_tap.do_sync(catalog)
+        messages = parse_messages(output.getvalue())
+
+        # every STATE points at a stream all of whose predecessors had completed
+        written = dict.fromkeys(order, 0)
+        states = []
+        for message in messages:
+            if message['type'] == 'RECORD':
+                written[message['stream']] += 1
+            elif message['type'] == 'STATE' and 'currently_syncing' in message['value']:
+                states.append(message['value'])
+                position = order.index(message['value']['currently_syncing'])
+                for stream in make_streams()[:position]:
+                    self.assertEqual(written[stream.schema], len(COLLECTIONS[stream.endpoint]))
+        self.assertEqual(states[-1]['currently_syncing'], 'stages')
+
+        # resuming skips the streams before it
+        resumed = run_sync(FakeApi(COLLECTIONS), state=states[-1], stream_concurrency=2)
+        self.assertEqual({message['stream'] for message in resumed if message['type'] == 'SCHEMA'}, set(order[1:]))
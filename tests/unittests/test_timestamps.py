@@ -0,0 +1,48 @@
+import random
+import unittest
+
+import pendulum
+
+from tap_pipedrive.stream import PipedriveStream
+from tap_pipedrive.timestamps import parse_epoch, parse_datetime, to_epoch
+
+VALUES = ['2020-01-01 10:00:00', '2020-01-01 10:00:01', '2019-12-31 23:59:59', '2021-05-06T07:08:09.000000Z',
+          '2021-05-06T07:08:09.123456Z', '2020-01-01', '2020-01-01T10:00:00+02:00', '2020-01-01T10:00:00Z']
+
+
+class StateStream(PipedriveStream):
+    state_field = 'update_time'
+
+
+def reference_is_newer(initial_state, value):
+    return pendulum.parse(value).subtract(seconds=1) >= initial_state
+
+
+class TestTimestamps(unittest.TestCase):
+
+    def test_parse_matches_pendulum(self):
+        for value in VALUES:
+            self.assertEqual(str(parse_datetime(value)), str(pendulum.parse(value)))
+            self.assertEqual(parse_epoch(value), to_epoch(pendulum.parse(value)))
+
+    def test_invalid_dates_still_raise(self):
+        with self.assertRaises(Exception):
+            parse_epoch('2020-02-30 10:00:00')
+
+    def test_bookmarks_match_pendulum_comparisons(self):
+        rows = ['2020-01-01 10:00:{:02d}'.format(random.randrange(60)) for _ in range(200)] + VALUES
+        random.shuffle(rows)
+
+        for initial in ['2020-01-01T10:00:00+00:00', '2020-01-01T09:59:59.500000+00:00', '2020-01-01T10:00:30+00:00']:
+            stream = StateStream()
+            stream.set_initial_state({}, pendulum.parse(initial))
+
+            expected_state = stream.initial_state
+            for value in rows:
+                self.assertEqual(stream.record_is_newer_equal_null({'update_time': value}),
+                                 reference_is_newer(pendulum.parse(initial), value), value)
+                stream.update_state({'update_time': value})
+                if pendulum.parse(value) >= expected_state:
+                    expected_state = pendulum.parse(value)
+
+            self.assertEqual(str(stream.earliest_state), str(expected_state))
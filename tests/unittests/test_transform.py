@@ -0,0 +1,98 @@
+import copy
+import glob
+import json
+import os
+import random
+import unittest
+
+import singer
+from singer import metadata
+from singer.transform import SchemaMismatch
+
+from tap_pipedrive.transform import SchemaTransformer
+
+
+SCHEMAS = os.path.join(os.path.dirname(__file__), '..', '..', 'tap_pipedrive', 'schemas')
+
+# what Pipedrive sends and a few values that have to fail or take singer's slow path
+VALUES = [
+    None, '', 'text', 'für Müller', '12', '1,234', '3.5', 'false', 'False', 'true', 0, 1, 7, -3, 2.5, True, False,
+    '2021-03-04 10:11:12', '2021-03-04T10:11:12.000000Z', '2021-03-04', '2021-02-30 10:11:12', '2021-03-04T10:11:12+02:00',
+    {'name': 'Org', 'value': 3}, [1, 2], [{'id': 1}],
+]
+
+
+def load_schemas():
+    for path in sorted(glob.glob(os.path.join(SCHEMAS, '**', '*.json'), recursive=True)):
+        with open(path) as schema_file:
+            yield os.path.basename(path), json.load(schema_file)
+
+
+def singer_transform(row, schema, stream_metadata):
+    try:
+        return singer.Transformer(singer.NO_INTEGER_DATETIME_PARSING).transform(
+            copy.deepcopy(row), copy.deepcopy(schema), stream_metadata)
+    except SchemaMismatch as ex:
+        return 'SchemaMismatch: {}'.format(ex)
+
+
+class TestSchemaTransformer(unittest.TestCase):
+
+    def assert_same_as_singer(self, rows, schema, stream_metadata):
+        transformer = SchemaTransformer(schema, stream_metadata)
+        for row in rows:
+            expected = singer_transform(row, schema, stream_metadata)
+            try:
+                actual = transformer.transform(copy.deepcopy(row))
+            except SchemaMismatch as ex:
+                actual = 'SchemaMismatch: {}'.format(ex)
+            self.assertEqual(actual, expected, row)
+            if isinstance(expected, dict):
+                self.assertEqual(list(actual), list(expected))
+
+    def test_every_schema_with_every_value(self):
+        rng = random.Random(7)
+        for name, schema in load_schemas():
+            with self.subTest(schema=name):
+                properties = list(schema['properties'])
+                mdata = metadata.to_map(metadata.get_standard_metadata(schema=schema, key_properties=['id']))
+                rows = []
+                for value in VALUES:
+                    rows.append({prop: value for prop in properties})
+                for _ in range(60):
+                    row = {prop: rng.choice(VALUES) for prop in properties if rng.random() < 0.9}
+                    row['not_in_schema'] = 'x'
+                    rows.append(row)
+                # rows singer accepts as a whole, built from the values it accepts for each property
+                accepted = {prop: [value for value in VALUES if isinstance(singer_transform({prop: value}, schema, mdata), dict)]
+                            for prop in properties}
+                for _ in range(60):
+                    rows.append({prop: rng.choice(accepted[prop]) for prop in properties if accepted[prop]})
+                self.assert_same_as_singer(rows, schema, mdata)
+
+    def test_deselected_and_unsupported_properties_are_dropped(self):
+        schema = {'type': 'object', 'properties': {
+            'id': {'type': 'integer'}, 'name': {'type': ['null', 'string']},
+            'value': {'type': ['null', 'number']}, 'secret': {'type': ['null', 'string']},
+        }}
+        mdata = metadata.to_map(metadata.get_standard_metadata(schema=schema, key_properties=['id']))
+        mdata = metadata.write(mdata, ('properties', 'name'), 'selected', False)
+        mdata = metadata.write(mdata, ('properties', 'id'), 'selected', False)
+        mdata = metadata.write(mdata, ('properties', 'secret'), 'inclusion', 'unsupported')
+        row = {'id': '1', 'name': 'a', 'value': '1,5', 'secret': 's'}
+
+        self.assertEqual(SchemaTransformer(schema, mdata).transform(dict(row)), {'id': 1, 'value': 15.0})
+        self.assert_same_as_singer([row], schema, mdata)
+
+    def test_mismatch_raises_singers_error(self):
+        schema = {'type': 'object', 'properties': {'id': {'type': 'integer'}}}
+        with self.assertRaises(SchemaMismatch) as raised:
+            SchemaTransformer(schema, {}).transform({'id': 'abc'})
+        self.assertIn('id: data does not match', str(raised.exception))
+
+    def test_schema_outside_of_the_converters_uses_singer(self):
+        schema = {'type': 'object', 'properties': {'id': {'type': 'integer'}},
+                  'patternProperties': {'^x_': {'type': 'string'}}}
+        transformer = SchemaTransformer(schema, {})
+        self.assertIsNone(transformer.converters)
+        self.assert_same_as_singer([{'id': 1, 'x_a': 2, 'b': 3}], schema, {})
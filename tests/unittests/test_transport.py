@@ -0,0 +1,116 @@
+import gzip
+import io
+import json
+import unittest
+import zlib
+from contextlib import redirect_stdout
+from unittest import mock
+
+import requests
+import urllib3
+from requests.structures import CaseInsensitiveDict
+
+from fake_api import FakeApi, tap_config, make_catalog, make_page, parse_messages
+import tap_pipedrive.tap as _tap
+from tap_pipedrive.page import StreamingPage
+from tap_pipedrive.streams import CurrenciesStream
+from tap_pipedrive.transport import BodyReader, TransferMeter, build_session
+
+ENCODINGS = {'gzip': gzip.compress, 'deflate': zlib.compress, None: lambda body: body}
+
+
+def wire_response(payload, encoding=None):
+    """
+    A response whose body wasn't read yet, as session.get(..., stream=True) returns it
+    """
+    body = ENCODINGS[encoding](payload if isinstance(payload, bytes) else json.dumps(payload).encode())
+    headers = {'Content-Encoding': encoding} if encoding else {}
+    response = requests.Response()
+    response.status_code = 200
+    response.headers = CaseInsensitiveDict(headers)
+    response.raw = urllib3.HTTPResponse(body=io.BytesIO(body), headers=headers, status=200, preload_content=False)
+    return response, len(body)
+
+
+class TestBodyReader(unittest.TestCase):
+
+    def setUp(self):
+        rows = [{'id': i, 'name': 'Stage {}'.format(i), 'pipeline_name': 'Sales'} for i in range(500)]
+        self.payload = make_page(rows, 0, 500)
+        self.size = len(json.dumps(self.payload).encode())
+
+    def test_bodies_are_inflated_and_metered(self):
+        for encoding in ENCODINGS:
+            with self.subTest(encoding=encoding):
+                response, wire_size = wire_response(self.payload, encoding)
+                meter = TransferMeter()
+                BodyReader(response, meter).read()
+
+                self.assertEqual(response.json(), self.payload)
+                self.assertEqual((meter.wire_bytes, meter.decoded_bytes), (wire_size, self.size))
+                if encoding:
+                    self.assertLess(wire_size * 5, self.size)
+
+    def test_streaming_page_of_a_compressed_body(self):
+        response, wire_size = wire_response(self.payload, 'gzip')
+        meter = TransferMeter()
+        page = StreamingPage(response, BodyReader(response, meter).chunks(1024))
+
+        self.assertEqual(list(page.rows()), self.payload['data'])
+        self.assertEqual(page.pagination, self.payload['additional_data']['pagination'])
+        self.assertEqual((meter.wire_bytes, meter.decoded_bytes), (wire_size, self.size))
+
+    def test_raw_deflate_and_gzip_members(self):
+        body = json.dumps(self.payload).encode()
+        raw_deflate = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        bodies = {'deflate': raw_deflate.compress(body) + raw_deflate.flush(),
+                  'gzip': b''.join(gzip.compress(body[start:start + 10000]) for start in range(0, len(body), 10000))}
+        for encoding, wire_body in bodies.items():
+            for chunk_size in (7, 64 * 1024):
+                with self.subTest(encoding=encoding, chunk_size=chunk_size):
+                    response, _ = wire_response(wire_body)
+                    response.headers['Content-Encoding'] = encoding
+                    self.assertEqual(b''.join(BodyReader(response).chunks(chunk_size)), body)
+
+    def test_corrupt_body(self):
+        response, _ = wire_response(b'\x1f\x8b\x08\x00 not gzip at all')
+        response.headers['Content-Encoding'] = 'gzip'
+        with self.assertRaises(requests.exceptions.ContentDecodingError):
+            BodyReader(response).read()
+
+    def test_read_responses_count_their_content(self):
+        response = requests.Response()
+        response._content = b'{"success": true, "data": []}'
+        meter = TransferMeter()
+        self.assertEqual(BodyReader(response, meter).read(), response._content)
+        self.assertEqual((meter.wire_bytes, meter.decoded_bytes), (29, 29))
+
+    def test_accept_encoding(self):
+        self.assertIn(build_session({}).headers['Accept-Encoding'], ('gzip, deflate', 'gzip, deflate, br'))
+        self.assertEqual(build_session({'http_compression': False}).headers['Accept-Encoding'], 'identity')
+
+
+class TestCompressedSync(unittest.TestCase):
+
+    def test_records_and_transfer_metrics(self):
+        rows = [{'id': i, 'code': 'C{}'.format(i), 'name': 'Currency {}'.format(i)} for i in range(250)]
+        api = FakeApi({'currencies': rows})
+
+        def get(url, **kwargs):
+            return wire_response(api.get(url, **kwargs).json(), 'gzip')[0]
+
+        for streaming in (False, True):
+            with self.subTest(streaming_pages=streaming):
+                stream = CurrenciesStream()
+                pipedrive_tap = _tap.PipedriveTap(tap_config(streaming_pages=streaming), {})
+                pipedrive_tap.streams = [stream]
+                output = io.StringIO()
+                with mock.patch('requests.Session.get', side_effect=get), redirect_stdout(output), \
+                        mock.patch('singer.metrics.log') as log:
+                    pipedrive_tap.do_sync(make_catalog(stream))
+
+                records = [message['record']['id'] for message in parse_messages(output.getvalue())
+                           if message['type'] == 'RECORD']
+                self.assertEqual(records, list(range(250)))
+                points = {call.args[1].metric: call.args[1].value for call in log.call_args_list}
+                self.assertGreater(points['http_decoded_bytes'], 5 * points['http_wire_bytes'])